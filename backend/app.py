@@ -3,10 +3,10 @@
 Flask backend for passport processing web service
 """
 
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Request, Response, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
 import base64
-import requests
+import contextlib
 import json
 import io
 import os
@@ -16,15 +16,38 @@ from report_generator import generate_passport_report
 import datetime
 from werkzeug.utils import secure_filename
 import PyPDF2
-from pdf2image import convert_from_bytes
-from PIL import Image
+from pdf2image import convert_from_bytes, convert_from_path
+from PIL import Image, ImageStat
 import re
 from html import escape
 import hashlib
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text
+import tempfile
+import threading
+import time
+import queue
+import shutil
+import zipfile
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, text, column, func, and_, or_
 from sqlalchemy.dialects.sqlite import JSON
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker, declarative_base, deferred
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from job_queue import (
+    JobQueue, JobDeferred, Stage, Batch, QueueFullError, JOB_EXTRACTING, JOB_TRANSLATING, JOB_DONE, ITEM_REJECTED
+)
+from concurrent.futures import Future
+from rate_limiter import RateLimiter, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, PRIORITY_BULK
+from response_cache import ResponseCache, cache_key
+from translation_memory import (
+    TranslationMemory, collect_translatable, diff_translatable, translate_locally, normalize_source, set_path
+)
+from mrz import check_passport_mrz, normalize_date
+from json_stream import SectionStreamParser
+from record_export import RecordExporter, KIND_DATA, KIND_TRANSLATED
+from database import create_sqlite_engine, writer_engine, WriteBatcher
+from llm_client import (
+    OpenRouterClient, RetryPolicy, CircuitBreaker, CircuitOpenError, LLMError, FileDataURL,
+    salvage_json, message_content
+)
 
 # Frontend build path
 FRONTEND_BUILD_PATH = Path(__file__).resolve().parent.parent / 'frontend' / 'build'
@@ -41,10 +64,89 @@ load_dotenv()
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 MODEL = "google/gemini-2.5-flash-preview-09-2025"
 
-DATABASE_URL = "sqlite:///passports.db"
-
-engine = create_engine(DATABASE_URL, future=True)
+# Shared OpenRouter connection pool and per-endpoint read timeouts (seconds)
+OPENROUTER_POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "16"))
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "120"))
+TRANSLATION_TIMEOUT = float(os.getenv("TRANSLATION_TIMEOUT", "60"))
+
+# Retries for 429/5xx/network errors and a breaker that fails fast during outages
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "60"))
+
+# Client-side quota shared by extraction and both translation paths (0 = unlimited)
+OPENROUTER_RPM = int(os.getenv("OPENROUTER_RPM", "0"))
+OPENROUTER_TPM = int(os.getenv("OPENROUTER_TPM", "0"))
+# Gemini bills roughly this many input tokens per PDF page
+PDF_TOKENS_PER_PAGE = 258
+
+# "document" sends the whole PDF in one request; "pages" splits it into the
+# biographical pages and small groups of visa/stamp pages extracted in parallel
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "document").lower()
+EXTRACTION_BIO_PAGES = int(os.getenv("EXTRACTION_BIO_PAGES", "2"))
+EXTRACTION_GROUP_PAGES = int(os.getenv("EXTRACTION_GROUP_PAGES", "2"))
+PAGE_GROUP_MAX_TOKENS = 6000
+
+# Optionally detect blank visa pages on a low-resolution render and leave them
+# out of the request. A page is blank when fewer than PAGE_BLANK_INK_RATIO of
+# its pixels are clearly darker than the paper; the biographical pages are
+# always sent. Off by default: a faint stamp can fall under the threshold at
+# this resolution, so check the ratio against real scans before enabling it.
+PAGE_TRIAGE = os.getenv("PAGE_TRIAGE", "0").lower() in ("1", "true", "yes")
+PAGE_TRIAGE_DPI = 24
+PAGE_BLANK_INK_RATIO = float(os.getenv("PAGE_BLANK_INK_RATIO", "0.002"))
+PAGE_INK_CONTRAST = 48
+
+# Optionally re-render the pages sent to the model as JPEG at a lower
+# resolution; scans are usually much larger than extraction needs
+PDF_COMPACT = os.getenv("PDF_COMPACT", "0").lower() in ("1", "true", "yes")
+PDF_COMPACT_DPI = int(os.getenv("PDF_COMPACT_DPI", "150"))
+PDF_COMPACT_QUALITY = int(os.getenv("PDF_COMPACT_QUALITY", "70"))
+
+# Re-read only the biographical pages when the extracted MRZ fails its check digits
+MRZ_REEXTRACT = os.getenv("MRZ_REEXTRACT", "1").lower() in ("1", "true", "yes")
+
+# Repeated translation requests are answered from disk (LLM_CACHE_MAX_ENTRIES=0 disables)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(Path(__file__).parent / "llm_cache.db"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 86400)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+
+response_cache = ResponseCache(LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+
+# Known field values (countries, authorities, visa types) are translated without the model
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", LLM_CACHE_PATH)
+translation_memory = TranslationMemory(TRANSLATION_MEMORY_PATH)
+
+llm_client = OpenRouterClient(
+    api_key=OPENROUTER_API_KEY,
+    pool_size=OPENROUTER_POOL_SIZE,
+    connect_timeout=OPENROUTER_CONNECT_TIMEOUT,
+    retry_policy=RetryPolicy(LLM_MAX_ATTEMPTS, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX),
+    breaker=CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET),
+    rate_limiter=RateLimiter(OPENROUTER_RPM, OPENROUTER_TPM)
+)
+
+# SQLite in WAL mode: readers run next to the writer, and writers of other
+# processes wait up to DATABASE_BUSY_TIMEOUT seconds for the write lock
+DATABASE_PATH = Path(os.getenv("DATABASE_PATH", str(Path(__file__).parent / "passports.db"))).resolve()
+DATABASE_BUSY_TIMEOUT = float(os.getenv("DATABASE_BUSY_TIMEOUT", "30"))
+DATABASE_MMAP_MB = int(os.getenv("DATABASE_MMAP_MB", "256"))
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "10"))
+DATABASE_WRITE_BATCH = int(os.getenv("DATABASE_WRITE_BATCH", "64"))
+
+engine = create_sqlite_engine(
+    DATABASE_PATH,
+    busy_timeout=DATABASE_BUSY_TIMEOUT,
+    mmap_size=DATABASE_MMAP_MB * 1024 * 1024,
+    pool_size=DATABASE_POOL_SIZE
+)
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, future=True)
+# Writes go through one thread per process that commits them in batches
+WriteSessionLocal = sessionmaker(bind=writer_engine(engine), expire_on_commit=False, future=True)
+write_batcher = WriteBatcher(WriteSessionLocal, max_batch=DATABASE_WRITE_BATCH)
 Base = declarative_base()
 
 
@@ -52,30 +154,80 @@ class PassportRecord(Base):
     __tablename__ = "passport_records"
 
     id = Column(Integer, primary_key=True)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False, index=True)
     filename = Column(String(255))
     full_name = Column(String(255))
-    passport_number = Column(String(64))
-    file_hash = Column(String(64))
+    passport_number = Column(String(64), index=True)
+    # Filter columns copied out of ``data`` (see record_filter_fields)
+    nationality = Column(String(64), index=True)
+    expiry_date = Column(Date, index=True)
+    # One record per uploaded file; NULLs (legacy rows) are not constrained
+    file_hash = Column(String(64), unique=True, index=True)
     data = Column(JSON)
+    # Russian translation of ``data`` used for reports; only loaded on demand
+    translated_data = deferred(Column(JSON))
 
 
 Base.metadata.create_all(engine)
 
 def ensure_schema_updates():
-    """Add file_hash column if missing (simple migration)."""
-    from sqlalchemy import text
-    with engine.connect() as conn:
-        try:
-            conn.execute(text("ALTER TABLE passport_records ADD COLUMN file_hash VARCHAR(64)"))
-            print("Added column 'file_hash' to passport_records")
-        except Exception:
-            # Column likely exists or table not created yet
-            pass
+    """Add columns and indexes missing from older databases (simple migration)."""
+    for name, ddl in (('file_hash', 'VARCHAR(64)'), ('nationality', 'VARCHAR(64)'), ('expiry_date', 'DATE'),
+                      ('translated_data', 'JSON')):
+        with engine.connect() as conn:
+            try:
+                conn.execute(text(f"ALTER TABLE passport_records ADD COLUMN {name} {ddl}"))
+                conn.commit()
+                print(f"Added column '{name}' to passport_records")
+            except Exception:
+                # Column likely exists or table not created yet
+                pass
+
+    with engine.begin() as conn:
+        for name in ('created_at', 'passport_number', 'nationality', 'expiry_date'):
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_passport_records_{name} ON passport_records ({name})"
+            ))
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_passport_records_file_hash ON passport_records (file_hash)"
+            ))
+    except IntegrityError:
+        # Older databases may already hold duplicate uploads; index without the constraint
+        print("⚠️ Duplicate file_hash values found; creating a non-unique index on file_hash")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_passport_records_file_hash ON passport_records (file_hash)"
+            ))
 
 ensure_schema_updates()
 
 
+# Full-text index over names, numbers, filenames and visa/stamp countries;
+# rowid is the record id. Maintained next to every write of a record.
+SEARCH_TABLE = 'passport_search'
+
+
+def ensure_search_index() -> bool:
+    """Create the FTS5 search table; False when SQLite lacks FTS5."""
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                "full_name, passport_number, filename, visa_countries, stamp_countries, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+        return True
+    except SQLAlchemyError as exc:
+        print(f"⚠️ Full-text search unavailable, falling back to LIKE queries: {exc}")
+        return False
+
+
+SEARCH_FTS = ensure_search_index()
+
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 
 STANDARD_PLACEHOLDERS = [
@@ -142,83 +294,238 @@ def build_template_registry():
 
 TEMPLATES = build_template_registry()
 
+# The database is the only store of record data. Optionally a JSON copy of
+# every record is exported in the background for audits and file backups.
 RECORDS_DIR = Path(__file__).parent / "records"
-RECORDS_DIR.mkdir(parents=True, exist_ok=True)
+RECORD_EXPORT = os.getenv("RECORD_EXPORT", "0").lower() in ("1", "true", "yes")
+RECORD_EXPORT_DIR = Path(os.getenv("RECORD_EXPORT_DIR", str(RECORDS_DIR)))
+
+record_exporter = RecordExporter(RECORD_EXPORT_DIR, enabled=RECORD_EXPORT)
+
+
+# Original uploads kept by content hash for on-demand page rendering
+SOURCES_DIR = Path(os.getenv("SOURCES_DIR", str(Path(__file__).parent / "sources"))).resolve()
+SOURCES_DIR.mkdir(parents=True, exist_ok=True)
+
+RENDER_CACHE_DIR = Path(os.getenv("RENDER_CACHE_DIR", str(Path(__file__).parent / "render_cache"))).resolve()
+RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Uploads are copied to disk in chunks of this size while being hashed
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Reject oversized request bodies before they are spooled to disk
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE + 1024 * 1024
+# Batch uploads carry many files (or one ZIP) in a single request
+BATCH_MAX_UPLOAD_SIZE = int(os.getenv("BATCH_MAX_UPLOAD_MB", "2048")) * 1024 * 1024
+
+
+class UploadRequest(Request):
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'create_batch':
+            return BATCH_MAX_UPLOAD_SIZE + 1024 * 1024
+        return super().max_content_length
+
+
+app.request_class = UploadRequest
+
+RENDER_DEFAULT_DPI = 100
+RENDER_MIN_DPI = 36
+RENDER_MAX_DPI = 300
+RENDER_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+    'png': ('PNG', 'image/png', 'png'),
+    'webp': ('WEBP', 'image/webp', 'webp')
+}
 
+_render_locks = {}
+_render_locks_guard = threading.Lock()
 
-def record_json_path(record_id: int) -> Path:
-    return RECORDS_DIR / f"passport_{record_id}.json"
+# Asynchronous processing (POST /api/process?async=1)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "500"))
+JOB_EVENTS_HEARTBEAT = 15
 
+job_queue = JobQueue(workers=JOB_WORKERS, max_depth=JOB_QUEUE_SIZE, name='passport-jobs')
 
-def translated_json_path(record_id: int) -> Path:
-    return RECORDS_DIR / f"passport_{record_id}_translated.json"
+# Pipeline stages: extraction of one upload overlaps translation of the previous.
+# EXTRACTION_RESERVED slots are kept for interactive uploads, so batch and bulk
+# work can never take every extraction slot
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", str(JOB_WORKERS)))
+EXTRACTION_RESERVED = int(os.getenv("EXTRACTION_RESERVED", "1"))
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", "2"))
 
+extraction_stage = Stage('extraction', EXTRACTION_CONCURRENCY, reserved=EXTRACTION_RESERVED)
+translation_stage = Stage('translation', TRANSLATION_WORKERS)
+
+# Batch ingestion (POST /api/batches) gets its own queue so a large import
+# never fills the one interactive uploads use
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(max(1, EXTRACTION_CONCURRENCY - 1))))
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "10000"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "5000"))
+BATCH_HISTORY = 200
+
+batch_queue = JobQueue(workers=BATCH_WORKERS, max_depth=BATCH_QUEUE_SIZE, name='batch-jobs')
+
+# batch_id -> Batch, oldest first; only the last BATCH_HISTORY are kept
+batches = {}
+batches_lock = threading.Lock()
+
+# record_id -> (token, Future, base) of the background translation currently in flight;
+# base is the data the cached translation was made from when only a patch is needed
+pending_translations = {}
+pending_translations_lock = threading.Lock()
+
+# file_hash -> Future of the extraction currently running for that file, so
+# concurrent uploads of one file share a single model call
+inflight_extractions = {}
+inflight_extractions_lock = threading.Lock()
+
+# file_hash -> id of the job last queued for that file, oldest first; finished
+# jobs are dropped from the old end as new uploads arrive
+upload_jobs = {}
+upload_jobs_lock = threading.Lock()
+
+
+def export_record(record_id: int, passport_data: dict):
+    """Queue the JSON export of a record's data (no-op unless RECORD_EXPORT)."""
+    if record_exporter.enabled:
+        record_exporter.write(record_id, dict(passport_data, record_id=record_id), KIND_DATA)
+
+
+def save_translated_data(record_id: int, translated_data: dict | None):
+    """Store (or with None, clear) the cached translation of a record."""
+    def update(session):
+        session.query(PassportRecord).filter(PassportRecord.id == record_id) \
+            .update({PassportRecord.translated_data: translated_data}, synchronize_session=False)
 
-def save_passport_json(record_id: int, passport_data: dict):
-    """Persist full recognized data to JSON file for audit/editing."""
     try:
-        snapshot = json.loads(json.dumps(passport_data, ensure_ascii=False))
-        snapshot['record_id'] = record_id
-        with record_json_path(record_id).open('w', encoding='utf-8') as handle:
-            json.dump(snapshot, handle, ensure_ascii=False, indent=2)
-        print(f"Passport JSON saved to {record_json_path(record_id)}")
-    except Exception as exc:
-        print(f"Failed to save passport JSON backup: {exc}")
+        write_batcher.run(update)
+    except SQLAlchemyError as exc:
+        print(f"Failed to save translation for record {record_id}: {exc}")
+        return
+    record_exporter.write(record_id, translated_data, KIND_TRANSLATED)
 
 
-def save_translated_json(record_id: int, passport_data: dict):
-    """Persist translated data to JSON file."""
+def load_translated_data(record_id: int) -> dict | None:
+    session = SessionLocal()
     try:
-        snapshot = json.loads(json.dumps(passport_data, ensure_ascii=False))
-        with translated_json_path(record_id).open('w', encoding='utf-8') as handle:
-            json.dump(snapshot, handle, ensure_ascii=False, indent=2)
-        print(f"Translated JSON saved to {translated_json_path(record_id)}")
-    except Exception as exc:
-        print(f"Failed to save translated JSON: {exc}")
+        return session.query(PassportRecord.translated_data).filter(PassportRecord.id == record_id).scalar()
+    finally:
+        session.close()
 
 
-def load_passport_json(record_id: int):
-    path = record_json_path(record_id)
-    if not path.exists():
-        return None
+def has_translated_data(record_id: int) -> bool:
+    session = SessionLocal()
     try:
-        with path.open('r', encoding='utf-8') as handle:
-            return json.load(handle)
-    except Exception as exc:
-        print(f"Failed to load passport JSON backup: {exc}")
-        return None
+        return session.query(PassportRecord.id).filter(
+            PassportRecord.id == record_id, PassportRecord.translated_data.isnot(None)
+        ).first() is not None
+    finally:
+        session.close()
+
 
+def source_pdf_path(file_hash: str) -> Path:
+    return SOURCES_DIR / f"{file_hash}.pdf"
 
-def load_translated_json(record_id: int):
-    path = translated_json_path(record_id)
+
+def store_source_pdf(file_hash: str, pdf_bytes: bytes) -> Path:
+    """Keep the original upload so pages can be rendered later."""
+    path = source_pdf_path(file_hash)
     if not path.exists():
-        return None
+        write_file_atomic(path, pdf_bytes)
+    return path
+
+
+class UploadRejected(Exception):
+    """Raised when an uploaded file is too large or not a PDF."""
+
+
+def spool_upload(stream, max_size: int = MAX_UPLOAD_SIZE) -> tuple:
+    """Copy an upload into the sources directory, hashing it on the way.
+
+    Only one chunk is held in memory at a time. Returns ``(file_hash, path)``
+    of the stored PDF; raises ``UploadRejected`` as soon as the stream turns
+    out to be too large or does not start like a PDF.
+    """
+    SOURCES_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    handle = tempfile.NamedTemporaryFile(dir=SOURCES_DIR, prefix='.upload-', suffix='.tmp', delete=False)
     try:
-        with path.open('r', encoding='utf-8') as handle:
-            return json.load(handle)
-    except Exception as exc:
-        print(f"Failed to load translated JSON: {exc}")
-        return None
+        with handle:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not chunk.startswith(b'%PDF'):
+                    raise UploadRejected('Invalid PDF file content')
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadRejected(f'File too large. Maximum size is {max_size // (1024 * 1024)}MB')
+                digest.update(chunk)
+                handle.write(chunk)
+        if size == 0:
+            raise UploadRejected('Invalid PDF file content')
+
+        file_hash = digest.hexdigest()
+        path = source_pdf_path(file_hash)
+        if path.exists():
+            os.unlink(handle.name)
+        else:
+            os.replace(handle.name, path)
+        return file_hash, path
+    except BaseException:
+        Path(handle.name).unlink(missing_ok=True)
+        raise
+
 
+def render_cache_path(file_hash: str, page_number: int, dpi: int, fmt: str) -> Path:
+    extension = RENDER_FORMATS[fmt][2]
+    return RENDER_CACHE_DIR / file_hash / f"p{page_number}_{dpi}.{extension}"
 
-def delete_passport_json(record_id: int):
-    path = record_json_path(record_id)
+
+def render_etag(file_hash: str, page_number: int, dpi: int, fmt: str) -> str:
+    return f"{file_hash}-p{page_number}-{dpi}-{fmt}"
+
+
+def write_file_atomic(path: Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as handle:
+        handle.write(content)
+    os.replace(handle.name, path)
+
+
+def get_rendered_page(file_hash: str, page_number: int, dpi: int, fmt: str) -> Path:
+    """Return the cached render for a page, rendering it at most once."""
+    path = render_cache_path(file_hash, page_number, dpi, fmt)
     if path.exists():
-        try:
-            path.unlink()
-            print(f"Passport JSON removed: {path}")
-        except Exception as exc:
-            print(f"Failed to delete passport JSON: {exc}")
-            
-    path_trans = translated_json_path(record_id)
-    if path_trans.exists():
-        try:
-            path_trans.unlink()
-            print(f"Translated JSON removed: {path_trans}")
-        except Exception:
-            pass
+        return path
+
+    key = render_etag(file_hash, page_number, dpi, fmt)
+    with _render_locks_guard:
+        lock = _render_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            if not path.exists():
+                image = render_pdf_page(source_pdf_path(file_hash), page_number, dpi=dpi, fmt=RENDER_FORMATS[fmt][0])
+                write_file_atomic(path, image)
+    finally:
+        with _render_locks_guard:
+            _render_locks.pop(key, None)
+    return path
 
 
+def delete_source_files(file_hash: str):
+    """Remove the stored upload and its rendered pages."""
+    if not file_hash:
+        return
+    try:
+        source_pdf_path(file_hash).unlink(missing_ok=True)
+        shutil.rmtree(RENDER_CACHE_DIR / file_hash, ignore_errors=True)
+    except Exception as exc:
+        print(f"Failed to delete source files: {exc}")
+
 
 def normalize_value(value):
     """Convert nested dicts/lists into flat string representations."""
@@ -287,6 +594,13 @@ def validate_passport_data(passport_data: dict) -> list:
         if clean_gender in ('M', 'F', 'М', 'Ж'):
             warnings.append(f"Gender field contains extra characters: '{gender}' -> suggested: '{clean_gender}'")
     
+    # Check the MRZ check digits and compare it with the printed fields
+    mrz_check = check_passport_mrz(passport_data)
+    for error in mrz_check['errors']:
+        warnings.append(f"MRZ: {error}")
+    for mismatch in mrz_check['mismatches']:
+        warnings.append(f"MRZ does not match biographical page: {mismatch}")
+    
     # Check visas for date logic
     for i, visa in enumerate(passport_data.get('visas', [])):
         issue = visa.get('issue_date', '')
@@ -337,51 +651,8 @@ def translate_payload_for_template(payload: dict):
     if not payload:
         return payload
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost",
-        "X-Title": "Passport Template Translator"
-    }
-
-    json_text = json.dumps(payload, ensure_ascii=False)
-    messages = [
-        {
-            "role": "system",
-            "content": "You translate JSON values to Russian while keeping the same structure and keys."
-        },
-        {
-            "role": "user",
-            "content": (
-                "Translate all values in the following JSON to Russian. "
-                "Keep the same keys and return only JSON without comments or code fences:\n"
-                f"{json_text}"
-            )
-        }
-    ]
-
-    payload_request = {
-        "model": MODEL,
-        "messages": messages,
-        "temperature": 0,
-        "max_tokens": 2000
-    }
-
     try:
-        response = requests.post(url, headers=headers, json=payload_request, timeout=60)
-        response.raise_for_status()
-        content = response.json()['choices'][0]['message']['content']
-        if '```json' in content:
-            start = content.find('```json') + 7
-            end = content.find('```', start)
-            content = content[start:end].strip()
-        elif '```' in content:
-            start = content.find('```') + 3
-            end = content.find('```', start)
-            content = content[start:end].strip()
-        translated = json.loads(content)
-        return translated
+        return translate_values(payload)
     except Exception as exc:
         print(f"Translation failed, using original payload: {exc}")
         return payload
@@ -410,26 +681,117 @@ def render_template(template_id: str, data: dict):
     return filled
 
 
-def save_passport_record(filename: str, passport_data: dict, file_hash: str = None) -> PassportRecord:
+def parse_record_date(value) -> datetime.date | None:
+    """Date of a printed DD.MM.YYYY / YYYY-MM-DD value, or None."""
+    normalized = normalize_date(value)
+    if not normalized:
+        return None
+    try:
+        return datetime.datetime.strptime(normalized, '%d.%m.%Y').date()
+    except ValueError:
+        return None
+
+
+def section_countries(passport_data: dict, sections: tuple) -> str:
+    countries = []
+    for section in sections:
+        for item in passport_data.get(section) or []:
+            country = item.get('country') if isinstance(item, dict) else None
+            if isinstance(country, str) and country.strip() and country.strip() not in countries:
+                countries.append(country.strip())
+    return ' / '.join(countries)
+
+
+def apply_record_fields(record: PassportRecord, passport_data: dict):
+    """Copy the listed and filterable fields of ``passport_data`` onto its row."""
+    bio = passport_data.get('biographical_page') or {}
+    nationality = bio.get('nationality')
+    record.full_name = bio.get('full_name')
+    record.passport_number = bio.get('passport_number')
+    record.nationality = (nationality.strip().upper() or None) if isinstance(nationality, str) else None
+    record.expiry_date = parse_record_date(bio.get('expiry_date'))
+
+
+def index_record(session, record: PassportRecord):
+    """Refresh the search entry of a flushed record inside the caller's transaction."""
+    if not SEARCH_FTS:
+        return
+    data = record.data or {}
+    session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {'id': record.id})
+    session.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, full_name, passport_number, filename, visa_countries, stamp_countries) "
+        "VALUES (:id, :full_name, :passport_number, :filename, :visa_countries, :stamp_countries)"
+    ), {
+        'id': record.id,
+        'full_name': record.full_name or '',
+        'passport_number': record.passport_number or '',
+        'filename': record.filename or '',
+        'visa_countries': section_countries(data, ('visas',)),
+        'stamp_countries': section_countries(data, ('stamps', 'registration_stamps'))
+    })
+
+
+class CachedCount:
+    """Row count kept in memory and adjusted on insert and delete.
+
+    Writes from other processes are picked up by a recount once the value
+    is older than ``ttl`` seconds, so the total is exact for this process
+    and at most ``ttl`` seconds stale otherwise.
+    """
+
+    def __init__(self, count_rows, ttl: float = 60):
+        self.count_rows = count_rows
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._counted_at = 0.0
+
+    def get(self) -> int:
+        with self._lock:
+            if self._value is None or time.monotonic() - self._counted_at > self.ttl:
+                self._value = self.count_rows()
+                self._counted_at = time.monotonic()
+            return self._value
+
+    def add(self, delta: int):
+        with self._lock:
+            if self._value is not None:
+                self._value = max(0, self._value + delta)
+
+
+def count_passport_records() -> int:
     session = SessionLocal()
     try:
+        return session.query(func.count(PassportRecord.id)).scalar()
+    finally:
+        session.close()
+
+
+RECORD_COUNT_TTL = float(os.getenv("RECORD_COUNT_TTL", "60"))
+record_count = CachedCount(count_passport_records, ttl=RECORD_COUNT_TTL)
+
+
+def save_passport_record(filename: str, passport_data: dict, file_hash: str = None) -> PassportRecord:
+    def insert(session):
         record = PassportRecord(
             filename=filename,
-            full_name=passport_data.get('biographical_page', {}).get('full_name'),
-            passport_number=passport_data.get('biographical_page', {}).get('passport_number'),
             file_hash=file_hash,
             data=passport_data
         )
+        apply_record_fields(record, passport_data)
         session.add(record)
-        session.commit()
+        session.flush()
+        index_record(session, record)
         session.refresh(record)
         return record
+
+    try:
+        record = write_batcher.run(insert)
     except SQLAlchemyError as exc:
-        session.rollback()
         print(f"Failed to save record: {exc}")
         raise
-    finally:
-        session.close()
+    record_count.add(1)
+    return record
 
 
 def get_record_by_hash(file_hash: str) -> PassportRecord | None:
@@ -440,21 +802,113 @@ def get_record_by_hash(file_hash: str) -> PassportRecord | None:
         session.close()
 
 
-def list_passport_records(page: int = 1, limit: int = 50):
+def record_passport_data(record: PassportRecord) -> dict:
+    """Stored passport data of a record, with ``record_id`` added."""
+    passport_data = dict(record.data) if record.data else {}
+    passport_data['record_id'] = record.id
+    return passport_data
+
+
+def search_terms(value: str) -> list:
+    return re.findall(r'\w+', value or '')
+
+
+def filter_passport_query(query, q: str = None, nationality: str = None,
+                          expires_before: datetime.date = None, has_visa_country: str = None):
+    """Apply the /api/passports search filters to a PassportRecord query.
+
+    ``q`` matches word prefixes of name, passport number, filename and
+    visa/stamp countries; ``has_visa_country`` matches a country of any visa.
+    """
+    terms = search_terms(q)
+    country_terms = search_terms(has_visa_country)
+    if SEARCH_FTS and (terms or country_terms):
+        clauses = [' '.join(f'"{term}"*' for term in terms)] if terms else []
+        if country_terms:
+            clauses.append('visa_countries : "' + ' '.join(country_terms) + '"')
+        matches = text(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match") \
+            .bindparams(match=' AND '.join(clauses)).columns(column('rowid', Integer))
+        query = query.filter(PassportRecord.id.in_(matches))
+    elif terms or country_terms:
+        for term in terms:
+            pattern = f"%{term}%"
+            query = query.filter(
+                PassportRecord.full_name.ilike(pattern) | PassportRecord.passport_number.ilike(pattern)
+                | PassportRecord.filename.ilike(pattern)
+            )
+        if country_terms:
+            query = query.filter(PassportRecord.data.cast(Text).ilike(f"%{' '.join(country_terms)}%"))
+    if nationality:
+        query = query.filter(PassportRecord.nationality == nationality.strip().upper())
+    if expires_before:
+        query = query.filter(PassportRecord.expiry_date < expires_before)
+    return query
+
+
+def encode_cursor(record) -> str:
+    """Opaque position after ``record`` in the (created_at, id) listing order."""
+    raw = json.dumps([record.created_at.isoformat(), record.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Return ``(created_at, id)`` of a cursor; raises ValueError when malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, record_id = json.loads(raw)
+        return datetime.datetime.fromisoformat(created_at), int(record_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError(f'Invalid cursor: {cursor}') from exc
+
+
+# Columns the listing returns; the JSON ``data`` blob is never loaded for it
+LIST_COLUMNS = (
+    PassportRecord.id, PassportRecord.created_at, PassportRecord.filename,
+    PassportRecord.full_name, PassportRecord.passport_number
+)
+
+
+# Largest page /api/passports returns
+MAX_PAGE_SIZE = 100
+
+
+def list_passport_records(page: int = 1, limit: int = 50, cursor: str = None, **filters):
+    """One page of record summaries (rows of ``LIST_COLUMNS``), newest first.
+
+    With ``cursor`` (the ``next_cursor`` of the previous page) the page is
+    found by seeking the created_at index (whose entries end in the rowid,
+    i.e. ``id``), so its cost does not grow with depth; ``page`` alone still
+    works through OFFSET. The unfiltered total comes from ``record_count``
+    instead of a COUNT per request. ``limit`` is clamped to 1..MAX_PAGE_SIZE
+    and ``page`` to at least 1.
+    """
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    page = max(page, 1)
     session = SessionLocal()
     try:
-        offset = (page - 1) * limit
-        query = session.query(PassportRecord).order_by(PassportRecord.created_at.desc())
-        
-        total = query.count()
-        records = query.offset(offset).limit(limit).all()
-        
+        query = filter_passport_query(session.query(*LIST_COLUMNS), **filters)
+        total = query.count() if any(filters.values()) else record_count.get()
+
+        query = query.order_by(PassportRecord.created_at.desc(), PassportRecord.id.desc())
+        if cursor:
+            created_at, record_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                PassportRecord.created_at < created_at,
+                and_(PassportRecord.created_at == created_at, PassportRecord.id < record_id)
+            ))
+        else:
+            query = query.offset((page - 1) * limit)
+        records = query.limit(limit + 1).all()
+        has_more = len(records) > limit
+        records = records[:limit]
+
         return {
             'items': records,
             'total': total,
             'page': page,
             'limit': limit,
-            'pages': (total + limit - 1) // limit
+            'pages': (total + limit - 1) // limit,
+            'next_cursor': encode_cursor(records[-1]) if has_more else None
         }
     finally:
         session.close()
@@ -469,20 +923,49 @@ def get_passport_record(record_id: int) -> PassportRecord | None:
 
 
 def delete_passport_record(record_id: int) -> bool:
-    session = SessionLocal()
-    try:
+    def delete(session):
         record = session.get(PassportRecord, record_id)
         if not record:
             return False
         session.delete(record)
-        session.commit()
+        if SEARCH_FTS:
+            session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {'id': record_id})
         return True
+
+    try:
+        deleted = write_batcher.run(delete)
     except SQLAlchemyError as exc:
-        session.rollback()
         print(f"Failed to delete record: {exc}")
         raise
-    finally:
-        session.close()
+    if deleted:
+        record_count.add(-1)
+    return deleted
+
+def backfill_search_index(batch_size: int = 500):
+    """Index records written before the search table and filter columns existed."""
+    if not SEARCH_FTS:
+        return
+    indexed = 0
+    while True:
+        session = WriteSessionLocal()
+        try:
+            records = session.query(PassportRecord).filter(
+                PassportRecord.id.notin_(text(f"SELECT rowid FROM {SEARCH_TABLE}").columns(column('rowid', Integer)))
+            ).limit(batch_size).all()
+            for record in records:
+                apply_record_fields(record, record.data or {})
+                index_record(session, record)
+            session.commit()
+        finally:
+            session.close()
+        indexed += len(records)
+        if len(records) < batch_size:
+            break
+    if indexed:
+        print(f"🔎 Indexed {indexed} existing records for search")
+
+
+backfill_search_index()
 
 PROMPT = """Analyze this passport document and extract ALL information in structured JSON format.
 CRITICAL: Pay special attention to VISA stickers, RESIDENCE PERMITS, REGISTRATION STAMPS, and BORDER STAMPS.
@@ -569,65 +1052,151 @@ Structure:
 }
 """
 
-TRANSLATION_PROMPT = """You are a sworn translator preparing a FULL notarized Russian translation of every passport page.
-Identify the original language of each value (passports may mix Azerbaijani, English, Arabic, Turkish, Georgian, Uzbek, etc.) and translate all content to Russian, preserving the full structure.
+# Prompt for visa/stamp page groups: sections 3-5 of PROMPT with page numbers
+# relative to the attached excerpt (they are shifted back when merging)
+PAGE_GROUP_PROMPT = (
+    "These are inner pages of a passport. Extract ONLY visas, registration stamps and border stamps "
+    "in structured JSON format and ignore any biographical data.\n"
+    "page_number is the page within THIS file, counting from 1.\n\n"
+    + PROMPT[PROMPT.index('3. VISAS'):PROMPT.index('IMPORTANT:')]
+    + """IMPORTANT:
+- All fields must be strings or numbers (not nested objects or arrays)
+- Return empty arrays when a section has no entries
+- Return ONLY valid JSON without markdown code blocks
+
+Structure:
+{
+  "visas": [...],
+  "registration_stamps": [...],
+  "stamps": [...]
+}
+"""
+)
+
+# Prompt for a second look at the biographical pages when the MRZ is invalid;
+# {errors} is filled in with what the validation found
+BIO_PAGE_PROMPT = (
+    PROMPT[:PROMPT.index('3. VISAS')]
+    + """The machine readable zone read previously failed validation ({errors}). Read each MRZ line
+character by character: TD3 lines are exactly 44 characters of A-Z, 0-9 and '<'.
+Do not confuse 0/O, 1/I, 2/Z, 5/S or 8/B.
+
+IMPORTANT:
+- All fields must be strings or numbers (not nested objects or arrays)
+- Return ONLY valid JSON without markdown code blocks
+
+Structure:
+{
+  "biographical_page": {...},
+  "mrz": {...}
+}
+"""
+)
+
+# Follow-up request when a response was cut off at max_tokens
+CONTINUATION_PROMPT = """Your previous answer was cut off at the output limit. Received so far: {received}.
+Return ONLY the missing part as a JSON object with the same structure, containing {missing}.
+Do not repeat entries that were already received. Return ONLY valid JSON without markdown code blocks."""
+MAX_CONTINUATIONS = 2
+
+EXTRACTION_SECTIONS = ('biographical_page', 'mrz', 'visas', 'registration_stamps', 'stamps')
+
+# Sections whose entries carry a page_number and are merged across page groups
+PAGE_SECTIONS = ('visas', 'registration_stamps', 'stamps')
+
+TRANSLATION_PROMPT = """You are a sworn translator preparing a notarized Russian translation of passport pages.
+You receive a JSON object that maps ids to individual field values taken from one or more passports.
+Identify the original language of each value (passports may mix Azerbaijani, English, Arabic, Turkish, Georgian, Uzbek, etc.) and translate it to Russian.
 
 Rules:
 1. Translate or transliterate EVERY value to Russian Cyrillic. If source already Cyrillic, keep as is.
 2. Personal names and places from Latin script MUST be transliterated (JOHN SMITH -> ДЖОН СМИТ).
-3. Preserve page annotations: if input contains markers like "[Page 4: Visa]" or "[Стр. 10]", keep them (translated) to reflect original order. Do not skip repeated sections.
-4. MRZ lines remain untouched.
-5. Dates -> DD.MM.YYYY (e.g., 2024/11/14 -> 14.11.2024).
-6. Arrays such as visas/stamps must include every element from source JSON; nothing may be dropped.
-7. Keep JSON keys unchanged and return ONLY valid JSON (no markdown fences or commentary).
-
-Before returning, double-check that counts of visas and stamps match the input arrays and that no page descriptions were omitted.
+3. Preserve page annotations: markers like "[Page 4: Visa]" are kept (translated).
+4. Dates -> DD.MM.YYYY (e.g., 14 NOV 2024 -> 14.11.2024).
+5. Translate each value on its own; do not merge, split or drop ids.
+6. Return ONLY a valid JSON object with exactly the same ids (no markdown fences or commentary).
 """
 
+# Unseen values are sent to the model in batches of at most this many characters
+TRANSLATION_BATCH_CHARS = 8000
+
 # Extracted photo helper functions removed
 
 
 
-def extract_pages_from_pdf(pdf_bytes):
-    """Extract all pages from passport PDF"""
-    try:
-        # Convert all pages to images
-        images = convert_from_bytes(pdf_bytes, dpi=150)
-        
-        if not images:
+def extract_pages_from_pdf(pdf):
+    """Read page count and page sizes from the PDF structure without rendering.
+
+    ``pdf`` is the file content or a path to it. Sizes are in PDF points with
+    the page rotation already applied. Page images are rendered on demand by
+    ``render_pdf_page``.
+    """
+    if isinstance(pdf, (str, Path)):
+        # Let PyPDF2 read from the file instead of loading it whole
+        try:
+            with open(pdf, 'rb') as handle:
+                return read_page_metadata(handle)
+        except OSError as e:
+            print(f"Error extracting pages: {e}")
             return []
-        
+    return read_page_metadata(io.BytesIO(pdf))
+
+
+def read_page_metadata(stream):
+    try:
+        reader = PyPDF2.PdfReader(stream)
+        if reader.is_encrypted:
+            reader.decrypt('')
+
         pages = []
-        for i, page_image in enumerate(images):
-            # Convert to JPEG for web display
-            img_byte_arr = io.BytesIO()
-            page_image.save(img_byte_arr, format='JPEG', quality=80)
-            img_byte_arr.seek(0)
-            
-            # Store image data for display
+        for i, page in enumerate(reader.pages):
+            box = page.mediabox
+            width, height = float(box.width), float(box.height)
+            rotation = int(page.get('/Rotate', 0) or 0) % 360
+            if rotation in (90, 270):
+                width, height = height, width
+
             pages.append({
                 'page_number': i + 1,
-                'image': base64.b64encode(img_byte_arr.read()).decode('utf-8')
+                'width': round(width, 2),
+                'height': round(height, 2),
+                'rotation': rotation
             })
-        
+
         return pages
     except Exception as e:
         print(f"Error extracting pages: {e}")
         return []
 
 
-def call_gemini_via_openrouter(pdf_base64, prompt):
-    """Call Gemini model via OpenRouter API with PDF"""
-    
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost",
-        "X-Title": "Passport Web Service"
-    }
-    
+def render_pdf_page(pdf, page_number: int, dpi: int = 150, fmt: str = 'JPEG', quality: int = 80) -> bytes:
+    """Rasterize a single PDF page (content or path) and return the encoded image bytes."""
+    if isinstance(pdf, (str, Path)):
+        images = convert_from_path(str(pdf), dpi=dpi, first_page=page_number, last_page=page_number)
+    else:
+        images = convert_from_bytes(pdf, dpi=dpi, first_page=page_number, last_page=page_number)
+    if not images:
+        raise ValueError(f"Page {page_number} not found")
+
+    img_byte_arr = io.BytesIO()
+    page_image = images[0]
+    if fmt == 'JPEG' and page_image.mode not in ('RGB', 'L'):
+        page_image = page_image.convert('RGB')
+    page_image.save(img_byte_arr, format=fmt, quality=quality)
+    return img_byte_arr.getvalue()
+
+
+def build_extraction_payload(pdf_base64, prompt, max_tokens: int = 16000, history: list = None) -> dict:
+    """Chat completion payload that attaches a PDF to the extraction prompt.
+
+    ``pdf_base64`` is the encoded PDF, or a ``Path`` to the PDF on disk,
+    which is then encoded in chunks while the request body is sent.
+    ``history`` holds follow-up messages of the same conversation.
+    """
+    if isinstance(pdf_base64, Path):
+        file_data = FileDataURL(pdf_base64)
+    else:
+        file_data = f"data:application/pdf;base64,{pdf_base64}"
     payload = {
         "model": MODEL,
         "messages": [
@@ -642,14 +1211,14 @@ def call_gemini_via_openrouter(pdf_base64, prompt):
                         "type": "file",
                         "file": {
                             "filename": "passport.pdf",
-                            "file_data": f"data:application/pdf;base64,{pdf_base64}"
+                            "file_data": file_data
                         }
                     }
                 ]
             }
-        ],
+        ] + list(history or []),
         "temperature": 0,
-        "max_tokens": 16000,
+        "max_tokens": max_tokens,
         "plugins": [
             {
                 "id": "file-parser",
@@ -659,228 +1228,1274 @@ def call_gemini_via_openrouter(pdf_base64, prompt):
             }
         ]
     }
-    
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=120)
-    except requests.exceptions.Timeout:
-        raise Exception("API request timed out after 120 seconds")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"API request failed: {e}")
-    
-    if response.status_code != 200:
-        raise Exception(f"API request failed: {response.status_code} - {response.text}")
-    
-    return response.json()
+    return payload
 
 
-def translate_passport_data(data: dict) -> dict:
-    """Translate full passport data structure to Russian using LLM"""
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost",
-        "X-Title": "Passport Translator"
-    }
+def estimate_extraction_tokens(prompt: str, page_count: int, max_tokens: int) -> int | None:
+    if not page_count:
+        return None
+    return page_count * PDF_TOKENS_PER_PAGE + len(prompt) // 4 + max_tokens
+
 
+def call_gemini_via_openrouter(pdf_base64, prompt, priority: int = PRIORITY_INTERACTIVE, page_count: int = None,
+                               max_tokens: int = 16000, history: list = None):
+    """Call Gemini model via OpenRouter API with PDF"""
+    payload = build_extraction_payload(pdf_base64, prompt, max_tokens, history)
+    return llm_client.complete(
+        payload, title="Passport Web Service", read_timeout=EXTRACTION_TIMEOUT,
+        priority=priority, estimated_tokens=estimate_extraction_tokens(prompt, page_count, max_tokens)
+    )
+
+
+def stream_gemini_via_openrouter(pdf_base64, prompt, priority: int = PRIORITY_INTERACTIVE, page_count: int = None,
+                                 max_tokens: int = 16000):
+    """Like ``call_gemini_via_openrouter`` but yield the response text as it is generated."""
+    payload = build_extraction_payload(pdf_base64, prompt, max_tokens)
+    return llm_client.stream(
+        payload, title="Passport Web Service", read_timeout=EXTRACTION_TIMEOUT,
+        priority=priority, estimated_tokens=estimate_extraction_tokens(prompt, page_count, max_tokens)
+    )
+
+
+def translate_strings(values: list, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """Translate distinct strings in one model call; returns ``{value: translation}``."""
+    batch = {str(index): value for index, value in enumerate(values)}
+    key = cache_key(MODEL, TRANSLATION_PROMPT, batch)
+    translated = response_cache.get(key)
+    missing = []
+    if translated is None:
+        messages = [
+            {
+                "role": "system",
+                "content": TRANSLATION_PROMPT
+            },
+            {
+                "role": "user",
+                "content": json.dumps(batch, ensure_ascii=False)
+            }
+        ]
+        total_chars = sum(len(value) for value in values)
+        content = llm_client.chat(
+            messages, title="Passport Translator", read_timeout=TRANSLATION_TIMEOUT,
+            model=MODEL, max_tokens=min(16000, max(1000, total_chars)), priority=priority
+        )
+        try:
+            translated, complete, _ = salvage_json(content)
+        except json.JSONDecodeError:
+            raise LLMError('Translation response is not valid JSON')
+        if not isinstance(translated, dict):
+            raise LLMError('Translation response is not a JSON object')
+        if complete:
+            response_cache.put(key, translated)
+        else:
+            # Keep the values received before the cut and translate only the rest
+            missing = [value for index, value in batch.items() if index not in translated]
+            if len(missing) == len(values):
+                raise LLMError('Translation response was cut off before the first value')
+            print(f"✂️ Translation truncated; requesting {len(missing)} missing values")
+
+    result = {
+        batch[index]: text
+        for index, text in translated.items()
+        if index in batch and isinstance(text, str) and text.strip()
+    }
+    if missing:
+        result.update(translate_strings(missing, priority))
+    return result
+
+
+def resolve_translations(values, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """Map each source string to its Russian rendering.
+
+    Values are resolved locally (dates, codes, Cyrillic text), then from the
+    translation memory; only strings never seen before go to the model, and
+    its answers are added to the memory.
+    """
+    resolved = {}
+    pending = []
+    for value in dict.fromkeys(values):
+        local = translate_locally(value)
+        if local is not None:
+            resolved[value] = local
+        else:
+            pending.append(value)
+
+    known = translation_memory.lookup_many(pending)
+    resolved.update(known)
+
+    # Spelling variants of one value ("ITALY", "Italy") are sent once
+    variants = {}
+    for value in pending:
+        if value not in known:
+            variants.setdefault(normalize_source(value), []).append(value)
+    unseen = [group[0] for group in variants.values()]
+
+    batch, batch_chars = [], 0
+    for value in unseen + [None]:
+        if batch and (value is None or batch_chars + len(value) > TRANSLATION_BATCH_CHARS):
+            translated = translate_strings(batch, priority)
+            translation_memory.store_many(translated)
+            for source, target in translated.items():
+                for variant in variants[normalize_source(source)]:
+                    resolved[variant] = target
+            batch, batch_chars = [], 0
+        if value is not None:
+            batch.append(value)
+            batch_chars += len(value)
+
+    if unseen:
+        print(f"Translated {len(unseen)} new values, {len(known)} from memory")
+    return resolved
+
+
+def translate_values(data, priority: int = PRIORITY_INTERACTIVE):
+    """Translate every string leaf of ``data`` to Russian."""
+    result = json.loads(json.dumps(data, ensure_ascii=False))
+    leaves = list(collect_translatable(result))
+    resolved = resolve_translations([value for _, value in leaves], priority)
+    for path, value in leaves:
+        set_path(result, path, resolved.get(value, value))
+    return result
+
+
+def patch_translation(previous: dict, current: dict, translated: dict, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """Update ``translated`` (the translation of ``previous``) to match ``current``.
+
+    Only fields and list elements that differ from ``previous`` are
+    translated; everything else is carried over from ``translated``.
+    """
+    result = json.loads(json.dumps(current, ensure_ascii=False))
+    result.pop('pages', None)
+    reused, changed = diff_translatable(result, comparable_passport_data(previous), translated)
+    for path, value in reused:
+        set_path(result, path, value)
+    if changed:
+        resolved = resolve_translations([value for _, value in changed], priority)
+        for path, value in changed:
+            set_path(result, path, resolved.get(value, value))
+    print(f"Re-translated {len(changed)} changed fields, reused {len(reused)}")
+    return result
+
+
+def translate_passport_data(data: dict, fallback: bool = True, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """Translate full passport data structure to Russian using LLM.
+
+    On failure the original data is returned, or the error is re-raised
+    when ``fallback`` is False.
+    """
     # Prepare lightweight payload (remove large fields if any)
     clean_data = json.loads(json.dumps(data))
     if 'pages' in clean_data:
         del clean_data['pages']
-    
-    messages = [
-        {
-            "role": "system",
-            "content": TRANSLATION_PROMPT
-        },
-        {
-            "role": "user",
-            "content": json.dumps(clean_data, ensure_ascii=False)
-        }
-    ]
-
-    payload = {
-        "model": MODEL,
-        "messages": messages,
-        "temperature": 0,
-        "max_tokens": 4000
-    }
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
-        content = response.json()['choices'][0]['message']['content']
-        
-        if '```json' in content:
-            start = content.find('```json') + 7
-            end = content.find('```', start)
-            content = content[start:end].strip()
-        elif '```' in content:
-            start = content.find('```') + 3
-            end = content.find('```', start)
-            content = content[start:end].strip()
-            
-        return json.loads(content)
+        return translate_values(clean_data, priority)
     except Exception as e:
         print(f"Translation failed: {e}")
+        if not fallback:
+            raise
         return data  # Fallback to original
 
 
+class PassportProcessingError(Exception):
+    """Raised when the model response cannot be turned into passport data."""
+
+    def __init__(self, message, raw_response=None):
+        super().__init__(message)
+        self.raw_response = raw_response
+
+
+def parse_extraction_response(result: dict) -> tuple:
+    """Decode the passport JSON from a model response.
+
+    Returns ``(data, complete, open_key, content)``; a truncated response
+    keeps its fully received fields and entries (see ``salvage_json``).
+    """
+    try:
+        content = message_content(result)
+    except LLMError as exc:
+        raise PassportProcessingError(str(exc))
+    return parse_extraction_content(content)
+
+
+def parse_extraction_content(content: str) -> tuple:
+    # Parse JSON from response (code fences and surrounding text are ignored)
+    try:
+        data, complete, open_key = salvage_json(content)
+    except json.JSONDecodeError:
+        raise PassportProcessingError('Failed to parse response', raw_response=content)
+    return data, complete, open_key, content
+
+
+def describe_received(data: dict) -> str:
+    parts = []
+    for key, value in data.items():
+        if isinstance(value, list):
+            pages = [entry.get('page_number') for entry in value if isinstance(entry, dict) and entry.get('page_number')]
+            parts.append(f"{len(value)} {key}" + (f" (last on page {pages[-1]})" if pages else ''))
+        else:
+            parts.append(key)
+    return ', '.join(parts) or 'nothing'
+
+
+def merge_continuation(data: dict, more: dict):
+    """Add the entries of a continuation response to partially received data."""
+    for key, value in more.items():
+        current = data.get(key)
+        if isinstance(current, list) and isinstance(value, list):
+            # Models sometimes repeat the last entry they had sent
+            current.extend(entry for entry in value if entry not in current)
+        elif isinstance(current, dict) and isinstance(value, dict):
+            current.update({field: text for field, text in value.items() if text and not current.get(field)})
+        elif not current:
+            data[key] = value
+
+
+def request_extraction(pdf_path, prompt: str, priority: int = PRIORITY_INTERACTIVE, page_count: int = None,
+                       max_tokens: int = 16000, sections: tuple = EXTRACTION_SECTIONS, on_event=None) -> dict:
+    """Extract JSON from a PDF, continuing responses cut off at ``max_tokens``.
+
+    A truncated response is not thrown away: its complete part is kept and
+    the model is asked for only the missing tail, up to
+    ``MAX_CONTINUATIONS`` times. With ``on_event`` the response is streamed
+    and every section and array entry is reported as soon as it is parsed
+    (see ``SectionStreamParser``).
+    """
+    if on_event:
+        parser = SectionStreamParser(on_event)
+        for delta in stream_gemini_via_openrouter(
+                pdf_path, prompt, priority=priority, page_count=page_count, max_tokens=max_tokens):
+            parser.feed(delta)
+        data, complete, open_key, content = parse_extraction_content(parser.text)
+    else:
+        result = call_gemini_via_openrouter(pdf_path, prompt, priority=priority, page_count=page_count, max_tokens=max_tokens)
+        data, complete, open_key, content = parse_extraction_response(result)
+
+    history = []
+    continuations = 0
+    while not complete and isinstance(data, dict) and continuations < MAX_CONTINUATIONS:
+        continuations += 1
+        missing = [f'the remaining "{open_key}" entries'] if open_key else []
+        missing += [f'"{section}"' for section in sections if section not in data]
+        if not missing:
+            break
+        print(f"✂️ Response truncated; requesting the missing part ({continuations}/{MAX_CONTINUATIONS})")
+        history += [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": CONTINUATION_PROMPT.format(
+                received=describe_received(data), missing=', '.join(missing)
+            )}
+        ]
+        result = call_gemini_via_openrouter(
+            pdf_path, prompt, priority=priority, page_count=page_count, max_tokens=max_tokens, history=history
+        )
+        try:
+            more, complete, open_key, content = parse_extraction_response(result)
+        except PassportProcessingError as exc:
+            print(f"Continuation failed: {exc}")
+            break
+        if isinstance(more, dict):
+            merge_continuation(data, more)
+
+    if not complete:
+        print("⚠️ Extraction response incomplete; keeping the entries received")
+    return data
+
+
+def page_groups(page_count: int) -> list:
+    """Split pages into ``(first, last)`` ranges: biographical pages, then visa/stamp groups."""
+    bio_last = min(page_count, max(1, EXTRACTION_BIO_PAGES))
+    groups = [(1, bio_last)]
+    size = max(1, EXTRACTION_GROUP_PAGES)
+    for first in range(bio_last + 1, page_count + 1, size):
+        groups.append((first, min(first + size - 1, page_count)))
+    return groups
+
+
+def write_page_groups(pdf_path: Path, groups: list, directory: Path) -> list:
+    """Write each page range of the PDF to its own file and return the paths."""
+    return write_page_subsets(
+        pdf_path,
+        [(f"pages_{first}_{last}.pdf", range(first, last + 1)) for first, last in groups],
+        directory
+    )
+
+
+def write_page_subsets(pdf_path: Path, subsets: list, directory: Path) -> list:
+    """Write ``(name, page numbers)`` subsets of the PDF to files in ``directory``."""
+    paths = []
+    with open(pdf_path, 'rb') as handle:
+        reader = PyPDF2.PdfReader(handle)
+        if reader.is_encrypted:
+            reader.decrypt('')
+        for name, page_numbers in subsets:
+            writer = PyPDF2.PdfWriter()
+            for page_number in page_numbers:
+                writer.add_page(reader.pages[page_number - 1])
+            path = directory / name
+            with open(path, 'wb') as output:
+                writer.write(output)
+            paths.append(path)
+    return paths
+
+
+def page_ink_ratio(image) -> float:
+    """Share of a page render's pixels that are clearly darker than the paper.
+
+    Pixels are compared with the page's median brightness, so tinted paper
+    and faint security backgrounds do not count as content.
+    """
+    gray = image.convert('L')
+    median = ImageStat.Stat(gray).median[0]
+    histogram = gray.histogram()
+    ink = sum(histogram[:max(0, int(median) - PAGE_INK_CONTRAST)])
+    return ink / (gray.width * gray.height)
+
+
+def is_blank_page(image) -> bool:
+    """Whether a page render has (almost) no ink on it."""
+    return page_ink_ratio(image) < PAGE_BLANK_INK_RATIO
+
+
+def find_blank_pages(pdf_path: Path, pages: list) -> list:
+    """Return the numbers of blank pages, never including the biographical pages.
+
+    Pages are rendered one at a time. Rendering failures are treated as
+    "no blank pages" so every page is sent. Every page found blank is logged
+    with its ink ratio.
+    """
+    blank_pages = []
+    try:
+        for number in range(EXTRACTION_BIO_PAGES + 1, len(pages) + 1):
+            image = convert_from_path(
+                str(pdf_path), dpi=PAGE_TRIAGE_DPI, grayscale=True, first_page=number, last_page=number
+            )[0]
+            ratio = page_ink_ratio(image)
+            if ratio < PAGE_BLANK_INK_RATIO:
+                print(f"🗒️ Page {number} looks blank (ink ratio {ratio:.5f} < {PAGE_BLANK_INK_RATIO})")
+                blank_pages.append(number)
+    except Exception as exc:
+        print(f"Page triage skipped: {exc}")
+        return []
+    return blank_pages
+
+
+def compact_pdf(pdf_path: Path, page_count: int, output_path: Path) -> Path:
+    """Rebuild the PDF from JPEG renders at ``PDF_COMPACT_DPI``.
+
+    Pages are rendered and appended one at a time. Returns the path of the
+    smaller file, or the original when rendering fails.
+    """
+    original_size = os.path.getsize(pdf_path)
+    try:
+        for page_number in range(1, page_count + 1):
+            images = convert_from_path(
+                str(pdf_path), dpi=PDF_COMPACT_DPI, first_page=page_number, last_page=page_number
+            )
+            page_image = images[0] if images[0].mode == 'RGB' else images[0].convert('RGB')
+            page_image.save(
+                output_path, format='PDF', resolution=PDF_COMPACT_DPI,
+                quality=PDF_COMPACT_QUALITY, append=page_number > 1
+            )
+    except Exception as exc:
+        print(f"PDF compaction skipped: {exc}")
+        return pdf_path
+
+    compact_size = os.path.getsize(output_path)
+    print(
+        f"🗜️ PDF for extraction: {original_size / 1024:.0f} KB original, {compact_size / 1024:.0f} KB compacted "
+        f"({page_count} pages at {PDF_COMPACT_DPI} DPI, quality {PDF_COMPACT_QUALITY})"
+    )
+    if compact_size >= original_size:
+        return pdf_path
+    return output_path
+
+
+def remap_event_pages(on_event, page_numbers: list):
+    """Wrap an extraction event callback so page numbers refer to the original PDF."""
+    def emit(event):
+        data = json.loads(json.dumps(event['data']))
+        if event['event'] == 'item' and isinstance(data, dict):
+            remap_page_numbers({event['section']: [data]}, page_numbers)
+        elif isinstance(data, list):
+            remap_page_numbers({event['section']: data}, page_numbers)
+        on_event(dict(event, data=data))
+    return emit
+
+
+def remap_page_numbers(passport_data: dict, page_numbers: list):
+    """Rewrite page numbers of a PDF excerpt to the pages of the original document."""
+    for section in PAGE_SECTIONS:
+        entries = passport_data.get(section)
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                number = int(entry.get('page_number'))
+            except (TypeError, ValueError):
+                continue
+            if 1 <= number <= len(page_numbers):
+                entry['page_number'] = page_numbers[number - 1]
+
+
+def absolute_page_number(value, first: int, last: int) -> int:
+    """Map a page number reported for an excerpt back to the whole document."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return first
+    if 1 <= number <= last - first + 1:
+        return first + number - 1
+    if first <= number <= last:
+        # The model numbered the pages of the whole passport
+        return number
+    return first
+
+
+def merge_page_group(passport_data: dict, group_data: dict, first: int, last: int):
+    for section in PAGE_SECTIONS:
+        entries = group_data.get(section)
+        if not isinstance(entries, list):
+            continue
+        target = passport_data.setdefault(section, [])
+        if not isinstance(target, list):
+            target = passport_data[section] = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                entry['page_number'] = absolute_page_number(entry.get('page_number'), first, last)
+                target.append(entry)
+
+
+def extract_by_page_groups(pdf_path: Path, page_count: int, priority: int = PRIORITY_INTERACTIVE,
+                           on_event=None) -> dict:
+    """Extract page groups concurrently and merge them into one passport.
+
+    The first group (biographical pages) gets the full prompt; the others
+    only report visas and stamps. Each group is one request on the
+    extraction stage, so latency follows the slowest group. Only the first
+    group is streamed to ``on_event``.
+    """
+    groups = page_groups(page_count)
+    with tempfile.TemporaryDirectory(prefix='pages-') as directory:
+        paths = write_page_groups(pdf_path, groups, Path(directory))
+        futures = []
+        for index, ((first, last), path) in enumerate(zip(groups, paths)):
+            prompt = PROMPT if index == 0 else PAGE_GROUP_PROMPT
+            max_tokens = 16000 if index == 0 else PAGE_GROUP_MAX_TOKENS
+            futures.append(extraction_stage.submit(
+                request_extraction, path, prompt, slot_priority=priority,
+                priority=priority, page_count=last - first + 1, max_tokens=max_tokens,
+                sections=EXTRACTION_SECTIONS if index == 0 else PAGE_SECTIONS,
+                on_event=on_event if index == 0 else None
+            ))
+
+        try:
+            results = []
+            for (first, last), future in zip(groups, futures):
+                try:
+                    results.append(future.result())
+                except PassportProcessingError as exc:
+                    raise PassportProcessingError(f"Pages {first}-{last}: {exc}", exc.raw_response)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    passport_data = results[0] if isinstance(results[0], dict) else {}
+    for section in PAGE_SECTIONS:
+        entries = passport_data.get(section)
+        passport_data[section] = [entry for entry in entries if isinstance(entry, dict)] if isinstance(entries, list) else []
+    for (first, last), group_data in zip(groups[1:], results[1:]):
+        if isinstance(group_data, dict):
+            merge_page_group(passport_data, group_data, first, last)
+    print(f"📑 Extracted {page_count} pages in {len(groups)} groups")
+    return passport_data
+
+
+def normalize_passport_sections(passport_data: dict) -> dict:
+    """Flatten nested values in every known section of extracted data."""
+    if 'biographical_page' in passport_data:
+        passport_data['biographical_page'] = normalize_dict_section(passport_data['biographical_page'])
+    if 'mrz' in passport_data:
+        passport_data['mrz'] = normalize_dict_section(passport_data['mrz'])
+
+    passport_data['visas'] = normalize_list_of_dicts(passport_data.get('visas', []))
+    passport_data['stamps'] = normalize_list_of_dicts(passport_data.get('stamps', []))
+    passport_data['registration_stamps'] = normalize_list_of_dicts(passport_data.get('registration_stamps', []))
+    return passport_data
+
+
+def fill_bio_from_mrz(passport_data: dict, fields: dict):
+    """Fill biographical fields the model left empty from a valid MRZ."""
+    bio = passport_data.setdefault('biographical_page', {})
+    for key, value in (
+        ('passport_number', fields['passport_number']),
+        ('date_of_birth', fields['date_of_birth']),
+        ('expiry_date', fields['expiry_date']),
+        ('gender', fields['sex'] if fields['sex'] in ('M', 'F') else None)
+    ):
+        if value and not bio.get(key):
+            bio[key] = value
+
+
+def verify_mrz(passport_data: dict, pdf_path: Path, content_pages: list, priority: int = PRIORITY_INTERACTIVE):
+    """Validate the MRZ locally and re-extract the biographical pages if it fails.
+
+    A valid or missing MRZ needs no further model calls. MRZ lines that fail
+    validation send only the biographical pages again with a prompt naming
+    the failure, and the result replaces the biographical section when its
+    MRZ validates.
+    """
+    mrz_check = check_passport_mrz(passport_data)
+    if mrz_check['valid']:
+        fill_bio_from_mrz(passport_data, mrz_check['fields'])
+        return
+    # Without MRZ lines (e.g. a document that has none) there is nothing to misread
+    if not mrz_check['present'] or not MRZ_REEXTRACT or not content_pages:
+        return
+
+    bio_pages = content_pages[:max(1, EXTRACTION_BIO_PAGES)]
+    failure = '; '.join(mrz_check['errors'])
+    print(f"🔁 MRZ failed validation ({failure}); re-extracting pages {bio_pages}")
+    try:
+        with tempfile.TemporaryDirectory(prefix='mrz-') as directory:
+            bio_pdf = write_page_subsets(pdf_path, [('bio.pdf', bio_pages)], Path(directory))[0]
+            with extraction_stage.slot(priority):
+                retry = request_extraction(
+                    bio_pdf, BIO_PAGE_PROMPT.replace('{errors}', failure), priority=priority, page_count=len(bio_pages),
+                    max_tokens=PAGE_GROUP_MAX_TOKENS, sections=('biographical_page', 'mrz')
+                )
+        if not isinstance(retry, dict):
+            raise PassportProcessingError('Re-extraction did not return a JSON object')
+        retry = normalize_passport_sections(retry)
+    except (LLMError, PassportProcessingError, OSError) as exc:
+        print(f"Biographical page re-extraction failed: {exc}")
+        return
+
+    retry_check = check_passport_mrz(retry)
+    if not retry_check['valid']:
+        print(f"⚠️ MRZ still invalid after re-extraction: {'; '.join(retry_check['errors'])}")
+        return
+
+    passport_data['mrz'] = retry['mrz']
+    bio = passport_data.setdefault('biographical_page', {})
+    bio.update({key: value for key, value in retry.get('biographical_page', {}).items() if value})
+    fill_bio_from_mrz(passport_data, retry_check['fields'])
+    print("✅ MRZ valid after biographical page re-extraction")
+
+
+def claim_extraction(file_hash: str) -> tuple:
+    """Return ``(future, owner)`` for the extraction of a file.
+
+    The first caller for a hash becomes the owner and must settle the future
+    through ``finish_extraction``; later callers get the same future.
+    """
+    with inflight_extractions_lock:
+        future = inflight_extractions.get(file_hash)
+        if future is not None:
+            return future, False
+        future = Future()
+        inflight_extractions[file_hash] = future
+        return future, True
+
+
+def finish_extraction(file_hash: str, future: Future, passport_data: dict = None, error: BaseException = None):
+    with inflight_extractions_lock:
+        if inflight_extractions.get(file_hash) is future:
+            del inflight_extractions[file_hash]
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(passport_data)
+
+
+def inflight_extraction(file_hash: str) -> Future | None:
+    with inflight_extractions_lock:
+        return inflight_extractions.get(file_hash)
+
+
+def extract_and_store_passport(filename: str, pdf_path: Path, file_hash: str, progress=None,
+                               priority: int = PRIORITY_INTERACTIVE, on_event=None) -> dict:
+    """Extraction stage: call the model, normalize and persist the record.
+
+    Concurrent calls for the same file share one extraction; later callers
+    wait for the result of the first. ``on_event`` receives sections and
+    entries while the model response streams in. Returns the untranslated
+    passport data with ``record_id``.
+    """
+    future, owner = claim_extraction(file_hash)
+    if not owner:
+        print(f"⏳ Same file is already being processed (hash: {file_hash[:8]}); waiting for it")
+        if progress:
+            progress(JOB_EXTRACTING)
+        return dict(future.result())
+
+    try:
+        passport_data = extract_passport_once(filename, pdf_path, file_hash, progress, priority, on_event)
+    except BaseException as exc:
+        finish_extraction(file_hash, future, error=exc)
+        raise
+    finish_extraction(file_hash, future, passport_data)
+    return dict(passport_data)
+
+
+def extract_passport_once(filename: str, pdf_path: Path, file_hash: str, progress=None,
+                          priority: int = PRIORITY_INTERACTIVE, on_event=None) -> dict:
+    """Run the model on a PDF and store the record, unless the file is already stored.
+
+    The PDF is read from ``pdf_path`` and streamed into the request, never
+    loaded whole.
+    """
+    # An identical upload may have finished since the caller checked
+    existing_record = get_record_by_hash(file_hash)
+    if existing_record:
+        return record_passport_data(existing_record)
+
+    if progress:
+        progress(JOB_EXTRACTING)
+
+    # Extract all pages from PDF
+    pages = extract_pages_from_pdf(pdf_path)
+
+    # Leave blank pages out of the request
+    blank_pages = find_blank_pages(pdf_path, pages) if PAGE_TRIAGE and pages else []
+    for page in pages:
+        if page['page_number'] in blank_pages:
+            page['blank'] = True
+            page['skipped'] = True
+    content_pages = [page['page_number'] for page in pages if page['page_number'] not in blank_pages]
+
+    with tempfile.TemporaryDirectory(prefix='extract-') as directory:
+        model_pdf = pdf_path
+        if blank_pages:
+            print(f"🗒️ Skipping {len(blank_pages)} blank pages: {blank_pages}")
+            model_pdf = write_page_subsets(pdf_path, [('content.pdf', content_pages)], Path(directory))[0]
+        if PDF_COMPACT and content_pages:
+            model_pdf = compact_pdf(model_pdf, len(content_pages), Path(directory) / 'compact.pdf')
+
+        if on_event and blank_pages:
+            on_event = remap_event_pages(on_event, content_pages)
+
+        # Call Gemini API
+        if EXTRACTION_MODE == 'pages' and len(content_pages) > EXTRACTION_BIO_PAGES:
+            passport_data = extract_by_page_groups(model_pdf, len(content_pages), priority, on_event)
+        else:
+            with extraction_stage.slot(priority):
+                passport_data = request_extraction(
+                    model_pdf, PROMPT, priority=priority, page_count=len(content_pages), on_event=on_event
+                )
+
+    if blank_pages and isinstance(passport_data, dict):
+        remap_page_numbers(passport_data, content_pages)
+
+    # Log the parsed data for debugging
+    print("=" * 80)
+    print("📦 PARSED DATA FROM GEMINI:")
+    print(json.dumps(passport_data, ensure_ascii=False, indent=2))
+    print("=" * 80)
+
+    # Normalize data to keep strings flat while preserving detail
+    normalize_passport_sections(passport_data)
+
+    # Check the MRZ locally; only a failing MRZ costs another (small) request
+    verify_mrz(passport_data, pdf_path, content_pages, priority)
+
+    # Persist record in database together with page metadata
+    stored_passport_data = dict(passport_data)
+    stored_passport_data['pages'] = pages
+
+    try:
+        record = save_passport_record(filename, stored_passport_data, file_hash)
+    except IntegrityError:
+        # Another process stored the same file first; its record wins
+        existing_record = get_record_by_hash(file_hash)
+        if not existing_record:
+            raise
+        print(f"♻️ File was stored concurrently (hash: {file_hash[:8]}). Using existing record.")
+        return record_passport_data(existing_record)
+    export_record(record.id, stored_passport_data)
+    passport_data['record_id'] = record.id
+
+    # Validate extracted data
+    validation_warnings = validate_passport_data(passport_data)
+    if validation_warnings:
+        print("⚠️ Validation warnings:")
+        for warning in validation_warnings:
+            print(f"   - {warning}")
+
+    print(f"✅ Passport data extracted successfully")
+    print(f"📄 Total pages: {len(pages)}")
+
+    return passport_data
+
+
+def translate_and_store(record_id: int, passport_data: dict, token=None, base: dict = None,
+                        priority: int = PRIORITY_BACKGROUND) -> dict | None:
+    """Translation stage: translate a record and store the result with it.
+
+    With ``base`` (the data the cached translation was made from) only the
+    fields that changed since then are re-translated. Returns None when the
+    translation failed; nothing is stored then.
+    """
+    print(f"🌍 Translating record {record_id}...")
+    try:
+        translated_data = None
+        if base is not None:
+            cached = load_translated_data(record_id)
+            if cached:
+                translated_data = patch_translation(base, passport_data, cached, priority)
+        if translated_data is None:
+            translated_data = translate_passport_data(passport_data, fallback=False, priority=priority)
+    except Exception as exc:
+        # Leave the cache empty so the report endpoint translates later
+        print(f"Background translation for record {record_id} not stored: {exc}")
+        with pending_translations_lock:
+            current = pending_translations.get(record_id)
+            is_current = token is None or (current is not None and current[0] is token)
+            if base is not None and is_current:
+                save_translated_data(record_id, None)
+            if current is not None and is_current:
+                # Let the next ensure_translation try again
+                del pending_translations[record_id]
+        return None
+
+    with pending_translations_lock:
+        current = pending_translations.get(record_id)
+        # An edit made while translating supersedes this result
+        if token is not None and (current is None or current[0] is not token):
+            print(f"Discarding stale translation for record {record_id}")
+            return translated_data
+        save_translated_data(record_id, translated_data)
+        if current is not None:
+            del pending_translations[record_id]
+    print(f"✅ Translation for record {record_id} completed and saved")
+    return translated_data
+
+
+def schedule_translation(record_id: int, passport_data: dict, base: dict = None,
+                         priority: int = PRIORITY_BACKGROUND) -> Future:
+    """Queue background translation; the result is stored in ``translated_data``."""
+    snapshot = json.loads(json.dumps(passport_data, ensure_ascii=False))
+    token = object()
+    with pending_translations_lock:
+        future = translation_stage.submit(translate_and_store, record_id, snapshot, token, base, priority)
+        pending_translations[record_id] = (token, future, base)
+
+    def forget(_):
+        with pending_translations_lock:
+            current = pending_translations.get(record_id)
+            if current is not None and current[0] is token:
+                del pending_translations[record_id]
+
+    future.add_done_callback(forget)
+    return future
+
+
+def cancel_pending_translation(record_id: int):
+    """Cancel the in-flight translation of a record and return its entry, if any."""
+    with pending_translations_lock:
+        current = pending_translations.pop(record_id, None)
+    if current:
+        current[1].cancel()
+    return current
+
+
+def wait_for_pending_translation(record_id: int, timeout: float = 120):
+    """Return the in-flight translation for a record, if one finishes in time."""
+    with pending_translations_lock:
+        current = pending_translations.get(record_id)
+    if not current:
+        return None
+    try:
+        return current[1].result(timeout=timeout)
+    except Exception as exc:
+        print(f"Pending translation for record {record_id} unavailable: {exc}")
+        return None
+
+
+def ensure_translation(record_id: int, passport_data: dict, priority: int = PRIORITY_BACKGROUND) -> Future:
+    """Return the pending translation of a record, scheduling one if it has none."""
+    with pending_translations_lock:
+        current = pending_translations.get(record_id)
+    if current:
+        return current[1]
+    if has_translated_data(record_id):
+        done = Future()
+        done.set_result(None)
+        return done
+    return schedule_translation(record_id, passport_data, priority=priority)
+
+
+def run_passport_pipeline(filename: str, pdf_path: Path, file_hash: str, progress=None, on_event=None) -> dict:
+    """Extract and store a passport PDF, then translate it in the background.
+
+    ``progress`` is called with a job status string as the pipeline moves
+    between stages, ``on_event`` with sections as they are extracted.
+    Returns the untranslated passport data with ``record_id``.
+    """
+    passport_data = extract_and_store_passport(filename, pdf_path, file_hash, progress, on_event=on_event)
+    ensure_translation(passport_data['record_id'], passport_data)
+    return passport_data
+
+
+def process_passport_job(job, filename: str, file_hash: str, priority: int = PRIORITY_INTERACTIVE,
+                         jobs: JobQueue = None) -> dict:
+    """Job queue entry point: run the pipeline on a stored upload.
+
+    ``jobs`` is the queue the job runs on (``job_queue`` by default).
+    """
+    jobs = jobs or job_queue
+    existing_record = get_record_by_hash(file_hash)
+    if existing_record:
+        return record_passport_data(existing_record)
+
+    inflight = inflight_extraction(file_hash)
+    if inflight is not None:
+        # A synchronous upload of the same file is running; finish with it
+        # instead of blocking this worker
+        jobs.set_status(job, JOB_EXTRACTING)
+        completion = Future()
+
+        def relay(future):
+            if future.exception() is not None:
+                completion.set_exception(future.exception())
+            else:
+                completion.set_result(dict(future.result()))
+
+        inflight.add_done_callback(relay)
+        return completion
+
+    try:
+        passport_data = extract_and_store_passport(
+            filename, source_pdf_path(file_hash), file_hash,
+            progress=lambda status: jobs.set_status(job, status), priority=priority
+        )
+    except CircuitOpenError as exc:
+        # Upstream is down: park the job until the breaker allows a trial call
+        raise JobDeferred(str(exc), delay=max(exc.retry_after, 1))
+    except PassportProcessingError as exc:
+        if exc.raw_response is not None:
+            job.meta['raw_response'] = exc.raw_response
+        raise
+
+    # Hand translation to its own stage so this worker can take the next upload
+    job.result = passport_data
+    jobs.set_status(job, JOB_TRANSLATING, record_id=passport_data['record_id'])
+    # Translation never outranks the interactive extractions; bulk jobs keep their lower priority
+    translation = ensure_translation(
+        passport_data['record_id'], passport_data, priority=max(priority, PRIORITY_BACKGROUND)
+    )
+
+    completion = Future()
+    translation.add_done_callback(lambda _: completion.set_result(passport_data))
+    return completion
+
+
+def submit_upload_job(filename: str, file_hash: str, jobs: JobQueue = None,
+                      priority: int = PRIORITY_INTERACTIVE):
+    """Queue an upload, reusing the job of an identical upload still in progress."""
+    jobs = jobs or job_queue
+    with upload_jobs_lock:
+        while upload_jobs:
+            oldest_hash = next(iter(upload_jobs))
+            _, oldest = find_job(upload_jobs[oldest_hash])
+            if oldest is not None and not oldest.finished:
+                break
+            del upload_jobs[oldest_hash]
+
+        job = None
+        if file_hash in upload_jobs:
+            _, job = find_job(upload_jobs[file_hash])
+        if job is None or job.finished:
+            job = jobs.submit(
+                process_passport_job, filename, file_hash, priority, jobs,
+                meta={'filename': filename, 'file_hash': file_hash}
+            )
+            # Re-inserted at the end, in submission order
+            upload_jobs.pop(file_hash, None)
+            upload_jobs[file_hash] = job.id
+        return job
+
+
+def find_job(job_id: str) -> tuple:
+    """Return ``(queue, job)`` for a job of either queue, or ``(None, None)``."""
+    for jobs in (job_queue, batch_queue):
+        job = jobs.get(job_id)
+        if job:
+            return jobs, job
+    return None, None
+
+
+def iter_batch_files(files):
+    """Yield ``(filename, open_stream)`` for the PDFs of a batch upload.
+
+    ``open_stream()`` returns a context manager around the file's stream, or
+    ``open_stream`` is None for an archive that is not a valid ZIP. ZIP
+    archives are opened in place and yield their PDF members one at a time;
+    anything else is passed through for ``spool_upload`` to check.
+    """
+    for file in files:
+        name = file.filename or ''
+        if not name.lower().endswith('.zip'):
+            yield name, lambda stream=file.stream: contextlib.nullcontext(stream)
+            continue
+        try:
+            archive = zipfile.ZipFile(file.stream)
+        except zipfile.BadZipFile:
+            yield name, None
+            continue
+        with archive:
+            for member in archive.infolist():
+                member_name = member.filename
+                if member.is_dir() or member_name.startswith('__MACOSX/') \
+                        or not member_name.lower().endswith('.pdf'):
+                    continue
+                yield f"{name}/{member_name}", lambda member=member: archive.open(member)
+
+
+def register_batch(batch: Batch):
+    with batches_lock:
+        batches[batch.id] = batch
+        while len(batches) > BATCH_HISTORY:
+            del batches[next(iter(batches))]
+
+
+def create_batch_from_files(files) -> Batch:
+    """Spool the files of a batch upload and queue each new document once.
+
+    Documents already in the database are reported as done, repeats of a
+    file earlier in the batch point at it with ``duplicate_of``, and
+    documents still being processed from another upload share its job.
+    Batch jobs call the model with background priority, so interactive
+    uploads are served first.
+    """
+    batch = Batch()
+    seen = {}
+    for filename, open_stream in iter_batch_files(files):
+        if len(seen) >= BATCH_MAX_FILES:
+            batch.add({'filename': filename, 'status': ITEM_REJECTED,
+                       'error': f'Batch is limited to {BATCH_MAX_FILES} files'})
+            continue
+        if open_stream is None:
+            batch.add({'filename': filename, 'status': ITEM_REJECTED, 'error': 'Invalid ZIP archive'})
+            continue
+        if not filename.lower().endswith('.pdf'):
+            batch.add({'filename': filename, 'status': ITEM_REJECTED, 'error': 'Only PDF files allowed'})
+            continue
+        try:
+            with open_stream() as stream:
+                file_hash, _ = spool_upload(stream)
+        except UploadRejected as exc:
+            batch.add({'filename': filename, 'status': ITEM_REJECTED, 'error': str(exc)})
+            continue
+        except (zipfile.BadZipFile, RuntimeError, OSError) as exc:
+            # A damaged or encrypted archive member fails only its own item
+            print(f"⚠️ Could not read {filename}: {exc}")
+            batch.add({'filename': filename, 'status': ITEM_REJECTED, 'error': f'Could not read file: {exc}'})
+            continue
+
+        item = {'filename': filename, 'file_hash': file_hash}
+        if file_hash in seen:
+            batch.add(dict(item, duplicate_of=seen[file_hash]))
+            continue
+
+        existing_record = get_record_by_hash(file_hash)
+        if existing_record:
+            seen[file_hash] = batch.add(dict(item, status=JOB_DONE, record_id=existing_record.id, existing=True))
+            continue
+        try:
+            job = submit_upload_job(filename, file_hash, jobs=batch_queue, priority=PRIORITY_BULK)
+        except QueueFullError as exc:
+            seen[file_hash] = batch.add(dict(item, status=ITEM_REJECTED, error=str(exc)))
+            continue
+        seen[file_hash] = batch.add(item, job)
+
+    register_batch(batch)
+    return batch
+
+
+def wants_async_processing() -> bool:
+    flag = request.args.get('async') or request.form.get('async') or ''
+    if flag.lower() in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def job_links(job_id: str) -> dict:
+    return {
+        'status_url': f"/api/jobs/{job_id}",
+        'events_url': f"/api/jobs/{job_id}/events"
+    }
+
+
+def comparable_passport_data(data: dict) -> dict:
+    """Passport data without bookkeeping keys, for change detection."""
+    return {key: value for key, value in (data or {}).items() if key not in ('pages', 'record_id')}
+
+
+@app.errorhandler(413)
+def upload_too_large(_error):
+    limit = BATCH_MAX_UPLOAD_SIZE if request.endpoint == 'create_batch' else MAX_UPLOAD_SIZE
+    return jsonify({'error': f'File too large. Maximum size is {limit // (1024 * 1024)}MB'}), 413
+
+
+def receive_pdf_upload() -> tuple:
+    """Validate the ``file`` field of the request and spool it to disk.
+
+    Returns ``(filename, file_hash, pdf_path)``; raises ``UploadRejected``
+    with a message for the client.
+    """
+    if 'file' not in request.files:
+        raise UploadRejected('No file provided')
+
+    file = request.files['file']
+
+    if file.filename == '':
+        raise UploadRejected('No file selected')
+
+    if not file.filename.lower().endswith('.pdf'):
+        raise UploadRejected('Only PDF files allowed')
+
+    # Stream the upload to disk, checking size and PDF magic bytes and
+    # hashing it on the way; the original is kept for page rendering and
+    # queued jobs read it back from there
+    file_hash, pdf_path = spool_upload(file.stream)
+    return file.filename, file_hash, pdf_path
+
+
 @app.route('/api/process', methods=['POST'])
 def process_passport():
     """Process uploaded passport PDF"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Only PDF files allowed'}), 400
-        
-        # Read PDF bytes
-        pdf_bytes = file.read()
-        
-        # Limit file size to 50MB
-        MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
-        if len(pdf_bytes) > MAX_FILE_SIZE:
-            return jsonify({'error': 'File too large. Maximum size is 50MB'}), 400
-        
-        # Validate file content (magic bytes for PDF: %PDF)
-        if not pdf_bytes.startswith(b'%PDF'):
-             return jsonify({'error': 'Invalid PDF file content'}), 400
-        
-        # Encode PDF to base64
-        pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
-        
-        # Calculate file hash to prevent duplicates
-        file_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        try:
+            filename, file_hash, pdf_path = receive_pdf_upload()
+        except UploadRejected as exc:
+            return jsonify({'error': str(exc)}), 400
         
         # Check if already exists
         existing_record = get_record_by_hash(file_hash)
         if existing_record:
             print(f"♻️ File already processed (hash: {file_hash[:8]}). Returning existing record.")
-            passport_data = dict(existing_record.data) if existing_record.data else {}
-            passport_data['record_id'] = existing_record.id
-            
             # If filename is different, maybe update it? For now, keep original record.
-            return jsonify(passport_data), 200
-        
-        # Extract all pages from PDF
-        pages = extract_pages_from_pdf(pdf_bytes)
-        
-        # Call Gemini API
-        result = call_gemini_via_openrouter(pdf_base64, PROMPT)
-        
-        # Extract response
-        if 'choices' not in result or len(result['choices']) == 0:
-            return jsonify({'error': 'No response from API'}), 500
-        
-        content = result['choices'][0]['message']['content']
+            return jsonify(record_passport_data(existing_record)), 200
+
+        if wants_async_processing():
+            try:
+                # An identical upload still in progress hands back its own job
+                job = submit_upload_job(filename, file_hash)
+            except QueueFullError as exc:
+                response = jsonify({'error': str(exc)})
+                response.headers['Retry-After'] = '30'
+                return response, 503
+
+            body = {'job_id': job.id, 'status': job.status}
+            body.update(job_links(job.id))
+            response = jsonify(body)
+            response.headers['Location'] = body['status_url']
+            return response, 202
 
-        # Parse JSON from response
         try:
-            # Remove markdown code blocks if present
-            if '```json' in content:
-                json_start = content.find('```json') + 7
-                json_end = content.find('```', json_start)
-                json_str = content[json_start:json_end].strip()
-            elif '```' in content:
-                json_start = content.find('```') + 3
-                json_end = content.find('```', json_start)
-                json_str = content[json_start:json_end].strip()
-            else:
-                json_str = content
-            
-            passport_data = json.loads(json_str)
-
-            # Log the parsed data for debugging
-            print("=" * 80)
-            print("📦 PARSED DATA FROM GEMINI:")
-            print(json.dumps(passport_data, ensure_ascii=False, indent=2))
-            print("=" * 80)
-            
-            # Normalize data to keep strings flat while preserving detail
-            if 'biographical_page' in passport_data:
-                passport_data['biographical_page'] = normalize_dict_section(passport_data['biographical_page'])
-
-            if 'mrz' in passport_data:
-                passport_data['mrz'] = normalize_dict_section(passport_data['mrz'])
-
-            if 'visas' in passport_data:
-                passport_data['visas'] = normalize_list_of_dicts(passport_data['visas'])
-            else:
-                passport_data['visas'] = []
-
-            if 'stamps' in passport_data:
-                passport_data['stamps'] = normalize_list_of_dicts(passport_data['stamps'])
-            else:
-                passport_data['stamps'] = []
-
-            if 'registration_stamps' in passport_data:
-                passport_data['registration_stamps'] = normalize_list_of_dicts(passport_data['registration_stamps'])
-            else:
-                passport_data['registration_stamps'] = []
-            
-            # Pages images not included in JSON to save space
-
-            # Persist record in database (store reduced data without page images)
-            stored_passport_data = dict(passport_data)
-            stored_passport_data['pages'] = [
-                {
-                    'page_number': page['page_number']
-                }
-                for page in pages
-            ] if pages else []
-
-            record = save_passport_record(file.filename, stored_passport_data, file_hash)
-            save_passport_json(record.id, passport_data)
-            passport_data['record_id'] = record.id
-
-            # Validate extracted data
-            validation_warnings = validate_passport_data(passport_data)
-            if validation_warnings:
-                print("⚠️ Validation warnings:")
-                for warning in validation_warnings:
-                    print(f"   - {warning}")
-            
-            print(f"✅ Passport data extracted successfully")
-            print(f"📄 Total pages: {len(pages)}")
-            
-            # Start immediate translation
-            print("🌍 Starting automatic translation...")
-            translated_data = translate_passport_data(passport_data)
-            save_translated_json(record.id, translated_data)
-            print("✅ Translation completed and saved")
-            
-            return jsonify(passport_data), 200
-            
-        except json.JSONDecodeError as e:
-            return jsonify({
-                'error': 'Failed to parse response',
-                'raw_response': content
-            }), 500
+            passport_data = run_passport_pipeline(filename, pdf_path, file_hash)
+        except CircuitOpenError as exc:
+            response = jsonify({'error': str(exc)})
+            response.headers['Retry-After'] = str(int(exc.retry_after) + 1)
+            return response, 503
+        except PassportProcessingError as exc:
+            body = {'error': str(exc)}
+            if exc.raw_response is not None:
+                body['raw_response'] = exc.raw_response
+            return jsonify(body), 500
+
+        return jsonify(passport_data), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/process/stream', methods=['POST'])
+def process_passport_stream():
+    """Process uploaded passport PDF, streaming progress as NDJSON.
+
+    Every line is one JSON event: ``started``, ``status`` for pipeline
+    stages, ``section`` and ``item`` as parts of the model response are
+    parsed, then ``done`` with the stored passport data or ``error``.
+    Sections arrive in the model's raw form; only ``done`` is normalized.
+    """
+    try:
+        filename, file_hash, pdf_path = receive_pdf_upload()
+    except UploadRejected as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    events = queue.Queue()
+    job = None
+    existing_record = get_record_by_hash(file_hash)
+    if existing_record:
+        print(f"♻️ File already processed (hash: {file_hash[:8]}). Returning existing record.")
+        events.put({'event': 'done', 'data': record_passport_data(existing_record)})
+        events.put(None)
+    else:
+        def run(job):
+            try:
+                passport_data = run_passport_pipeline(
+                    filename, pdf_path, file_hash,
+                    progress=lambda status: events.put({'event': 'status', 'status': status}),
+                    on_event=events.put
+                )
+                events.put({'event': 'done', 'data': passport_data})
+                return passport_data
+            except PassportProcessingError as exc:
+                body = {'event': 'error', 'error': str(exc)}
+                if exc.raw_response is not None:
+                    body['raw_response'] = exc.raw_response
+                events.put(body)
+                raise
+            except Exception as exc:
+                events.put({'event': 'error', 'error': str(exc)})
+                raise
+            finally:
+                events.put(None)
+
+        try:
+            # Same bounded workers and back-pressure as asynchronous uploads
+            job = job_queue.submit(run, meta={'filename': filename, 'file_hash': file_hash})
+        except QueueFullError as exc:
+            response = jsonify({'error': str(exc)})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+
+    def generate():
+        started = {'event': 'started', 'file_hash': file_hash}
+        if job is not None:
+            started['job_id'] = job.id
+        yield json.dumps(started, ensure_ascii=False) + '\n'
+        while True:
+            try:
+                event = events.get(timeout=JOB_EVENTS_HEARTBEAT)
+            except queue.Empty:
+                # Keep idle connections open through proxies
+                yield json.dumps({'event': 'heartbeat'}) + '\n'
+                continue
+            if event is None:
+                return
+            yield json.dumps(event, ensure_ascii=False) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/batches', methods=['POST'])
+def create_batch():
+    """Accept many PDFs (``files`` fields) or ZIP archives and process them in the background"""
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not any(file.filename for file in files):
+        return jsonify({'error': 'No files provided'}), 400
+
+    batch = create_batch_from_files(file for file in files if file.filename)
+    body = batch.to_dict()
+    body['status_url'] = f"/api/batches/{batch.id}"
+    response = jsonify(body)
+    response.headers['Location'] = body['status_url']
+    return response, 202
+
+
+@app.route('/api/batches/<batch_id>', methods=['GET'])
+def batch_status(batch_id: str):
+    """Aggregate progress of a batch; ``?items=0`` leaves out the per-file list"""
+    with batches_lock:
+        batch = batches.get(batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    include_items = request.args.get('items', '1').lower() not in ('0', 'false', 'no')
+    return jsonify(batch.to_dict(include_items=include_items)), 200
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    """Return the current state of an asynchronous processing job"""
+    _, job = find_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    body = job.to_dict()
+    body.update(job_links(job.id))
+    return jsonify(body), 200
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id: str):
+    """Stream job status changes as server-sent events"""
+    jobs, job = find_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        seen_version = None
+        while True:
+            if job.version != seen_version:
+                seen_version = job.version
+                payload = json.dumps(job.to_dict(include_result=job.finished), ensure_ascii=False)
+                yield f"event: {job.status}\ndata: {payload}\n\n"
+                if job.finished:
+                    return
+            elif not jobs.wait_for_change(job, seen_version, timeout=JOB_EVENTS_HEARTBEAT):
+                # Keep idle connections open through proxies
+                yield ": keep-alive\n\n"
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({'status': 'ok'}), 200
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Processing queue, pipeline stage and LLM client counters"""
+    return jsonify({
+        'jobs': job_queue.stats(),
+        'batch_jobs': batch_queue.stats(),
+        'stages': {
+            'extraction': extraction_stage.stats(),
+            'translation': translation_stage.stats()
+        },
+        'llm': llm_client.metrics(),
+        'llm_cache': response_cache.stats(),
+        'translation_memory': translation_memory.stats(),
+        'record_export': record_exporter.stats(),
+        'database_writes': write_batcher.stats()
+    }), 200
+
+
 @app.route('/api/passports', methods=['GET'])
 def list_passports():
     """Return list of processed passport records"""
     page = request.args.get('page', default=1, type=int)
     limit = request.args.get('limit', default=10, type=int)
-    
-    result = list_passport_records(page, limit)
+
+    expires_before = None
+    if request.args.get('expires_before'):
+        expires_before = parse_record_date(request.args['expires_before'])
+        if not expires_before:
+            return jsonify({'error': 'expires_before must be a date (YYYY-MM-DD or DD.MM.YYYY)'}), 400
+
+    try:
+        result = list_passport_records(
+            page, limit,
+            cursor=request.args.get('cursor'),
+            q=request.args.get('q'),
+            nationality=request.args.get('nationality'),
+            expires_before=expires_before,
+            has_visa_country=request.args.get('has_visa_country')
+        )
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
     
     items_data = [
         {
@@ -898,7 +2513,8 @@ def list_passports():
         'total': result['total'],
         'page': result['page'],
         'limit': result['limit'],
-        'pages': result['pages']
+        'pages': result['pages'],
+        'next_cursor': result['next_cursor']
     }
     return jsonify(response), 200
 
@@ -911,19 +2527,22 @@ def passport_detail(record_id: int):
         if not record:
             return jsonify({'error': 'Record not found'}), 404
 
-        snapshot = load_passport_json(record_id) or record.data
+        # Page metadata is not part of the editable payload
+        snapshot = {key: value for key, value in (record.data or {}).items() if key != 'pages'}
+        snapshot['record_id'] = record.id
         response = {
             'id': record.id,
             'created_at': record.created_at.isoformat() + 'Z',
             'filename': record.filename,
             'full_name': record.full_name,
             'passport_number': record.passport_number,
-            'json_path': str(record_json_path(record_id)) if record_json_path(record_id).exists() else None,
+            'json_path': str(record_exporter.path(record_id)) if record_exporter.enabled else None,
             'data': snapshot
         }
         return jsonify(response), 200
 
     if request.method == 'DELETE':
+        record = get_passport_record(record_id)
         try:
             deleted = delete_passport_record(record_id)
         except SQLAlchemyError:
@@ -932,7 +2551,9 @@ def passport_detail(record_id: int):
         if not deleted:
             return jsonify({'error': 'Record not found'}), 404
 
-        delete_passport_json(record_id)
+        cancel_pending_translation(record_id)
+        record_exporter.delete(record_id)
+        delete_source_files(record.file_hash if record else None)
         return jsonify({'status': 'deleted'}), 200
 
     # PUT branch
@@ -955,39 +2576,87 @@ def passport_detail(record_id: int):
     cleaned['stamps'] = normalize_list_of_dicts(cleaned.get('stamps', []))
     cleaned['registration_stamps'] = normalize_list_of_dicts(cleaned.get('registration_stamps', []))
 
-    session = SessionLocal()
-    try:
+    def update(session):
         record = session.get(PassportRecord, record_id)
         if not record:
-            session.close()
-            return jsonify({'error': 'Record not found'}), 404
-
-        record.data = cleaned
-        bio = cleaned.get('biographical_page') or {}
-        record.full_name = bio.get('full_name')
-        record.passport_number = bio.get('passport_number')
+            return None
+
+        previous = record.data or {}
+        has_translation = record.translated_data is not None
+        stored = dict(cleaned)
+        if 'pages' not in stored and previous.get('pages'):
+            # Page metadata is not part of the editable payload
+            stored['pages'] = previous['pages']
+        record.data = stored
+        apply_record_fields(record, cleaned)
+        index_record(session, record)
+        return previous, has_translation, stored
 
-        session.commit()
+    try:
+        updated = write_batcher.run(update)
     except SQLAlchemyError as exc:
-        session.rollback()
         return jsonify({'error': f'Failed to update record: {exc}'}), 500
-    finally:
-        session.close()
+    if updated is None:
+        return jsonify({'error': 'Record not found'}), 404
 
-    save_passport_json(record_id, cleaned)
-    
-    # Clear translation cache so next report generation will use fresh data
-    trans_path = translated_json_path(record_id)
-    if trans_path.exists():
-        try:
-            trans_path.unlink()
-            print(f"Cleared translation cache for record {record_id}")
-        except Exception as e:
-            print(f"Failed to clear translation cache: {e}")
+    previous, has_translation, stored = updated
+    unchanged = comparable_passport_data(previous) == comparable_passport_data(cleaned)
+    export_record(record_id, stored)
+    if unchanged:
+        # Nothing the translation depends on changed; keep the cached translation
+        return jsonify({'status': 'updated', 'data': cleaned}), 200
+
+    # Re-translate only what changed, patching the cached translation in place
+    cancelled = cancel_pending_translation(record_id)
+    if cancelled and cancelled[2] is None:
+        # The first full translation had not finished yet; start it over
+        schedule_translation(record_id, cleaned, priority=PRIORITY_INTERACTIVE)
+    elif has_translation:
+        base = cancelled[2] if cancelled else previous
+        schedule_translation(record_id, cleaned, base=base, priority=PRIORITY_INTERACTIVE)
     
     return jsonify({'status': 'updated', 'data': cleaned}), 200
 
 
+@app.route('/api/passports/<int:record_id>/pages/<int:page_number>', methods=['GET'])
+def passport_page_image(record_id: int, page_number: int):
+    """Render a single page of the original PDF, served from the disk cache"""
+    dpi = request.args.get('dpi', default=RENDER_DEFAULT_DPI, type=int)
+    fmt = (request.args.get('format') or 'jpeg').lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in RENDER_FORMATS:
+        return jsonify({'error': f"Unsupported format. Use one of: {', '.join(RENDER_FORMATS)}"}), 400
+    if dpi is None or not RENDER_MIN_DPI <= dpi <= RENDER_MAX_DPI:
+        return jsonify({'error': f'dpi must be between {RENDER_MIN_DPI} and {RENDER_MAX_DPI}'}), 400
+
+    record = get_passport_record(record_id)
+    if not record:
+        return jsonify({'error': 'Record not found'}), 404
+    if not record.file_hash or not source_pdf_path(record.file_hash).exists():
+        return jsonify({'error': 'Original PDF is not available for this record'}), 404
+
+    page_count = len((record.data or {}).get('pages') or [])
+    if page_number < 1 or (page_count and page_number > page_count):
+        return jsonify({'error': 'Page not found'}), 404
+
+    etag = render_etag(record.file_hash, page_number, dpi, fmt)
+    # Renders are immutable for a given key, so a matching ETag needs no disk access
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    try:
+        path = get_rendered_page(record.file_hash, page_number, dpi, fmt)
+    except Exception as exc:
+        return jsonify({'error': f'Failed to render page: {exc}'}), 500
+
+    response = send_file(path, mimetype=RENDER_FORMATS[fmt][1], etag=etag, conditional=True, max_age=86400)
+    response.cache_control.public = True
+    return response
+
+
 @app.route('/api/templates', methods=['GET'])
 def list_templates_api():
     response = [
@@ -1012,12 +2681,8 @@ def fill_template_api(template_id: str):
 
     record_data = None
     if 'record_id' in payload:
-        snapshot = load_passport_json(payload['record_id'])
-        if snapshot:
-            record_data = snapshot
-        else:
-            record = get_passport_record(payload['record_id'])
-            record_data = record.data if record else None
+        record = get_passport_record(payload['record_id'])
+        record_data = record.data if record else None
         if not record_data:
             return jsonify({'error': 'Record not found'}), 404
     elif 'data' in payload and isinstance(payload['data'], dict):
@@ -1047,19 +2712,19 @@ def generate_report_api(record_id: int):
     if not record:
         return jsonify({'error': 'Record not found'}), 404
 
-    # First try to load already translated data (cached)
-    translated_snapshot = load_translated_json(record_id)
+    # Wait for a translation still in flight (it may be patching the cache), then use the cache
+    translated_snapshot = wait_for_pending_translation(record_id) or load_translated_data(record_id)
     
     if not translated_snapshot:
         # Fall back to original and translate on-the-fly
-        snapshot = load_passport_json(record_id) or record.data
+        snapshot = record.data
         if not snapshot:
             return jsonify({'error': 'No data for record'}), 404
         
         try:
-            translated_snapshot = translate_passport_data(snapshot)
-            # Cache for next time
-            save_translated_json(record_id, translated_snapshot)
+            translated_snapshot = translate_passport_data(snapshot, fallback=False)
+            # Cache for next time; a failed translation is never cached
+            save_translated_data(record_id, translated_snapshot)
         except Exception as e:
             print(f"Translation failed, using original: {e}")
             translated_snapshot = snapshot
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark the passport listing query on a large synthetic table
+
+Builds a throwaway SQLite database of visa-heavy records and times one
+listing page loaded three ways: whole ORM entities (the ``data`` JSON is
+read and decoded for every row), ``list_passport_records`` by page number,
+and ``list_passport_records`` by cursor deep into the table.
+
+    python benchmarks/bench_list_passports.py --records 50000 --visas 40
+"""
+
+import argparse
+import datetime
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import app as passx
+from app import PassportRecord
+
+
+def synthetic_record(index: int, visas: int, created_at: datetime.datetime) -> dict:
+    data = {
+        'biographical_page': {
+            'full_name': f'TESTOV TEST {index} / ТЕСТОВ ТЕСТ',
+            'passport_number': f'BM{index:07d}',
+            'nationality': 'UZBEKISTAN',
+            'expiry_date': '01.01.2030'
+        },
+        'visas': [
+            {
+                'page_number': page % 32 + 1,
+                'country': 'THAILAND',
+                'visa_type': 'TOURIST',
+                'visa_number': f'V{index}-{page}',
+                'issue_date': '01.01.2024',
+                'expiry_date': '01.03.2024',
+                'remarks': 'SINGLE ENTRY. DURATION OF STAY 60 DAYS. ' * 4
+            }
+            for page in range(visas)
+        ],
+        'stamps': [{'page_number': 3, 'country': 'TURKEY', 'type': 'entry', 'date': '05.01.2024'}] * (visas // 2)
+    }
+    return {
+        'created_at': created_at,
+        'filename': f'scan_{index}.pdf',
+        'full_name': data['biographical_page']['full_name'],
+        'passport_number': data['biographical_page']['passport_number'],
+        'data': data
+    }
+
+
+def build_database(path: Path, records: int, visas: int):
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    PassportRecord.metadata.create_all(engine)
+    start = datetime.datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        for offset in range(0, records, 1000):
+            conn.execute(insert(PassportRecord), [
+                synthetic_record(index, visas, start + datetime.timedelta(seconds=index))
+                for index in range(offset, min(offset + 1000, records))
+            ])
+    return engine
+
+
+def timed(func, repeat: int) -> float:
+    """Median wall time of ``func`` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time listing pages on a synthetic passport table.')
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--visas', type=int, default=30, help='Visas per record (stamps: half as many)')
+    parser.add_argument('--limit', type=int, default=50, help='Rows per page')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'bench.db'
+        print(f"Building {args.records} records with {args.visas} visas each...")
+        engine = build_database(path, args.records, args.visas)
+        print(f"Database size: {path.stat().st_size / 1024 / 1024:.1f} MB")
+
+        # Point the app's helpers at the synthetic database
+        passx.SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, future=True)
+        passx.SEARCH_FTS = False
+        passx.record_count = passx.CachedCount(passx.count_passport_records)
+
+        def full_entities():
+            session = passx.SessionLocal()
+            try:
+                session.query(PassportRecord).order_by(
+                    PassportRecord.created_at.desc(), PassportRecord.id.desc()
+                ).limit(args.limit).all()
+            finally:
+                session.close()
+
+        deep_page = args.records // args.limit // 2 or 1
+        cursor = passx.list_passport_records(deep_page - 1, args.limit)['next_cursor'] if deep_page > 1 else None
+
+        results = [
+            ('full rows incl. data JSON, first page', timed(full_entities, args.repeat)),
+            ('summary columns, first page', timed(lambda: passx.list_passport_records(1, args.limit), args.repeat)),
+            (f'summary columns, page {deep_page} by OFFSET',
+             timed(lambda: passx.list_passport_records(deep_page, args.limit), args.repeat)),
+            (f'summary columns, page {deep_page} by cursor',
+             timed(lambda: passx.list_passport_records(deep_page, args.limit, cursor=cursor), args.repeat)),
+        ]
+        engine.dispose()
+
+    width = max(len(name) for name, _ in results)
+    for name, milliseconds in results:
+        print(f"{name.ljust(width)}  {milliseconds:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
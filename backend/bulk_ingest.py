@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Command-line bulk ingestion of passport PDFs from a directory tree
+
+Runs the same extraction, storage and translation pipeline as the web
+service, without the Flask request layer:
+
+    python bulk_ingest.py /data/scans --concurrency 8 --summary summary.json
+
+Translations run in the background while extraction moves on to the next
+files; the run waits for them at the end. Progress is appended to a JSONL
+checkpoint once a file is stored and translated, so an interrupted run
+picks up where it stopped when started again with the same checkpoint.
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+import math
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+
+import app as passx
+from rate_limiter import PRIORITY_BULK
+
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_CHECKPOINT_NAME = '.bulk_ingest.jsonl'
+
+STATUS_DONE = 'done'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+
+
+def find_pdfs(directory: Path) -> list:
+    """All PDF files below ``directory``, in a stable order."""
+    return sorted(
+        path for path in directory.rglob('*')
+        if path.is_file() and path.suffix.lower() == '.pdf' and not path.name.startswith('.')
+    )
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def percentile(values: list, fraction: float) -> float | None:
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Checkpoint:
+    """Append-only JSONL log of finished files.
+
+    Files recorded as done or skipped are not processed again; failed files
+    are retried on the next run.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.finished = set()
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as handle:
+                for line in handle:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A crash can leave half a line at the end
+                        continue
+                    if entry.get('status') in (STATUS_DONE, STATUS_SKIPPED):
+                        self.finished.add(entry['path'])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = open(self.path, 'a', encoding='utf-8')
+
+    def is_finished(self, path: Path) -> bool:
+        return str(path) in self.finished
+
+    def record(self, entry: dict):
+        with self._lock:
+            if self._handle.closed:
+                # A translation settled after an interrupted run gave up
+                return
+            self._handle.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._handle.flush()
+            if entry.get('status') in (STATUS_DONE, STATUS_SKIPPED):
+                self.finished.add(entry['path'])
+
+    def close(self):
+        self._handle.close()
+
+
+def ingest_file(path: Path, translate: bool = True) -> tuple:
+    """Process one PDF unless a record with the same content already exists.
+
+    Returns ``(entry, translation)``: the checkpoint entry, timed without
+    translation, and the Future of the record's background translation
+    (None when not translating or the file failed). Known files are
+    translated too if an earlier run stopped before their translation.
+    """
+    started = time.monotonic()
+    entry = {'path': str(path)}
+    passport_data = None
+    try:
+        file_hash = hash_file(path)
+        entry['file_hash'] = file_hash
+        existing_record = passx.get_record_by_hash(file_hash)
+        if existing_record:
+            entry.update(status=STATUS_SKIPPED, record_id=existing_record.id)
+            passport_data = passx.record_passport_data(existing_record)
+        else:
+            with open(path, 'rb') as handle:
+                file_hash, pdf_path = passx.spool_upload(handle)
+            passport_data = passx.extract_and_store_passport(
+                path.name, pdf_path, file_hash, priority=PRIORITY_BULK
+            )
+            entry.update(status=STATUS_DONE, record_id=passport_data['record_id'])
+    except Exception as exc:
+        entry.update(status=STATUS_FAILED, error=str(exc))
+    finally:
+        entry['seconds'] = round(time.monotonic() - started, 3)
+
+    translation = None
+    if translate and passport_data is not None:
+        translation = passx.ensure_translation(entry['record_id'], passport_data, priority=PRIORITY_BULK)
+    return entry, translation
+
+
+def summarize(entries: list, elapsed: float) -> dict:
+    processed = [entry for entry in entries if entry['status'] == STATUS_DONE]
+    latencies = [entry['seconds'] for entry in processed]
+    return {
+        'files': len(entries),
+        'processed': len(processed),
+        'skipped': sum(1 for entry in entries if entry['status'] == STATUS_SKIPPED),
+        'failed': sum(1 for entry in entries if entry['status'] == STATUS_FAILED),
+        'elapsed_seconds': round(elapsed, 3),
+        'docs_per_minute': round(len(processed) * 60 / elapsed, 2) if elapsed > 0 else None,
+        'latency_p50_seconds': percentile(latencies, 0.5),
+        'latency_p95_seconds': percentile(latencies, 0.95),
+        'failures': [
+            {'path': entry['path'], 'error': entry.get('error')}
+            for entry in entries if entry['status'] == STATUS_FAILED
+        ]
+    }
+
+
+def record_when_translated(checkpoint: Checkpoint, entry: dict, done: Future, translation: Future):
+    """Done callback of ``translation``: log ``entry`` as finished, then resolve ``done``."""
+    try:
+        checkpoint.record(entry)
+    finally:
+        done.set_result(None)
+
+
+def run(directory: Path, concurrency: int, checkpoint: Checkpoint, translate: bool = True,
+        limit: int = None) -> dict:
+    """Ingest every PDF under ``directory`` not yet in ``checkpoint``; return the summary."""
+    pending = [path for path in find_pdfs(directory) if not checkpoint.is_finished(path)]
+    if limit:
+        pending = pending[:limit]
+    print(f"📂 {len(pending)} PDF files to ingest from {directory} ({len(checkpoint.finished)} already done)")
+
+    entries = []
+    recorded = []
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='bulk-ingest') as executor:
+        futures = [executor.submit(ingest_file, path, translate) for path in pending]
+        for future in as_completed(futures):
+            entry, translation = future.result()
+            if translation is None:
+                checkpoint.record(entry)
+            else:
+                # Files count as finished for the checkpoint once their
+                # translation settled, so an interrupted run keeps them
+                done = Future()
+                translation.add_done_callback(functools.partial(record_when_translated, checkpoint, entry, done))
+                recorded.append(done)
+            entries.append(entry)
+            icon = {'done': '✅', 'skipped': '♻️', 'failed': '❌'}[entry['status']]
+            print(f"{icon} [{len(entries)}/{len(pending)}] {entry['path']} ({entry['seconds']}s)"
+                  + (f": {entry['error']}" if entry.get('error') else ''))
+
+    remaining = [done for done in recorded if not done.done()]
+    if remaining:
+        print(f"🌍 Waiting for {len(remaining)} translations...")
+    # Also covers callbacks still writing their entry, before the caller closes the checkpoint
+    wait(recorded)
+    return summarize(entries, time.monotonic() - started)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Ingest all passport PDFs below a directory.')
+    parser.add_argument('directory', type=Path, help='Directory to scan recursively for PDF files')
+    parser.add_argument('--concurrency', type=int, default=passx.EXTRACTION_CONCURRENCY,
+                        help='Files processed at the same time (default: EXTRACTION_CONCURRENCY)')
+    parser.add_argument('--checkpoint', type=Path,
+                        help=f'JSONL progress log used to resume (default: <directory>/{DEFAULT_CHECKPOINT_NAME})')
+    parser.add_argument('--summary', type=Path, help='Also write the run summary as JSON to this file')
+    parser.add_argument('--no-translate', action='store_true', help='Store records without translating them')
+    parser.add_argument('--limit', type=int, help='Process at most this many files')
+    args = parser.parse_args(argv)
+
+    if not args.directory.is_dir():
+        parser.error(f"{args.directory} is not a directory")
+    # Extraction calls beyond the slots open to bulk work would only wait for one
+    stage_limit = passx.extraction_stage.concurrency - passx.extraction_stage.reserved
+    if args.concurrency > stage_limit:
+        print(f"⚠️ --concurrency {args.concurrency} exceeds the {stage_limit} extraction slots "
+              f"not reserved for interactive uploads; using {stage_limit}")
+        args.concurrency = stage_limit
+    # Checkpoint entries hold absolute paths so resuming works from any cwd
+    args.directory = args.directory.resolve()
+
+    checkpoint = Checkpoint(args.checkpoint or args.directory / DEFAULT_CHECKPOINT_NAME)
+    try:
+        summary = run(args.directory, args.concurrency, checkpoint, not args.no_translate, args.limit)
+    finally:
+        checkpoint.close()
+
+    print(
+        f"📊 {summary['processed']} processed, {summary['skipped']} skipped, {summary['failed']} failed "
+        f"in {summary['elapsed_seconds']}s ({summary['docs_per_minute']} docs/min, "
+        f"p50 {summary['latency_p50_seconds']}s, p95 {summary['latency_p95_seconds']}s)"
+    )
+    if args.summary:
+        args.summary.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
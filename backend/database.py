@@ -0,0 +1,174 @@
+"""
+SQLite engine configuration and batched writes for the passport database
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+
+# Execution option selecting how a transaction starts: a deferred BEGIN for
+# readers, BEGIN IMMEDIATE for writers so they take the write lock up front
+BEGIN_MODE_OPTION = 'sqlite_begin'
+BEGIN_IMMEDIATE = 'IMMEDIATE'
+
+
+def sqlite_url(path) -> str:
+    """SQLAlchemy URL of the database file at the absolute form of ``path``."""
+    return f"sqlite:///{Path(path).expanduser().resolve()}"
+
+
+def create_sqlite_engine(path, busy_timeout: float = 30, mmap_size: int = 256 * 1024 * 1024,
+                         pool_size: int = 10, max_overflow: int = 20):
+    """Engine for a SQLite file tuned for many readers next to steady writes.
+
+    Every pooled connection runs in WAL mode (readers never block the writer
+    or each other) with ``synchronous=NORMAL``, waits up to ``busy_timeout``
+    seconds for a lock held by another connection or process instead of
+    failing with "database is locked", and reads through ``mmap_size`` bytes
+    of memory-mapped I/O. Connections are pooled per process; a forked child
+    starts with an empty pool rather than sharing its parent's file handles.
+    """
+    engine = create_engine(
+        sqlite_url(path),
+        future=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        connect_args={'check_same_thread': False, 'timeout': busy_timeout}
+    )
+
+    @event.listens_for(engine, 'connect')
+    def configure_connection(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see start_transaction) instead of
+        # the driver opening transactions implicitly before writes
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+            cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+            cursor.execute("PRAGMA foreign_keys=ON")
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def start_transaction(conn):
+        # A deferred transaction that reads before it writes cannot wait for
+        # the write lock once another connection has committed in between
+        # (SQLITE_BUSY_SNAPSHOT); writers therefore lock at BEGIN, where
+        # busy_timeout applies
+        if conn.get_execution_options().get(BEGIN_MODE_OPTION) == BEGIN_IMMEDIATE:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            conn.exec_driver_sql("BEGIN")
+
+    if hasattr(os, 'register_at_fork'):
+        # Drop inherited connections in the child without closing them, since
+        # the parent still uses them
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    return engine
+
+
+def writer_engine(engine):
+    """``engine`` with every transaction started as BEGIN IMMEDIATE (shares its pool)."""
+    return engine.execution_options(**{BEGIN_MODE_OPTION: BEGIN_IMMEDIATE})
+
+
+class WriteBatcher:
+    """Run database writes of many threads in shared transactions.
+
+    ``run(work)`` hands ``work(session)`` to a single writer thread, which
+    takes up to ``max_batch`` queued writes, applies each in its own
+    savepoint and commits them together. Under load one fsync and one
+    acquisition of the write lock then cover a whole batch, and threads of
+    this process never compete for the lock. A write that raises is rolled
+    back alone and its exception re-raised in the caller; a failed commit
+    fails the whole batch.
+    """
+
+    def __init__(self, session_factory, max_batch: int = 64):
+        self.session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self.largest_batch = 0
+
+    def submit(self, work) -> Future:
+        """Queue ``work(session)``; the Future holds its result once committed."""
+        future = Future()
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use, or first use in a forked child whose writer thread did not survive the fork
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name='db-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((work, future))
+        return future
+
+    def run(self, work):
+        """Apply ``work(session)`` and return its result once committed."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('WriteBatcher.run called from inside a batched write')
+        return self.submit(work).result()
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'failed': self.failed,
+            'largest_batch': self.largest_batch,
+            'pending': self._queue.qsize() if self._queue else 0
+        }
+
+    def _run(self, pending: queue.Queue):
+        while True:
+            batch = [pending.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch: list):
+        results = []
+        session = self.session_factory()
+        try:
+            for work, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with session.begin_nested():
+                        results.append((future, work(session), None))
+                except Exception as exc:
+                    results.append((future, None, exc))
+            session.commit()
+        except Exception as exc:
+            session.rollback()
+            self.failed += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            session.close()
+
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for future, result, error in results:
+            if error is None:
+                self.writes += 1
+                future.set_result(result)
+            else:
+                self.failed += 1
+                future.set_exception(error)
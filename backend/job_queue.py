@@ -0,0 +1,355 @@
+"""
+Bounded background job queue for long-running passport processing
+"""
+
+import collections
+import threading
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+import time
+import uuid
+
+JOB_QUEUED = 'queued'
+JOB_EXTRACTING = 'extracting'
+JOB_TRANSLATING = 'translating'
+JOB_DEFERRED = 'deferred'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+TERMINAL_STATUSES = (JOB_DONE, JOB_FAILED)
+
+# Batch item that never became a job (not a PDF, too large, queue full)
+ITEM_REJECTED = 'rejected'
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds the maximum number of pending jobs."""
+
+
+class JobDeferred(Exception):
+    """Raised by a job to be re-queued after ``delay`` seconds."""
+
+    def __init__(self, message, delay: float):
+        super().__init__(message)
+        self.delay = delay
+
+
+class Job:
+    def __init__(self, func, args, kwargs, meta=None):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.meta = dict(meta or {})
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.result = None
+        self.error = None
+        self.version = 0
+        self.deferrals = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'error': self.error
+        }
+        data.update(self.meta)
+        if include_result and self.result is not None:
+            data['result'] = self.result
+        return data
+
+
+class JobQueue:
+    """Fixed pool of worker threads fed from a bounded FIFO.
+
+    Jobs are plain callables invoked as ``func(job, *args, **kwargs)``; they
+    report progress through :meth:`set_status` and their return value becomes
+    ``job.result``. A job may return a ``Future`` to hand its tail off to
+    another stage: the worker is released at once and the job completes when
+    the future does. Raising :class:`JobDeferred` parks the job and re-queues
+    it after the requested delay. Finished jobs are kept for polling until ``max_finished``
+    newer jobs have completed.
+    """
+
+    def __init__(self, workers: int = 4, max_depth: int = 500, max_finished: int = 1000, name: str = 'jobs',
+                 max_deferrals: int = 20):
+        self.workers = max(1, workers)
+        self.max_depth = max(1, max_depth)
+        self.max_finished = max_finished
+        self.max_deferrals = max_deferrals
+        self.name = name
+        self._queue = queue.Queue(maxsize=self.max_depth)
+        self._jobs = {}
+        self._finished = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._threads = []
+        self._active = 0
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, func, *args, meta: dict = None, **kwargs) -> Job:
+        self._ensure_workers()
+        job = Job(func, args, kwargs, meta)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFullError(f"Job queue is full ({self.max_depth} pending jobs)")
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def set_status(self, job: Job, status: str, **meta):
+        with self._changed:
+            job.status = status
+            job.meta.update(meta)
+            job.updated_at = time.time()
+            job.version += 1
+            if job.finished:
+                self._finished[job.id] = job
+                while len(self._finished) > self.max_finished:
+                    stale_id, _ = self._finished.popitem(last=False)
+                    self._jobs.pop(stale_id, None)
+            self._changed.notify_all()
+
+    def wait_for_change(self, job: Job, seen_version: int, timeout: float) -> bool:
+        """Block until ``job.version`` moves past ``seen_version`` or timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: job.version != seen_version, timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'active': self._active,
+                'deferred': sum(1 for job in self._jobs.values() if job.status == JOB_DEFERRED),
+                'queued': self._queue.qsize(),
+                'max_depth': self.max_depth,
+                'tracked_jobs': len(self._jobs)
+            }
+
+    def _complete(self, job: Job, future: Future):
+        exc = future.exception()
+        if exc is not None:
+            job.error = str(exc)
+            self.set_status(job, JOB_FAILED)
+        else:
+            job.result = future.result()
+            self.set_status(job, JOB_DONE)
+
+    def _defer(self, job: Job, exc: JobDeferred) -> bool:
+        if job.deferrals >= self.max_deferrals:
+            return False
+        job.deferrals += 1
+        job.error = str(exc)
+        self.set_status(job, JOB_DEFERRED, retry_at=time.time() + exc.delay)
+        timer = threading.Timer(exc.delay, self._requeue, args=(job,))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _requeue(self, job: Job):
+        self.set_status(job, JOB_QUEUED)
+        # Wait for room rather than drop a job that was already accepted
+        self._queue.put(job)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._active += 1
+            deferred = False
+            try:
+                result = job.func(job, *job.args, **job.kwargs)
+                if isinstance(result, Future):
+                    result.add_done_callback(lambda future, job=job: self._complete(job, future))
+                else:
+                    job.result = result
+                    self.set_status(job, JOB_DONE)
+            except JobDeferred as exc:
+                deferred = self._defer(job, exc)
+                if not deferred:
+                    job.error = str(exc)
+                    self.set_status(job, JOB_FAILED)
+            except Exception as exc:
+                job.error = str(exc)
+                self.set_status(job, JOB_FAILED)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                if not deferred:
+                    job.func = job.args = job.kwargs = None
+                self._queue.task_done()
+
+
+class Batch:
+    """A group of files submitted together, tracked item by item.
+
+    Items are plain dicts (``filename``, ``file_hash``, ...) that either
+    carry a fixed ``status`` or are attached to a :class:`Job`, whose
+    status is read live whenever the batch is reported. An item with
+    ``duplicate_of`` set to the index of an earlier item reports that
+    item's outcome.
+    """
+
+    def __init__(self, meta: dict = None):
+        self.id = uuid.uuid4().hex
+        self.created_at = time.time()
+        self.meta = dict(meta or {})
+        self._items = []
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, item: dict, job: Job = None) -> int:
+        with self._lock:
+            index = len(self._items)
+            self._items.append(dict(item))
+            if job is not None:
+                self._jobs[index] = job
+            return index
+
+    def items(self) -> list:
+        with self._lock:
+            items = [dict(item) for item in self._items]
+            jobs = dict(self._jobs)
+        for index, job in jobs.items():
+            item = items[index]
+            item.update(job_id=job.id, status=job.status, error=job.error)
+            record_id = job.meta.get('record_id')
+            if record_id is None and isinstance(job.result, dict):
+                record_id = job.result.get('record_id')
+            if record_id is not None:
+                item['record_id'] = record_id
+        for item in items:
+            if item.get('duplicate_of') is not None:
+                original = items[item['duplicate_of']]
+                for key in ('status', 'error', 'record_id'):
+                    if key in original:
+                        item[key] = original[key]
+        return items
+
+    def to_dict(self, include_items: bool = True) -> dict:
+        items = self.items()
+        counts = collections.Counter(item['status'] for item in items)
+        failed = counts[JOB_FAILED] + counts[ITEM_REJECTED]
+        completed = counts[JOB_DONE]
+        data = {
+            'batch_id': self.id,
+            'created_at': self.created_at,
+            'total': len(items),
+            'completed': completed,
+            'failed': failed,
+            'pending': len(items) - completed - failed,
+            'counts': dict(counts),
+            'finished': completed + failed == len(items)
+        }
+        data.update(self.meta)
+        if include_items:
+            data['items'] = items
+        return data
+
+
+class Stage:
+    """Pipeline stage with its own concurrency limit.
+
+    ``submit`` runs work on the stage's executor; ``slot`` bounds work that
+    has to stay on the caller's thread (e.g. a request handler). Work with a
+    priority above 0 (background, as in the rate limiter) never holds more
+    than ``concurrency - reserved`` slots, so the rest stay free for
+    interactive work however much background work is waiting.
+    """
+
+    def __init__(self, name: str, concurrency: int, reserved: int = 0):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.reserved = min(max(0, reserved), self.concurrency - 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=name)
+        # Background work gets its own threads so it cannot hold up
+        # interactive work queued behind it while waiting for a slot
+        self._background_executor = ThreadPoolExecutor(
+            max_workers=self.concurrency - self.reserved, thread_name_prefix=f"{name}-background"
+        )
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._pending = 0
+        self._active = 0
+        self._active_background = 0
+
+    def submit(self, func, *args, slot_priority: int = 0, **kwargs) -> Future:
+        with self._lock:
+            self._pending += 1
+        executor = self._background_executor if slot_priority > 0 else self._executor
+        future = executor.submit(self._run, func, slot_priority, args, kwargs)
+        future.add_done_callback(self._forget_cancelled)
+        return future
+
+    def _forget_cancelled(self, future: Future):
+        if future.cancelled():
+            with self._lock:
+                self._pending -= 1
+
+    def _run(self, func, slot_priority, args, kwargs):
+        with self._lock:
+            self._pending -= 1
+        with self.slot(slot_priority):
+            return func(*args, **kwargs)
+
+    def slot(self, priority: int = 0):
+        return _StageSlot(self, priority > 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'concurrency': self.concurrency,
+                'reserved': self.reserved,
+                'active': self._active,
+                'active_background': self._active_background,
+                'pending': self._pending
+            }
+
+
+class _StageSlot:
+    def __init__(self, stage: Stage, background: bool):
+        self.stage = stage
+        self.background = background
+
+    def __enter__(self):
+        stage = self.stage
+        limit = stage.concurrency - stage.reserved
+        with stage._slot_freed:
+            while stage._active >= stage.concurrency or \
+                    (self.background and stage._active_background >= limit):
+                stage._slot_freed.wait()
+            stage._active += 1
+            if self.background:
+                stage._active_background += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.stage._slot_freed:
+            self.stage._active -= 1
+            if self.background:
+                self.stage._active_background -= 1
+            self.stage._slot_freed.notify_all()
+        return False
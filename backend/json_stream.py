@@ -0,0 +1,122 @@
+"""
+Incremental parsing of a streamed JSON object into section and item events
+"""
+
+import json
+
+
+class SectionStreamParser:
+    """Report the parts of a top-level JSON object as soon as they are complete.
+
+    Text is fed in arbitrary chunks (leading code fences or prose are
+    skipped). ``on_event`` receives ``{'event': 'item', 'section', 'index',
+    'data'}`` for every element of a top-level array and ``{'event':
+    'section', 'section', 'data'}`` for every top-level field once its
+    value is closed.
+    """
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.text = ''
+        self._position = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._expect_key = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+        self._item_start = None
+        self._item_index = 0
+        self._section_is_list = False
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        text = self.text
+        for index in range(self._position, len(text)):
+            self._step(text, index, text[index])
+        self._position = len(text)
+
+    def _step(self, text: str, index: int, char: str):
+        if not self._started:
+            if char == '{':
+                self._started = True
+                self._depth = 1
+                self._expect_key = True
+            return
+
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == '\\':
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                if self._key_start is not None:
+                    self._key = json.loads(text[self._key_start:index + 1])
+                    self._key_start = None
+            return
+
+        if self._depth == 2 and self._section_is_list and self._item_start is None and not char.isspace() \
+                and char not in ',]':
+            self._item_start = index
+
+        if char == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expect_key:
+                self._key_start = index
+                self._expect_key = False
+            elif self._depth == 1 and self._value_start is None:
+                self._value_start = index
+        elif char in '{[':
+            if self._depth == 1:
+                self._value_start = index
+                self._section_is_list = char == '['
+                self._item_start = None
+                self._item_index = 0
+            self._depth += 1
+        elif char in '}]':
+            if self._depth == 2 and self._section_is_list:
+                self._emit_item(text, index)
+            self._depth -= 1
+            if self._depth == 1:
+                self._emit_section(text, index + 1)
+            elif self._depth == 0:
+                self._emit_section(text, index)
+        elif char == ',':
+            if self._depth == 2 and self._section_is_list:
+                self._emit_item(text, index)
+            elif self._depth == 1:
+                self._emit_section(text, index)
+                self._expect_key = True
+        elif char == ':':
+            pass
+        elif self._depth == 1 and not char.isspace() and self._value_start is None and not self._expect_key:
+            # Start of a scalar top-level value
+            self._value_start = index
+
+    def _emit_item(self, text: str, end: int):
+        if self._item_start is None:
+            return
+        try:
+            value = json.loads(text[self._item_start:end])
+        except json.JSONDecodeError:
+            value = None
+        self._item_start = None
+        if value is not None:
+            self.on_event({'event': 'item', 'section': self._key, 'index': self._item_index, 'data': value})
+            self._item_index += 1
+
+    def _emit_section(self, text: str, end: int):
+        if self._value_start is None or self._key is None:
+            self._value_start = None
+            return
+        try:
+            value = json.loads(text[self._value_start:end])
+        except json.JSONDecodeError:
+            value = None
+        if value is not None:
+            self.on_event({'event': 'section', 'section': self._key, 'data': value})
+        self._value_start = None
+        self._section_is_list = False
@@ -0,0 +1,603 @@
+"""
+Shared HTTP client for OpenRouter chat completions
+"""
+
+import base64
+import json
+import os
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import RateLimiter, PRIORITY_INTERACTIVE
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# Rough token estimates used for client-side budgeting before the call
+CHARS_PER_TOKEN = 4
+FILE_PART_TOKENS = 2000
+
+# Raw bytes encoded per step when streaming a file into a request body
+# (a multiple of 3 so the base64 pieces concatenate without padding)
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+
+class LLMError(Exception):
+    """Raised when a completion request fails or returns an unusable response."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(LLMError):
+    """Raised without contacting the API while the circuit breaker is open."""
+
+    def __init__(self, message, retry_after: float = 0):
+        super().__init__(message, 503, retry_after)
+
+
+RETRYABLE_STATUS_CODES = (408, 409, 425, 429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter."""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """Seconds to wait before retry number ``attempt`` (1-based)."""
+        if retry_after is not None:
+            return min(max(retry_after, 0), self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def is_retryable(exc: LLMError) -> bool:
+        if isinstance(exc, CircuitOpenError):
+            return False
+        # Connection errors and timeouts carry no status code
+        return exc.status_code is None or exc.status_code in RETRYABLE_STATUS_CODES
+
+
+class CircuitBreaker:
+    """Stop calling an upstream that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    calls fail fast for ``reset_timeout`` seconds; then one trial call is let
+    through (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def before_call(self):
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            remaining = max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+        raise CircuitOpenError('LLM backend unavailable (circuit open)', retry_after=remaining)
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+
+
+def parse_retry_after(value) -> float | None:
+    """Seconds from a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(payload: dict) -> int:
+    """Estimate prompt plus completion tokens of a chat completion payload."""
+    chars = 0
+    files = 0
+    for message in payload.get('messages') or []:
+        content = message.get('content')
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                chars += len(part.get('text') or '')
+            else:
+                files += 1
+    return chars // CHARS_PER_TOKEN + files * FILE_PART_TOKENS + int(payload.get('max_tokens') or 0)
+
+
+class FileDataURL:
+    """A ``data:`` URL whose base64 payload is read from disk while sending.
+
+    Use it as a value in a request payload to attach a large file without
+    holding its encoded form in memory.
+    """
+
+    def __init__(self, path, mime_type: str = 'application/pdf'):
+        self.path = path
+        self.prefix = f"data:{mime_type};base64,".encode('ascii')
+
+    def __len__(self) -> int:
+        return len(self.prefix) + 4 * -(-os.path.getsize(self.path) // 3)
+
+    def chunks(self):
+        yield self.prefix
+        with open(self.path, 'rb') as handle:
+            while True:
+                chunk = handle.read(BASE64_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield base64.b64encode(chunk)
+
+
+class StreamingJSONBody:
+    """File-like JSON request body with ``FileDataURL`` values encoded lazily.
+
+    The length is known up front, so requests sends a plain
+    ``Content-Length`` body; ``seek(0)`` rewinds it for another attempt.
+    """
+
+    _PLACEHOLDER = re.compile(r'\\u0000file(\d+)\\u0000')
+
+    def __init__(self, payload: dict):
+        files = []
+
+        def placeholder(value):
+            if isinstance(value, FileDataURL):
+                files.append(value)
+                return f"\0file{len(files) - 1}\0"
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+        text = json.dumps(payload, default=placeholder)
+        pieces = self._PLACEHOLDER.split(text)
+        # split() alternates literal JSON text and captured file indexes
+        self._parts = [
+            files[int(piece)] if index % 2 else piece.encode('utf-8')
+            for index, piece in enumerate(pieces)
+        ]
+        self._length = sum(len(part) for part in self._parts)
+        self.seek(0)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        for part in self._parts:
+            if isinstance(part, FileDataURL):
+                yield from part.chunks()
+            elif part:
+                yield part
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1 and offset == 0:
+            return self._position
+        if (whence, offset) != (0, 0):
+            raise OSError("StreamingJSONBody can only be rewound")
+        self._chunks = iter(self)
+        self._current = memoryview(b'')
+        self._position = 0
+        return 0
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        pieces = []
+        wanted = self._length if size is None or size < 0 else size
+        while wanted > 0:
+            if not self._current:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._current = memoryview(chunk)
+            piece = self._current[:wanted]
+            self._current = self._current[len(piece):]
+            pieces.append(piece)
+            wanted -= len(piece)
+        data = b''.join(pieces)
+        self._position += len(data)
+        return data
+
+
+def has_file_data(payload) -> bool:
+    """Whether a payload contains ``FileDataURL`` values that must be streamed."""
+    if isinstance(payload, FileDataURL):
+        return True
+    if isinstance(payload, dict):
+        return any(has_file_data(value) for value in payload.values())
+    if isinstance(payload, list):
+        return any(has_file_data(value) for value in payload)
+    return False
+
+
+def iter_sse_data(lines):
+    """Yield the ``data`` payloads of a server-sent event stream.
+
+    Comment lines (OpenRouter sends ``: OPENROUTER PROCESSING`` keep-alives)
+    are skipped; multi-line data fields are joined with newlines.
+    """
+    data = []
+    for line in lines:
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield '\n'.join(data)
+                data = []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        if field == 'data':
+            data.append(value[1:] if value.startswith(' ') else value)
+    if data:
+        yield '\n'.join(data)
+
+
+def salvage_json(content: str) -> tuple:
+    """Parse the outermost JSON value in model output, repairing truncation.
+
+    Returns ``(value, complete, open_key)``. For a response cut off at the
+    token limit, ``value`` keeps every fully received top-level field and
+    array element (a half-written element is dropped), ``complete`` is
+    False and ``open_key`` names the top-level field that was cut, if any.
+    Raises ``json.JSONDecodeError`` when nothing can be recovered.
+    """
+    start = next((index for index, char in enumerate(content) if char in '{['), None)
+    if start is None:
+        raise json.JSONDecodeError("No JSON value found", content, 0)
+    try:
+        value, _ = json.JSONDecoder().raw_decode(content, start)
+        return value, True, None
+    except json.JSONDecodeError:
+        pass
+
+    # Remember every position where the text can be cut and closed again:
+    # after a complete element of a top-level array or a complete top-level
+    # field. Arrays nested deeper are never cut, so an element is kept whole
+    # or not at all.
+    cuts = []
+    stack = []
+    in_string = escaped = expect_key = False
+    key_start = None
+    top_key = None
+    for index in range(start, len(content)):
+        char = content[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if key_start is not None:
+                    try:
+                        top_key = json.loads(content[key_start:index + 1])
+                    except json.JSONDecodeError:
+                        top_key = None
+                    key_start = None
+            continue
+        if char == '"':
+            in_string = True
+            if expect_key and len(stack) == 1:
+                key_start = index
+                expect_key = False
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+            expect_key = char == '{' and len(stack) == 1
+            if char == '[' and len(stack) == 2:
+                cuts.append((index + 1, ''.join(reversed(stack)), top_key))
+        elif char in '}]':
+            if not stack or stack.pop() != char:
+                break
+            if not stack:
+                break
+            if len(stack) == 1 or (len(stack) == 2 and stack[-1] == ']'):
+                cuts.append((index + 1, ''.join(reversed(stack)), top_key if len(stack) > 1 else None))
+        elif char == ',':
+            if len(stack) == 1 or (len(stack) == 2 and stack[-1] == ']'):
+                cuts.append((index, ''.join(reversed(stack)), top_key if len(stack) > 1 else None))
+            expect_key = len(stack) == 1
+
+    for position, closers, open_key in reversed(cuts):
+        try:
+            return json.loads(content[start:position] + closers), False, open_key
+        except json.JSONDecodeError:
+            continue
+    raise json.JSONDecodeError("Unrecoverable JSON", content, start)
+
+
+def message_content(result: dict) -> str:
+    """Return the text of the first choice of a completion response."""
+    try:
+        return result['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        raise LLMError('No response from API')
+
+
+class OpenRouterClient:
+    """Keep-alive connection pool shared by every OpenRouter call.
+
+    One ``requests.Session`` is reused so TCP and TLS handshakes are paid once
+    per pooled connection instead of once per request. Throttling, server
+    errors and network failures are retried according to ``retry_policy``;
+    persistent failures open ``breaker`` so callers fail fast. Every attempt
+    first takes a request and its estimated tokens from ``rate_limiter``.
+    """
+
+    def __init__(self, api_key: str, pool_size: int = 10, connect_timeout: float = 10,
+                 url: str = OPENROUTER_URL, referer: str = "http://localhost",
+                 retry_policy: RetryPolicy = None, breaker: CircuitBreaker = None,
+                 rate_limiter: RateLimiter = None, sleep=time.sleep):
+        self.api_key = api_key
+        self.url = url
+        self.referer = referer
+        self.pool_size = max(1, pool_size)
+        self.connect_timeout = connect_timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._sleep = sleep
+        self._session = self._build_session()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'requests': 0,
+            'failures': 0,
+            'retries': 0,
+            'backoff_seconds': 0.0,
+            'rejected_by_breaker': 0,
+            'rate_limit_wait_seconds': 0.0
+        }
+
+    def _count(self, name: str, amount=1):
+        with self._metrics_lock:
+            self._metrics[name] += amount
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            data = dict(self._metrics)
+        data['backoff_seconds'] = round(data['backoff_seconds'], 3)
+        data['rate_limit_wait_seconds'] = round(data['rate_limit_wait_seconds'], 3)
+        data['rate_limiter'] = self.rate_limiter.stats()
+        data['breaker_state'] = self.breaker.state
+        data['breaker_opened'] = self.breaker.times_opened
+        return data
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def headers(self, title: str) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": self.referer,
+            "X-Title": title
+        }
+
+    def complete(self, payload: dict, title: str, read_timeout: float,
+                 priority: int = PRIORITY_INTERACTIVE, estimated_tokens: int = None) -> dict:
+        """POST a chat completion and return the decoded response body.
+
+        Raises ``CircuitOpenError`` without a network call while the breaker
+        is open, and ``LLMError`` once retries are exhausted.
+        """
+        if estimated_tokens is None:
+            estimated_tokens = estimate_tokens(payload)
+        result = self._send_with_retries(
+            lambda: self._post_once(payload, title, read_timeout), estimated_tokens, priority
+        )
+        usage = result.get('usage') if isinstance(result, dict) else None
+        if isinstance(usage, dict):
+            self.rate_limiter.record_usage(estimated_tokens, usage.get('total_tokens'))
+        return result
+
+    def stream(self, payload: dict, title: str, read_timeout: float,
+               priority: int = PRIORITY_INTERACTIVE, estimated_tokens: int = None):
+        """POST a streaming chat completion and yield content deltas as they arrive.
+
+        Retries and the circuit breaker apply until the response starts;
+        an error reported mid-stream raises ``LLMError``. ``read_timeout``
+        bounds the wait for each chunk, not the whole response.
+        """
+        if estimated_tokens is None:
+            estimated_tokens = estimate_tokens(payload)
+        payload = dict(payload, stream=True)
+        response = self._send_with_retries(
+            lambda: self._open_stream(payload, title, read_timeout), estimated_tokens, priority
+        )
+        try:
+            for data in iter_sse_data(response.iter_lines(decode_unicode=True)):
+                if data == '[DONE]':
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if chunk.get('error'):
+                    self._count('failures')
+                    error = chunk['error']
+                    raise LLMError(f"Stream failed: {error.get('message') if isinstance(error, dict) else error}")
+                usage = chunk.get('usage')
+                if isinstance(usage, dict):
+                    self.rate_limiter.record_usage(estimated_tokens, usage.get('total_tokens'))
+                for choice in chunk.get('choices') or []:
+                    delta = (choice.get('delta') or {}).get('content')
+                    if delta:
+                        yield delta
+        except requests.exceptions.RequestException as e:
+            self._count('failures')
+            raise LLMError(f"Stream interrupted: {e}")
+        finally:
+            response.close()
+
+    def _send_with_retries(self, send, estimated_tokens: int, priority: int):
+        attempt = 1
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._count('rejected_by_breaker')
+                raise
+
+            self._count('rate_limit_wait_seconds', self.rate_limiter.acquire(estimated_tokens, priority))
+            try:
+                result = send()
+            except LLMError as exc:
+                retryable = self.retry_policy.is_retryable(exc)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # Client errors say nothing about upstream health
+                    self.breaker.record_success()
+                self._count('failures')
+                if not retryable or attempt >= self.retry_policy.max_attempts:
+                    raise
+                delay = self.retry_policy.delay(attempt, exc.retry_after)
+                print(f"LLM request failed ({exc}); retry {attempt} in {delay:.1f}s")
+                self._count('retries')
+                self._count('backoff_seconds', delay)
+                self._sleep(delay)
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def _post_once(self, payload: dict, title: str, read_timeout: float) -> dict:
+        self._count('requests')
+        if has_file_data(payload):
+            # Large attachments are encoded from disk as the body is sent
+            body = {'data': StreamingJSONBody(payload)}
+        else:
+            body = {'json': payload}
+        try:
+            response = self._session.post(
+                self.url,
+                headers=self.headers(title),
+                timeout=(self.connect_timeout, read_timeout),
+                **body
+            )
+        except requests.exceptions.Timeout:
+            raise LLMError(f"API request timed out after {read_timeout} seconds")
+        except requests.exceptions.RequestException as e:
+            raise LLMError(f"API request failed: {e}")
+
+        if response.status_code != 200:
+            raise LLMError(
+                f"API request failed: {response.status_code} - {response.text}",
+                response.status_code,
+                parse_retry_after(response.headers.get('Retry-After'))
+            )
+
+        try:
+            return response.json()
+        except ValueError:
+            raise LLMError(f"API returned invalid JSON: {response.text[:200]}", response.status_code)
+
+    def _open_stream(self, payload: dict, title: str, read_timeout: float):
+        self._count('requests')
+        try:
+            response = self._session.post(
+                self.url,
+                headers=self.headers(title),
+                data=StreamingJSONBody(payload),
+                timeout=(self.connect_timeout, read_timeout),
+                stream=True
+            )
+        except requests.exceptions.Timeout:
+            raise LLMError(f"API request timed out after {read_timeout} seconds")
+        except requests.exceptions.RequestException as e:
+            raise LLMError(f"API request failed: {e}")
+
+        if response.status_code != 200:
+            text = response.text
+            response.close()
+            raise LLMError(
+                f"API request failed: {response.status_code} - {text}",
+                response.status_code,
+                parse_retry_after(response.headers.get('Retry-After'))
+            )
+        # text/event-stream has no charset, which requests would read as Latin-1
+        response.encoding = 'utf-8'
+        return response
+
+    def chat(self, messages: list, title: str, read_timeout: float, model: str, max_tokens: int,
+             temperature: float = 0, priority: int = PRIORITY_INTERACTIVE, **extra) -> str:
+        """Send ``messages`` and return the text of the first choice."""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        payload.update(extra)
+        return message_content(self.complete(payload, title, read_timeout, priority=priority))
+
+    def close(self):
+        self._session.close()
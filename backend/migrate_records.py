@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Reconcile legacy records/passport_<id>.json files into the database
+
+Older versions kept every record twice: in SQLite and as JSON files that
+the API preferred when reading. This folds the files into the database,
+which is now the only store:
+
+- passport_<id>.json: the edited data wins over a differing database row
+  (it is what the API served); page metadata of the row is kept.
+- passport_<id>_translated.json: becomes the record's ``translated_data``.
+
+    python migrate_records.py --dry-run
+    python migrate_records.py --remove-files
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+import app as passx
+from app import PassportRecord
+
+LEGACY_FILE_PATTERN = re.compile(r'^passport_(\d+)(_translated)?\.json$')
+COMMIT_EVERY = 100
+
+
+def legacy_files(directory: Path) -> list:
+    """``(record_id, translated, path)`` for the flat legacy files, by record id."""
+    found = []
+    for path in Path(directory).glob('passport_*.json'):
+        match = LEGACY_FILE_PATTERN.match(path.name)
+        if match:
+            found.append((int(match.group(1)), bool(match.group(2)), path))
+    return sorted(found, key=lambda item: (item[0], item[1]))
+
+
+def without_pages(data: dict) -> dict:
+    return {key: value for key, value in (data or {}).items() if key not in ('pages', 'record_id')}
+
+
+def reconcile_file(session, record_id: int, translated: bool, content, summary: dict, write: bool = True) -> bool:
+    """Fold one parsed legacy file into its record; False when the record is gone.
+
+    With ``write`` False only ``summary`` is updated.
+    """
+    record = session.get(PassportRecord, record_id)
+    if record is None:
+        summary['orphans'] += 1
+        return False
+
+    if translated:
+        if record.translated_data == content:
+            summary['unchanged'] += 1
+            return True
+        if write:
+            record.translated_data = content
+        summary['translations'] += 1
+    elif without_pages(record.data) != without_pages(content):
+        if write:
+            stored = without_pages(content)
+            if (record.data or {}).get('pages'):
+                stored['pages'] = record.data['pages']
+            record.data = stored
+            passx.apply_record_fields(record, stored)
+            session.flush()
+            passx.index_record(session, record)
+        summary['updated'] += 1
+    else:
+        summary['unchanged'] += 1
+    return True
+
+
+def reconcile(directory: Path, dry_run: bool = False, remove_files: bool = False,
+              remove_orphans: bool = False) -> dict:
+    summary = {'files': 0, 'updated': 0, 'translations': 0, 'unchanged': 0, 'orphans': 0, 'unreadable': 0, 'removed': 0}
+    removable = []
+    files = legacy_files(directory)
+    for offset in range(0, len(files), COMMIT_EVERY):
+        # Files are read before the write lock is taken, and every chunk is
+        # its own short transaction so the running service keeps writing
+        parsed = []
+        for record_id, translated, path in files[offset:offset + COMMIT_EVERY]:
+            summary['files'] += 1
+            try:
+                parsed.append((record_id, translated, path, json.loads(path.read_text(encoding='utf-8'))))
+            except (OSError, ValueError) as exc:
+                print(f"⚠️ Skipping unreadable {path.name}: {exc}")
+                summary['unreadable'] += 1
+
+        def apply_chunk(session):
+            chunk_summary = dict.fromkeys(summary, 0)
+            chunk_removable = []
+            for record_id, translated, path, content in parsed:
+                exists = reconcile_file(session, record_id, translated, content, chunk_summary, write=not dry_run)
+                if (exists and remove_files) or (not exists and remove_orphans):
+                    chunk_removable.append(path)
+            return chunk_summary, chunk_removable
+
+        if dry_run:
+            # Read-only: nothing is written, so no write lock is taken
+            session = passx.SessionLocal()
+            try:
+                chunk_summary, _ = apply_chunk(session)
+                session.rollback()
+            finally:
+                session.close()
+        else:
+            chunk_summary, chunk_removable = passx.write_batcher.run(apply_chunk)
+            removable.extend(chunk_removable)
+        for key in ('updated', 'translations', 'unchanged', 'orphans'):
+            summary[key] += chunk_summary[key]
+
+    # Files go only once their content is committed
+    for path in removable:
+        path.unlink(missing_ok=True)
+        summary['removed'] += 1
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Fold legacy per-record JSON files into the database.')
+    parser.add_argument('--records-dir', type=Path, default=passx.RECORDS_DIR,
+                        help=f'Directory with passport_<id>.json files (default: {passx.RECORDS_DIR})')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+    parser.add_argument('--remove-files', action='store_true', help='Delete files once reconciled')
+    parser.add_argument('--remove-orphans', action='store_true', help='Delete files whose record no longer exists')
+    args = parser.parse_args(argv)
+
+    if not args.records_dir.is_dir():
+        print(f"Nothing to migrate: {args.records_dir} does not exist")
+        return 0
+
+    summary = reconcile(args.records_dir, args.dry_run, args.remove_files, args.remove_orphans)
+    prefix = 'Would reconcile' if args.dry_run else 'Reconciled'
+    print(
+        f"📦 {prefix} {summary['files']} files: {summary['updated']} records updated, "
+        f"{summary['translations']} translations stored, {summary['unchanged']} unchanged, "
+        f"{summary['orphans']} orphans, {summary['unreadable']} unreadable, {summary['removed']} files removed"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
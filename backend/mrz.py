@@ -0,0 +1,175 @@
+"""
+ICAO 9303 TD3 (passport) machine readable zone parsing and validation
+"""
+
+import datetime
+import re
+
+TD3_LINE_LENGTH = 44
+CHECK_WEIGHTS = (7, 3, 1)
+
+# Characters OCR and models commonly return in place of the '<' filler
+FILLER_VARIANTS = str.maketrans({'«': '<', '‹': '<', '〈': '<', ' ': ''})
+
+DATE_PATTERN = re.compile(r'^(\d{1,2})[./ -](\d{1,2})[./ -](\d{2,4})$')
+ISO_DATE_PATTERN = re.compile(r'^(\d{4})[./-](\d{1,2})[./-](\d{1,2})$')
+
+
+def check_digit(value: str) -> int:
+    """ICAO 9303 check digit: weights 7, 3, 1 over digits, letters (A=10) and fillers (0)."""
+    total = 0
+    for index, char in enumerate(value):
+        if char.isdigit():
+            number = int(char)
+        elif 'A' <= char <= 'Z':
+            number = ord(char) - ord('A') + 10
+        else:
+            number = 0
+        total += number * CHECK_WEIGHTS[index % 3]
+    return total % 10
+
+
+def normalize_line(line) -> str:
+    """Uppercase an MRZ line, drop spaces and pad short lines with fillers."""
+    text = str(line or '').upper().translate(FILLER_VARIANTS)
+    if len(text) < TD3_LINE_LENGTH:
+        text = text.ljust(TD3_LINE_LENGTH, '<')
+    return text
+
+
+def mrz_date(value: str, future: bool) -> str | None:
+    """Convert YYMMDD to DD.MM.YYYY; ``future`` picks the century for expiry dates."""
+    if not re.fullmatch(r'\d{6}', value):
+        return None
+    year, month, day = int(value[:2]), int(value[2:4]), int(value[4:])
+    current = datetime.date.today().year % 100
+    if future:
+        century = 2000 if year < 70 else 1900
+    else:
+        century = 1900 if year > current else 2000
+    try:
+        return datetime.date(century + year, month, day).strftime('%d.%m.%Y')
+    except ValueError:
+        return None
+
+
+def _check(field: str, value: str, digit: str, errors: list, optional: bool = False) -> bool:
+    if optional and value.strip('<') == '' and digit in ('<', '0'):
+        return True
+    if not digit.isdigit() or check_digit(value) != int(digit):
+        errors.append(f"{field} check digit mismatch")
+        return False
+    return True
+
+
+def parse_td3(line1, line2) -> dict:
+    """Parse and validate a two-line TD3 MRZ.
+
+    Returns the decoded fields together with ``errors`` (empty when every
+    check digit matches) and ``valid``.
+    """
+    line1, line2 = normalize_line(line1), normalize_line(line2)
+    errors = []
+    if len(line1) != TD3_LINE_LENGTH or len(line2) != TD3_LINE_LENGTH:
+        errors.append(f"MRZ lines must be {TD3_LINE_LENGTH} characters")
+    if not re.fullmatch(r'[A-Z0-9<]*', line1 + line2):
+        errors.append("MRZ contains characters other than A-Z, 0-9 and '<'")
+    if not line1.startswith('P'):
+        errors.append("MRZ line 1 does not start with 'P'")
+    if errors:
+        return {'valid': False, 'errors': errors}
+
+    names = line1[5:].rstrip('<')
+    surname, _, given = names.partition('<<')
+    number = line2[0:9]
+    birth = line2[13:19]
+    expiry = line2[21:27]
+    personal = line2[28:42]
+
+    _check('passport number', number, line2[9], errors)
+    _check('date of birth', birth, line2[19], errors)
+    _check('expiry date', expiry, line2[27], errors)
+    _check('personal number', personal, line2[42], errors, optional=True)
+    _check('composite', line2[0:10] + line2[13:20] + line2[21:43], line2[43], errors)
+
+    fields = {
+        'document_type': line1[0:2].rstrip('<'),
+        'issuing_country': line1[2:5].rstrip('<'),
+        'surname': surname.replace('<', ' ').strip(),
+        'given_names': given.replace('<', ' ').strip(),
+        'passport_number': number.rstrip('<'),
+        'nationality': line2[10:13].rstrip('<'),
+        'date_of_birth': mrz_date(birth, future=False),
+        'sex': {'M': 'M', 'F': 'F'}.get(line2[20], 'X'),
+        'expiry_date': mrz_date(expiry, future=True),
+        'personal_number': personal.rstrip('<')
+    }
+    for key in ('date_of_birth', 'expiry_date'):
+        if fields[key] is None:
+            errors.append(f"{key.replace('_', ' ')} is not a valid date")
+    fields['errors'] = errors
+    fields['valid'] = not errors
+    return fields
+
+
+def normalize_date(value) -> str | None:
+    """Bring a printed date to DD.MM.YYYY when it is purely numeric."""
+    text = str(value or '').strip()
+    match = ISO_DATE_PATTERN.match(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = DATE_PATTERN.match(text)
+        if not match:
+            return None
+        day, month, year = match.groups()
+        if len(year) == 2:
+            return None
+    return f"{int(day):02d}.{int(month):02d}.{year}"
+
+
+def _letters(value) -> str:
+    return re.sub(r'[^A-Z]', '', str(value or '').upper())
+
+
+def cross_check(fields: dict, bio: dict) -> list:
+    """Compare fields decoded from a valid MRZ with the printed biographical data."""
+    mismatches = []
+    number = re.sub(r'[^A-Z0-9]', '', str(bio.get('passport_number') or '').upper())
+    if number and number != fields['passport_number']:
+        mismatches.append(f"passport number '{bio.get('passport_number')}' != MRZ '{fields['passport_number']}'")
+
+    for key in ('date_of_birth', 'expiry_date'):
+        printed = normalize_date(bio.get(key))
+        if printed and fields[key] and printed != fields[key]:
+            mismatches.append(f"{key.replace('_', ' ')} '{bio.get(key)}' != MRZ '{fields[key]}'")
+
+    gender = str(bio.get('gender') or '').strip().upper()[-1:]
+    if gender in ('M', 'F') and fields['sex'] in ('M', 'F') and gender != fields['sex']:
+        mismatches.append(f"gender '{bio.get('gender')}' != MRZ '{fields['sex']}'")
+
+    # Names are transliterated in the MRZ; only check the surname is there
+    full_name = _letters(bio.get('full_name') or bio.get('surname'))
+    surname = _letters(fields['surname'])
+    if full_name and surname and surname not in full_name:
+        mismatches.append(f"surname '{fields['surname']}' from MRZ not found in '{bio.get('full_name')}'")
+    return mismatches
+
+
+def check_passport_mrz(passport_data: dict) -> dict:
+    """Validate the MRZ of extracted passport data against its biographical page.
+
+    Returns ``{'present', 'valid', 'fields', 'errors', 'mismatches'}``;
+    ``present`` means both MRZ lines were extracted, ``valid`` that they
+    also parse and all their check digits match.
+    """
+    mrz = passport_data.get('mrz') or {}
+    bio = passport_data.get('biographical_page') or {}
+    if not isinstance(mrz, dict) or not (mrz.get('mrz_line1') and mrz.get('mrz_line2')):
+        return {'present': False, 'valid': False, 'fields': None, 'errors': ['MRZ is missing'], 'mismatches': []}
+
+    fields = parse_td3(mrz['mrz_line1'], mrz['mrz_line2'])
+    if not fields['valid']:
+        return {'present': True, 'valid': False, 'fields': None, 'errors': fields['errors'], 'mismatches': []}
+    mismatches = cross_check(fields, bio if isinstance(bio, dict) else {})
+    return {'present': True, 'valid': True, 'fields': fields, 'errors': [], 'mismatches': mismatches}
@@ -0,0 +1,126 @@
+"""
+Client-side request and token budget for the OpenRouter API
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 5
+PRIORITY_BULK = 10
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a caller could not get a slot within its timeout."""
+
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute.
+
+    Callers block in :meth:`acquire` until both buckets can cover the
+    request. Waiters are served strictly by priority (lower value first),
+    then in arrival order, so interactive work overtakes queued bulk work.
+    A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, clock=time.monotonic):
+        self.requests_per_minute = max(0, requests_per_minute)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._requests = float(self.requests_per_minute)
+        self._tokens = float(self.tokens_per_minute)
+        self._updated = clock()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._granted = 0
+        self._waited_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _seconds_until_available(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, tokens: int = 0, priority: int = PRIORITY_INTERACTIVE, timeout: float = None) -> float:
+        """Reserve one request and ``tokens`` tokens; return seconds waited."""
+        if not self.enabled:
+            return 0.0
+        if self.tokens_per_minute:
+            # A single oversized request may use at most a full minute of budget
+            tokens = min(max(0, int(tokens)), self.tokens_per_minute)
+
+        started = self._clock()
+        entry = [priority, next(self._sequence)]
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    self._refill()
+                    wait = None
+                    if self._waiters[0] is entry:
+                        wait = self._seconds_until_available(tokens)
+                        if wait <= 0:
+                            heapq.heappop(self._waiters)
+                            if self.requests_per_minute:
+                                self._requests -= 1
+                            if self.tokens_per_minute:
+                                self._tokens -= tokens
+                            waited = self._clock() - started
+                            self._granted += 1
+                            self._waited_seconds += waited
+                            self._cond.notify_all()
+                            return waited
+
+                    if timeout is not None:
+                        remaining = timeout - (self._clock() - started)
+                        if remaining <= 0:
+                            raise RateLimitTimeout(f"No rate limit slot within {timeout} seconds")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the real usage of a call is known."""
+        if not self.tokens_per_minute or actual_tokens is None:
+            return
+        estimated_tokens = min(max(0, int(estimated_tokens)), self.tokens_per_minute)
+        with self._cond:
+            self._refill()
+            self._tokens = min(self.tokens_per_minute, self._tokens + estimated_tokens - actual_tokens)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill()
+            return {
+                'requests_per_minute': self.requests_per_minute,
+                'tokens_per_minute': self.tokens_per_minute,
+                'available_requests': round(self._requests, 2),
+                'available_tokens': int(self._tokens),
+                'waiting': len(self._waiters),
+                'granted': self._granted,
+                'waited_seconds': round(self._waited_seconds, 3)
+            }
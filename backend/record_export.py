@@ -0,0 +1,114 @@
+"""
+Optional JSON export of passport records for audit and backups
+"""
+
+import json
+import os
+import queue
+import tempfile
+import threading
+from pathlib import Path
+
+# Records per export directory, so no single directory grows unbounded
+SHARD_SIZE = 1000
+
+KIND_DATA = 'data'
+KIND_TRANSLATED = 'translated'
+
+
+def shard_directory(root: Path, record_id: int) -> Path:
+    return Path(root) / f"{record_id // SHARD_SIZE:05d}"
+
+
+def export_path(root: Path, record_id: int, kind: str = KIND_DATA) -> Path:
+    suffix = '_translated' if kind == KIND_TRANSLATED else ''
+    return shard_directory(root, record_id) / f"passport_{record_id}{suffix}.json"
+
+
+def write_text_atomic(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', dir=path.parent, prefix='.export-', suffix='.tmp', delete=False
+    )
+    try:
+        with handle:
+            handle.write(content)
+        os.replace(handle.name, path)
+    except BaseException:
+        Path(handle.name).unlink(missing_ok=True)
+        raise
+
+
+class RecordExporter:
+    """Write JSON copies of records on a background thread.
+
+    The database stays the only source of truth; exports are never read
+    back by the service. Repeated writes of the same file before the
+    thread gets to it collapse into one write of the latest version, and
+    a failed write is logged and dropped. Files are spread over
+    ``SHARD_SIZE``-record subdirectories of ``root``.
+    """
+
+    def __init__(self, root: Path, enabled: bool = True):
+        self.root = Path(root)
+        self.enabled = enabled
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self.written = 0
+        self.failed = 0
+
+    def path(self, record_id: int, kind: str = KIND_DATA) -> Path:
+        return export_path(self.root, record_id, kind)
+
+    def write(self, record_id: int, data: dict, kind: str = KIND_DATA):
+        """Queue an export of ``data``; ``None`` removes the file instead.
+
+        ``data`` is serialized right away, so the caller may keep changing it.
+        """
+        if not self.enabled:
+            return
+        content = None if data is None else json.dumps(data, ensure_ascii=False, indent=2)
+        key = (record_id, kind)
+        with self._lock:
+            queued = key in self._pending
+            self._pending[key] = content
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='record-export', daemon=True)
+                self._thread.start()
+        if not queued:
+            self._queue.put(key)
+
+    def delete(self, record_id: int):
+        for kind in (KIND_DATA, KIND_TRANSLATED):
+            self.write(record_id, None, kind)
+
+    def flush(self, timeout: float = None):
+        """Block until every queued export has been written."""
+        if self.enabled:
+            with self._queue.all_tasks_done:
+                self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {'enabled': self.enabled, 'pending': pending, 'written': self.written, 'failed': self.failed}
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                with self._lock:
+                    content = self._pending.pop(key)
+                path = self.path(*key)
+                if content is None:
+                    path.unlink(missing_ok=True)
+                else:
+                    write_text_atomic(path, content)
+                self.written += 1
+            except Exception as exc:
+                self.failed += 1
+                print(f"Failed to export record {key[0]} ({key[1]}): {exc}")
+            finally:
+                self._queue.task_done()
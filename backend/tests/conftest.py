@@ -0,0 +1,20 @@
+"""
+Test setup shared by every test module, run by pytest before any of them imports app
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+# Keep the tests' database, caches and stored uploads out of the backend directory
+TEST_STATE_DIR = tempfile.mkdtemp(prefix='passx-tests-')
+atexit.register(shutil.rmtree, TEST_STATE_DIR, ignore_errors=True)
+for name, default in (
+    ('DATABASE_PATH', 'passports.db'),
+    ('LLM_CACHE_PATH', 'llm_cache.db'),
+    ('SOURCES_DIR', 'sources'),
+    ('RENDER_CACHE_DIR', 'render_cache'),
+    ('RECORD_EXPORT_DIR', 'records')
+):
+    os.environ.setdefault(name, os.path.join(TEST_STATE_DIR, default))
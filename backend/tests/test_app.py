@@ -1,13 +1,21 @@
 import unittest
 import sys
 import os
+import tempfile
+import io
 import json
+import threading
+import time
+import zipfile
 from pathlib import Path
+from unittest import mock
 
 # Add backend directory to path to import app
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
-from app import normalize_value, normalize_dict_section, extract_placeholder_payload, app, engine, Base, SessionLocal, PassportRecord
+import app as app_module
+from job_queue import Job
+from app import normalize_value, normalize_dict_section, extract_placeholder_payload, extract_pages_from_pdf, app, engine, Base, SessionLocal, PassportRecord
 
 class TestPassportHelpers(unittest.TestCase):
     def test_normalize_value_string(self):
@@ -48,6 +56,140 @@ class TestPassportHelpers(unittest.TestCase):
         self.assertEqual(payload["givenNames"], "JOHN")
         self.assertEqual(payload["mrzLine1"], "L1")
 
+    def test_extract_pages_reads_metadata_without_rendering(self):
+        import PyPDF2
+        writer = PyPDF2.PdfWriter()
+        writer.add_blank_page(width=595, height=842)
+        writer.add_blank_page(width=595, height=842)
+        writer.pages[1].rotate(90)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+
+        with mock.patch.object(app_module, 'convert_from_bytes') as convert:
+            pages = extract_pages_from_pdf(buffer.getvalue())
+        convert.assert_not_called()
+
+        self.assertEqual([page['page_number'] for page in pages], [1, 2])
+        self.assertEqual((pages[0]['width'], pages[0]['height']), (595, 842))
+        self.assertEqual((pages[1]['width'], pages[1]['height'], pages[1]['rotation']), (842, 595, 90))
+
+    def test_extract_pages_invalid_pdf(self):
+        self.assertEqual(extract_pages_from_pdf(b'not a pdf'), [])
+
+    def test_spool_upload_hashes_while_copying(self):
+        import hashlib
+        content = b'%PDF-1.4 ' + b'x' * 3000
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(app_module, 'SOURCES_DIR', Path(tmp)), \
+                mock.patch.object(app_module, 'UPLOAD_CHUNK_SIZE', 1024):
+            file_hash, path = app_module.spool_upload(io.BytesIO(content))
+            self.assertEqual(file_hash, hashlib.sha256(content).hexdigest())
+            self.assertEqual(path.read_bytes(), content)
+
+            with self.assertRaises(app_module.UploadRejected):
+                app_module.spool_upload(io.BytesIO(content), max_size=2048)
+            with self.assertRaises(app_module.UploadRejected):
+                app_module.spool_upload(io.BytesIO(b'not a pdf'))
+            self.assertEqual(list(Path(tmp).iterdir()), [path])
+
+
+class TestTranslationCache(unittest.TestCase):
+    def setUp(self):
+        from response_cache import ResponseCache
+        from translation_memory import TranslationMemory
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patchers = [
+            mock.patch.object(app_module, 'response_cache', ResponseCache(Path(self.tmp.name) / 'cache.db')),
+            mock.patch.object(app_module, 'translation_memory', TranslationMemory(Path(self.tmp.name) / 'tm.db'))
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_identical_documents_translate_once(self):
+        data = {'biographical_page': {'nationality': 'ITALY'}, 'visas': []}
+        with mock.patch.object(app_module.llm_client, 'chat', return_value='{"0": "ИТАЛИЯ"}') as chat:
+            first = app_module.translate_passport_data(dict(data, record_id=1))
+            second = app_module.translate_passport_data(dict(data, record_id=2, pages=[{'page_number': 1}]))
+
+        chat.assert_called_once()
+        self.assertEqual(first['biographical_page'], second['biographical_page'])
+        self.assertNotIn('pages', second)
+
+    def test_only_unseen_values_reach_the_model(self):
+        first = {
+            'biographical_page': {'nationality': 'ITALY', 'date_of_birth': '1990/01/31', 'passport_number': 'YA1234567'},
+            'mrz': {'mrz_line1': 'P<ITAROSSI<<MARIO'},
+            'stamps': [{'country': 'Italy', 'type': 'entry'}]
+        }
+        second = {
+            'biographical_page': {'nationality': 'ITALY', 'issuing_authority': 'MINISTERO'},
+            'stamps': [{'country': 'ITALY', 'type': 'exit'}]
+        }
+        with mock.patch.object(app_module.llm_client, 'chat', side_effect=['{"0": "ИТАЛИЯ"}', '{"0": "МИНИСТЕРСТВО"}']) as chat:
+            translated = app_module.translate_passport_data(first)
+            translated_second = app_module.translate_passport_data(second)
+
+        self.assertEqual(chat.call_count, 2)
+        self.assertEqual(json.loads(chat.call_args_list[0].args[0][1]['content']), {'0': 'ITALY'})
+        self.assertEqual(json.loads(chat.call_args_list[1].args[0][1]['content']), {'0': 'MINISTERO'})
+        self.assertEqual(translated['biographical_page']['date_of_birth'], '31.01.1990')
+        self.assertEqual(translated['biographical_page']['passport_number'], 'YA1234567')
+        self.assertEqual(translated['mrz'], first['mrz'])
+        self.assertEqual(translated['stamps'][0], {'country': 'ИТАЛИЯ', 'type': 'въезд'})
+        self.assertEqual(translated_second['stamps'][0], {'country': 'ИТАЛИЯ', 'type': 'выезд'})
+
+    def test_template_payload_cached(self):
+        payload = {'surname': 'DOE', 'mrzLine1': 'P<DOE'}
+        with mock.patch.object(app_module.llm_client, 'chat', return_value='{"0": "ДОУ"}') as chat:
+            app_module.translate_payload_for_template(payload)
+            translated = app_module.translate_payload_for_template(payload)
+
+        chat.assert_called_once()
+        self.assertEqual(translated, {'surname': 'ДОУ', 'mrzLine1': 'P<DOE'})
+
+    def test_failed_translation_is_not_used_or_cached(self):
+        record = app_module.save_passport_record('failed_translation.pdf', {'biographical_page': {'surname': 'ROSSI'}})
+        self.addCleanup(app_module.delete_passport_record, record.id)
+        app.config['TESTING'] = True
+
+        with mock.patch.object(app_module.llm_client, 'chat', side_effect=RuntimeError('model down')), \
+                mock.patch.object(app_module, 'generate_passport_report', return_value=io.BytesIO(b'docx')) as report:
+            self.assertIsNone(app_module.schedule_translation(record.id, record.data).result(timeout=5))
+            response = app.test_client().get(f'/api/passports/{record.id}/report')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(report.call_args.args[0], record.data)
+        self.assertIsNone(app_module.load_translated_data(record.id))
+        self.assertNotIn(record.id, app_module.pending_translations)
+
+    def test_edit_translates_only_changed_fields(self):
+        previous = {
+            'biographical_page': {'surname': 'ROSSI', 'place_of_birth': 'ROMA'},
+            'visas': [{'country': 'INDIA'}],
+            'pages': [{'page_number': 1}]
+        }
+        translated = {'biographical_page': {'surname': 'РОССИ', 'place_of_birth': 'РИМ'}, 'visas': [{'country': 'ИНДИЯ'}]}
+        current = {
+            'biographical_page': {'surname': 'ROSSI', 'place_of_birth': 'MILANO', 'date_of_birth': '1990-01-31'},
+            'visas': [{'country': 'INDIA'}],
+            'pages': [{'page_number': 1}]
+        }
+        with mock.patch.object(app_module.llm_client, 'chat', return_value='{"0": "МИЛАН"}') as chat:
+            patched = app_module.patch_translation(previous, current, translated)
+
+        chat.assert_called_once()
+        self.assertEqual(json.loads(chat.call_args.args[0][1]['content']), {'0': 'MILANO'})
+        self.assertEqual(patched, {
+            'biographical_page': {'surname': 'РОССИ', 'place_of_birth': 'МИЛАН', 'date_of_birth': '31.01.1990'},
+            'visas': [{'country': 'ИНДИЯ'}]
+        })
+
+
 class TestDatabase(unittest.TestCase):
     def setUp(self):
         # Use in-memory database for testing
@@ -80,5 +222,768 @@ class TestDatabase(unittest.TestCase):
         self.assertIsNotNone(saved)
         self.assertEqual(saved.full_name, "TEST USER")
 
+    def test_record_and_translation_live_in_the_database(self):
+        record = app_module.save_passport_record("test_passport.pdf", {
+            "biographical_page": {"full_name": "STORE TEST"}, "pages": [{"page_number": 1}]
+        })
+        self.assertFalse(app_module.has_translated_data(record.id))
+        app_module.save_translated_data(record.id, {"biographical_page": {"full_name": "СТОР ТЕСТ"}})
+        self.assertTrue(app_module.has_translated_data(record.id))
+        self.assertTrue(app_module.ensure_translation(record.id, {}).done())
+
+        body = self.app.get(f'/api/passports/{record.id}').get_json()
+        self.assertEqual(body['data'], {"biographical_page": {"full_name": "STORE TEST"}, "record_id": record.id})
+        self.assertIsNone(body['json_path'])
+        self.assertEqual(app_module.load_translated_data(record.id)["biographical_page"]["full_name"], "СТОР ТЕСТ")
+
+class TestPassportSearch(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.records = [
+            app_module.save_passport_record('search_one.pdf', {
+                'biographical_page': {'full_name': 'QWERTYNAME ALPHA / КВЕРТИ', 'passport_number': 'ZX9917001',
+                                      'nationality': 'Tajikistan', 'expiry_date': '15.03.2026'},
+                'visas': [{'country': 'UNITED ARAB EMIRATES'}],
+                'stamps': [{'country': 'TURKEY'}]
+            }, 'f1' * 32),
+            app_module.save_passport_record('search_two.pdf', {
+                'biographical_page': {'full_name': 'QWERTYNAME BETA', 'passport_number': 'ZX9917002',
+                                      'nationality': 'UZBEKISTAN', 'expiry_date': '2031-01-01'},
+                'visas': [{'country': 'TURKEY'}]
+            }, 'f2' * 32)
+        ]
+
+    def tearDown(self):
+        for record in self.records:
+            app_module.delete_passport_record(record.id)
+
+    def search(self, **params):
+        response = self.client.get('/api/passports', query_string=dict(params, limit=50))
+        self.assertEqual(response.status_code, 200)
+        return sorted(item['passport_number'] for item in response.get_json()['items'])
+
+    def test_full_text_and_filters(self):
+        self.assertEqual(self.search(q='qwertyname'), ['ZX9917001', 'ZX9917002'])
+        self.assertEqual(self.search(q='кверти'), ['ZX9917001'])
+        self.assertEqual(self.search(q='zx991700'), ['ZX9917001', 'ZX9917002'])
+        self.assertEqual(self.search(q='qwertyname', has_visa_country='turkey'), ['ZX9917002'])
+        self.assertEqual(self.search(q='qwertyname', has_visa_country='arab emirates'), ['ZX9917001'])
+        self.assertEqual(self.search(q='qwertyname', nationality='tajikistan'), ['ZX9917001'])
+        self.assertEqual(self.search(q='qwertyname', expires_before='2027-01-01'), ['ZX9917001'])
+        self.assertEqual(self.client.get('/api/passports?expires_before=soon').status_code, 400)
+
+    def test_index_follows_edits_and_deletes(self):
+        record = self.records[0]
+        response = self.client.put(f'/api/passports/{record.id}', json={'data': {
+            'biographical_page': {'full_name': 'ASDFGNAME GAMMA', 'passport_number': 'ZX9917001'}
+        }})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search(q='qwertyname'), ['ZX9917002'])
+        self.assertEqual(self.search(q='asdfgname'), ['ZX9917001'])
+
+        app_module.delete_passport_record(self.records[1].id)
+        self.assertEqual(self.search(q='qwertyname'), [])
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.records = [
+            app_module.save_passport_record(f'cursor_{index}.pdf', {
+                'biographical_page': {'full_name': f'ZXCVBPAGE {index}', 'passport_number': f'CP{index}'}
+            })
+            for index in range(5)
+        ]
+        # Two records share a timestamp; id breaks the tie
+        session = SessionLocal()
+        try:
+            session.query(PassportRecord).filter(PassportRecord.id.in_([r.id for r in self.records[1:3]])) \
+                .update({PassportRecord.created_at: self.records[1].created_at}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def tearDown(self):
+        for record in self.records:
+            app_module.delete_passport_record(record.id)
+
+    def test_cursor_walks_every_record_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {'q': 'zxcvbpage', 'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            body = self.client.get('/api/passports', query_string=params).get_json()
+            self.assertEqual(body['total'], 5)
+            seen.extend(item['passport_number'] for item in body['items'])
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ['CP4', 'CP3', 'CP2', 'CP1', 'CP0'])
+
+        # Page numbers still work and agree with the cursor walk
+        body = self.client.get('/api/passports', query_string={'q': 'zxcvbpage', 'limit': 2, 'page': 2}).get_json()
+        self.assertEqual([item['passport_number'] for item in body['items']], ['CP2', 'CP1'])
+        self.assertEqual(self.client.get('/api/passports?cursor=bogus').status_code, 400)
+
+    def test_out_of_range_limit_and_page_are_clamped(self):
+        for params, limit, page, count in (({'limit': 0}, 1, 1, 1), ({'limit': -5, 'page': -1}, 1, 1, 1),
+                                           ({'limit': 1000, 'page': 0}, 100, 1, 5)):
+            response = self.client.get('/api/passports', query_string=dict(params, q='zxcvbpage'))
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            self.assertEqual((body['limit'], body['page'], len(body['items'])), (limit, page, count))
+
+    def test_listing_does_not_load_data(self):
+        items = app_module.list_passport_records(1, 5, q='zxcvbpage')['items']
+        self.assertEqual(len(items), 5)
+        self.assertEqual(set(items[0]._fields), {'id', 'created_at', 'filename', 'full_name', 'passport_number'})
+
+    def test_cached_total_follows_inserts_and_deletes(self):
+        total = self.client.get('/api/passports').get_json()['total']
+        self.assertEqual(total, app_module.count_passport_records())
+        app_module.delete_passport_record(self.records.pop().id)
+        self.assertEqual(self.client.get('/api/passports').get_json()['total'], total - 1)
+
+
+class TestPageRendering(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.object(app_module, 'SOURCES_DIR', Path(self.tmp.name) / 'sources'),
+            mock.patch.object(app_module, 'RENDER_CACHE_DIR', Path(self.tmp.name) / 'cache')
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+        self.file_hash = 'f' * 64
+        app_module.store_source_pdf(self.file_hash, b'%PDF-1.4 test')
+        self.record = app_module.save_passport_record(
+            'page_test.pdf', {'pages': [{'page_number': 1}, {'page_number': 2}]}, self.file_hash
+        )
+
+    def tearDown(self):
+        app_module.delete_passport_record(self.record.id)
+        for patcher in self.patches:
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_page_is_rendered_once_and_revalidated(self):
+        url = f'/api/passports/{self.record.id}/pages/2?dpi=72&format=png'
+        with mock.patch.object(app_module, 'render_pdf_page', return_value=b'PNGDATA') as render:
+            first = self.client.get(url)
+            second = self.client.get(url)
+            cached = self.client.get(url, headers={'If-None-Match': first.headers['ETag']})
+
+        render.assert_called_once()
+        self.assertEqual(render.call_args.args[1], 2)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.mimetype, 'image/png')
+        self.assertEqual(second.get_data(), b'PNGDATA')
+        self.assertEqual(cached.status_code, 304)
+
+    def test_invalid_page_and_params(self):
+        self.assertEqual(self.client.get(f'/api/passports/{self.record.id}/pages/3').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/passports/{self.record.id}/pages/1?format=gif').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/passports/{self.record.id}/pages/1?dpi=2000').status_code, 400)
+
+
+class TestAsyncProcessing(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        # Uploads are kept by content hash; store them in a throwaway directory
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.object(app_module, 'SOURCES_DIR', Path(self.tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, content, query=''):
+        return self.client.post(
+            f'/api/process{query}',
+            data={'file': (io.BytesIO(content), 'async_test.pdf')},
+            content_type='multipart/form-data'
+        )
+
+    def test_repeated_upload_shares_unfinished_job(self):
+        release = threading.Event()
+        jobs = app_module.JobQueue(workers=1, max_depth=10, name='upload-jobs-test')
+
+        def fake_job(job, filename, file_hash, priority, queue):
+            release.wait(5)
+            return {'record_id': 1}
+
+        with mock.patch.object(app_module, 'process_passport_job', side_effect=fake_job), \
+                mock.patch.object(app_module, 'find_job', side_effect=lambda job_id: (jobs, jobs.get(job_id))), \
+                mock.patch.dict(app_module.upload_jobs, clear=True):
+            first = app_module.submit_upload_job('a.pdf', 'a' * 64, jobs=jobs)
+            self.assertIs(app_module.submit_upload_job('copy.pdf', 'a' * 64, jobs=jobs), first)
+            other = app_module.submit_upload_job('b.pdf', 'b' * 64, jobs=jobs)
+            self.assertEqual(list(app_module.upload_jobs.values()), [first.id, other.id])
+
+            release.set()
+            for job in (first, other):
+                while not job.finished:
+                    jobs.wait_for_change(job, job.version, timeout=0.1)
+            again = app_module.submit_upload_job('a.pdf', 'a' * 64, jobs=jobs)
+            self.assertIsNot(again, first)
+            self.assertEqual(app_module.upload_jobs, {'a' * 64: again.id})
+
+    def test_async_upload_returns_job(self):
+        def fake_pipeline(filename, pdf_bytes, file_hash, progress=None, **kwargs):
+            progress('extracting')
+            return {'record_id': 999, 'biographical_page': {'full_name': 'ASYNC TEST'}}
+
+        with mock.patch.object(app_module, 'extract_and_store_passport', side_effect=fake_pipeline), \
+                mock.patch.object(app_module, 'translate_passport_data', side_effect=lambda data, **kwargs: data) as translate, \
+                mock.patch.object(app_module, 'save_translated_data') as save_translated, \
+                mock.patch.object(app_module, 'get_record_by_hash', return_value=None):
+            response = self.upload(b'%PDF-1.4 async test ' + str(time.time()).encode(), '?async=1')
+            self.assertEqual(response.status_code, 202)
+            job_id = response.get_json()['job_id']
+
+            body = {}
+            for _ in range(50):
+                body = self.client.get(f'/api/jobs/{job_id}').get_json()
+                if body['status'] in ('done', 'failed'):
+                    break
+                time.sleep(0.05)
+
+        self.assertEqual(body['status'], 'done')
+        self.assertEqual(body['result']['record_id'], 999)
+        translate.assert_called_once()
+        save_translated.assert_called_once_with(999, mock.ANY)
+
+        events = self.client.get(f'/api/jobs/{job_id}/events').get_data(as_text=True)
+        self.assertIn('event: done', events)
+
+    def test_stale_translation_is_discarded(self):
+        release = threading.Event()
+
+        def slow_translate(data, **kwargs):
+            release.wait(5)
+            return data
+
+        with mock.patch.object(app_module, 'translate_passport_data', side_effect=slow_translate), \
+                mock.patch.object(app_module, 'save_translated_data') as save_translated:
+            future = app_module.schedule_translation(998, {'visas': []})
+            app_module.cancel_pending_translation(998)
+            release.set()
+            if not future.cancelled():
+                future.result(timeout=5)
+
+        save_translated.assert_not_called()
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/api/jobs/missing').status_code, 404)
+
+
+class TestPageGroupExtraction(unittest.TestCase):
+    def setUp(self):
+        import PyPDF2
+        self.tmp = tempfile.TemporaryDirectory()
+        writer = PyPDF2.PdfWriter()
+        for _ in range(5):
+            writer.add_blank_page(width=300, height=400)
+        self.pdf_path = Path(self.tmp.name) / 'thick.pdf'
+        with open(self.pdf_path, 'wb') as handle:
+            writer.write(handle)
+        self.patches = [
+            mock.patch.object(app_module, 'EXTRACTION_BIO_PAGES', 2),
+            mock.patch.object(app_module, 'EXTRACTION_GROUP_PAGES', 2)
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_page_groups(self):
+        self.assertEqual(app_module.page_groups(5), [(1, 2), (3, 4), (5, 5)])
+        self.assertEqual(app_module.page_groups(1), [(1, 1)])
+
+    def test_absolute_page_number(self):
+        self.assertEqual(app_module.absolute_page_number(2, 5, 6), 6)
+        self.assertEqual(app_module.absolute_page_number('5', 5, 6), 5)
+        self.assertEqual(app_module.absolute_page_number(None, 5, 6), 5)
+        self.assertEqual(app_module.absolute_page_number(9, 5, 6), 5)
+
+    def test_groups_are_extracted_and_merged(self):
+        import PyPDF2
+
+        def fake_call(path, prompt, priority=None, page_count=None, max_tokens=None):
+            with open(path, 'rb') as handle:
+                self.assertEqual(len(PyPDF2.PdfReader(handle).pages), page_count)
+            if prompt == app_module.PROMPT:
+                body = {
+                    'biographical_page': {'full_name': 'THICK PASSPORT'},
+                    'visas': [],
+                    'stamps': [{'page_number': 2, 'country': 'ITALY'}]
+                }
+            elif page_count == 2:
+                body = {'visas': [{'page_number': 2, 'country': 'INDIA'}], 'stamps': [], 'registration_stamps': []}
+            else:
+                body = {'visas': [], 'stamps': [{'page_number': 1, 'country': 'NEPAL'}], 'registration_stamps': []}
+            return {'choices': [{'message': {'content': json.dumps(body)}}]}
+
+        with mock.patch.object(app_module, 'call_gemini_via_openrouter', side_effect=fake_call) as call:
+            data = app_module.extract_by_page_groups(self.pdf_path, 5)
+
+        self.assertEqual(call.call_count, 3)
+        self.assertEqual(data['biographical_page']['full_name'], 'THICK PASSPORT')
+        self.assertEqual(data['visas'], [{'page_number': 4, 'country': 'INDIA'}])
+        self.assertEqual(
+            [(stamp['country'], stamp['page_number']) for stamp in data['stamps']],
+            [('ITALY', 2), ('NEPAL', 5)]
+        )
+        self.assertEqual(data['registration_stamps'], [])
+
+    def test_failed_group_fails_extraction(self):
+        def fake_call(path, prompt, **kwargs):
+            content = 'no JSON here' if prompt == app_module.PAGE_GROUP_PROMPT else '{}'
+            return {'choices': [{'message': {'content': content}}]}
+
+        with mock.patch.object(app_module, 'call_gemini_via_openrouter', side_effect=fake_call):
+            with self.assertRaises(app_module.PassportProcessingError) as caught:
+                app_module.extract_by_page_groups(self.pdf_path, 5)
+        self.assertIn('Pages 3-4', str(caught.exception))
+
+    def test_blank_page_detection(self):
+        from PIL import Image, ImageDraw
+        blank = Image.new('L', (100, 140), 235)
+        # Faint security background pattern is not content
+        pattern = ImageDraw.Draw(blank)
+        for x in range(0, 100, 6):
+            pattern.line((x, 0, x, 140), fill=215)
+        self.assertTrue(app_module.is_blank_page(blank))
+
+        stamped = blank.copy()
+        ImageDraw.Draw(stamped).rectangle((30, 40, 60, 70), outline=40, width=2)
+        self.assertFalse(app_module.is_blank_page(stamped))
+
+    def test_blank_pages_are_skipped_and_recorded(self):
+        import PyPDF2
+        from PIL import Image, ImageDraw
+        content = Image.new('L', (40, 60), 240)
+        ImageDraw.Draw(content).rectangle((5, 5, 30, 30), fill=20)
+        blank = Image.new('L', (40, 60), 240)
+        renders = [content, content, blank, content, blank]
+        sent = {}
+
+        def fake_call(path, prompt, priority=None, page_count=None, **kwargs):
+            with open(path, 'rb') as handle:
+                sent['pages'] = len(PyPDF2.PdfReader(handle).pages)
+            body = {'biographical_page': {}, 'stamps': [{'page_number': 3, 'country': 'PERU'}]}
+            return {'choices': [{'message': {'content': json.dumps(body)}}]}
+
+        with mock.patch.object(app_module, 'PAGE_TRIAGE', True), \
+                mock.patch.object(app_module, 'MRZ_REEXTRACT', False), \
+                mock.patch.object(app_module, 'EXTRACTION_MODE', 'document'), \
+                mock.patch.object(app_module, 'convert_from_path',
+                                  side_effect=lambda path, first_page, **kwargs: [renders[first_page - 1]]) as render, \
+                mock.patch.object(app_module, 'call_gemini_via_openrouter', side_effect=fake_call), \
+                mock.patch.object(app_module, 'get_record_by_hash', return_value=None), \
+                mock.patch.object(app_module, 'save_passport_record', return_value=mock.Mock(id=4242)) as save, \
+                mock.patch.object(app_module, 'export_record'):
+            data = app_module.extract_passport_once('thick.pdf', self.pdf_path, 'e' * 64)
+
+        self.assertEqual(sent['pages'], 3)
+        # Only the pages after the biographical ones are rendered, one per call
+        self.assertEqual([call.kwargs['first_page'] for call in render.call_args_list], [3, 4, 5])
+        self.assertEqual(data['stamps'][0]['page_number'], 4)
+        stored_pages = save.call_args.args[1]['pages']
+        self.assertEqual([page['page_number'] for page in stored_pages if page.get('skipped')], [3, 5])
+        self.assertTrue(all(page.get('blank') for page in stored_pages if page.get('skipped')))
+
+
+class TestPdfCompaction(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.original = Path(self.tmp.name) / 'scan.pdf'
+        self.original.write_bytes(b'%PDF-1.4 ' + b'0' * 2 * 1024 * 1024)
+        self.output = Path(self.tmp.name) / 'compact.pdf'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pages_are_rerendered_into_smaller_pdf(self):
+        import PyPDF2
+        from PIL import Image
+        render = Image.new('L', (150, 200), 200)
+        with mock.patch.object(app_module, 'convert_from_path', return_value=[render]) as convert:
+            path = app_module.compact_pdf(self.original, 3, self.output)
+
+        self.assertEqual(path, self.output)
+        self.assertEqual(convert.call_count, 3)
+        self.assertEqual(convert.call_args.kwargs['first_page'], 3)
+        with open(path, 'rb') as handle:
+            self.assertEqual(len(PyPDF2.PdfReader(handle).pages), 3)
+
+    def test_original_kept_when_not_smaller(self):
+        from PIL import Image
+        self.original.write_bytes(b'%PDF-1.4 tiny')
+        with mock.patch.object(app_module, 'convert_from_path', return_value=[Image.new('RGB', (50, 50))]):
+            self.assertEqual(app_module.compact_pdf(self.original, 1, self.output), self.original)
+
+    def test_render_failure_keeps_original(self):
+        with mock.patch.object(app_module, 'convert_from_path', side_effect=RuntimeError('no poppler')):
+            self.assertEqual(app_module.compact_pdf(self.original, 2, self.output), self.original)
+
+
+class TestTruncatedResponses(unittest.TestCase):
+    def response(self, content):
+        return {'choices': [{'message': {'content': content}}]}
+
+    def test_truncated_extraction_is_continued(self):
+        first = ('{"biographical_page": {"full_name": "X"}, "mrz": {}, '
+                 '"visas": [{"page_number": 3, "country": "INDIA"}, {"page_number": 4, "coun')
+        rest = ('```json\n{"visas": [{"page_number": 3, "country": "INDIA"}, {"page_number": 4, "country": "CHINA"}], '
+                '"registration_stamps": [], "stamps": [{"page_number": 5, "country": "PERU"}]}\n```')
+        with mock.patch.object(app_module, 'call_gemini_via_openrouter',
+                               side_effect=[self.response(first), self.response(rest)]) as call:
+            data = app_module.request_extraction(Path('passport.pdf'), app_module.PROMPT, page_count=5)
+
+        self.assertEqual(call.call_count, 2)
+        history = call.call_args.kwargs['history']
+        self.assertEqual(history[0], {'role': 'assistant', 'content': first})
+        self.assertIn('the remaining "visas" entries', history[1]['content'])
+        self.assertIn('"stamps"', history[1]['content'])
+        self.assertEqual([visa['country'] for visa in data['visas']], ['INDIA', 'CHINA'])
+        self.assertEqual(data['stamps'], [{'page_number': 5, 'country': 'PERU'}])
+        self.assertEqual(data['biographical_page'], {'full_name': 'X'})
+
+    def test_element_cut_inside_nested_array_is_not_duplicated(self):
+        first = ('{"biographical_page": {"full_name": "X"}, "visas": [{"country": "CHINA"}, '
+                 '{"country": "INDIA", "entries_allowed": ["MULT", "0')
+        rest = ('{"visas": [{"country": "INDIA", "entries_allowed": ["MULT", "02"]}], '
+                '"registration_stamps": [], "stamps": []}')
+        with mock.patch.object(app_module, 'call_gemini_via_openrouter',
+                               side_effect=[self.response(first), self.response(rest)]) as call:
+            data = app_module.request_extraction(Path('passport.pdf'), app_module.PROMPT)
+
+        self.assertIn('1 visas', call.call_args.kwargs['history'][1]['content'])
+        self.assertEqual(data['visas'], [{'country': 'CHINA'}, {'country': 'INDIA', 'entries_allowed': ['MULT', '02']}])
+
+    def test_partial_result_kept_when_continuation_fails(self):
+        first = '{"biographical_page": {"full_name": "X"}, "visas": [{"country": "INDIA"}, {"coun'
+        with mock.patch.object(app_module, 'MAX_CONTINUATIONS', 1), \
+                mock.patch.object(app_module, 'call_gemini_via_openrouter',
+                                  side_effect=[self.response(first), self.response('sorry')]):
+            data = app_module.request_extraction(Path('passport.pdf'), app_module.PROMPT)
+        self.assertEqual(data['visas'], [{'country': 'INDIA'}])
+
+    def test_truncated_translation_requests_only_missing_values(self):
+        from response_cache import ResponseCache
+        from translation_memory import TranslationMemory
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(app_module, 'response_cache', ResponseCache(Path(tmp) / 'cache.db')), \
+                mock.patch.object(app_module, 'translation_memory', TranslationMemory(Path(tmp) / 'tm.db')), \
+                mock.patch.object(app_module.llm_client, 'chat',
+                                  side_effect=['{"0": "ИТАЛИЯ", "1": "РИ', '{"0": "РИМ"}']) as chat:
+            translated = app_module.translate_strings(['ITALY', 'ROME'])
+
+        self.assertEqual(translated, {'ITALY': 'ИТАЛИЯ', 'ROME': 'РИМ'})
+        self.assertEqual(json.loads(chat.call_args.args[0][1]['content']), {'0': 'ROME'})
+
+
+class TestStreamingExtraction(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        # Uploads are kept by content hash; store them in a throwaway directory
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.object(app_module, 'SOURCES_DIR', Path(self.tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sections_are_reported_while_streaming(self):
+        chunks = ['{"biographical_page": {"full_name": "X"}, "vi', 'sas": [{"country": "INDIA"}, ',
+                  '{"country": "CHINA"}], "stamps": []}']
+        events = []
+        with mock.patch.object(app_module, 'stream_gemini_via_openrouter', return_value=iter(chunks)), \
+                mock.patch.object(app_module, 'call_gemini_via_openrouter') as call:
+            data = app_module.request_extraction(Path('passport.pdf'), app_module.PROMPT, on_event=events.append)
+
+        call.assert_not_called()
+        self.assertEqual([visa['country'] for visa in data['visas']], ['INDIA', 'CHINA'])
+        self.assertEqual(
+            [(event['event'], event['section']) for event in events],
+            [('section', 'biographical_page'), ('item', 'visas'), ('item', 'visas'),
+             ('section', 'visas'), ('section', 'stamps')]
+        )
+
+    def test_event_pages_follow_the_original_pdf(self):
+        events = []
+        emit = app_module.remap_event_pages(events.append, [1, 2, 4])
+        emit({'event': 'item', 'section': 'visas', 'index': 0, 'data': {'page_number': 3}})
+        self.assertEqual(events[0]['data'], {'page_number': 4})
+
+    def test_upload_streams_ndjson_events(self):
+
+        def fake_extract(filename, pdf_path, file_hash, progress=None, on_event=None):
+            progress('extracting')
+            on_event({'event': 'section', 'section': 'biographical_page', 'data': {'full_name': 'STREAM TEST'}})
+            return {'record_id': 997, 'biographical_page': {'full_name': 'STREAM TEST'}}
+
+        with mock.patch.object(app_module, 'extract_and_store_passport', side_effect=fake_extract), \
+                mock.patch.object(app_module, 'schedule_translation'), \
+                mock.patch.object(app_module, 'get_record_by_hash', return_value=None):
+            response = self.client.post(
+                '/api/process/stream',
+                data={'file': (io.BytesIO(b'%PDF-1.4 stream test ' + str(time.time()).encode()), 'stream.pdf')},
+                content_type='multipart/form-data'
+            )
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([line['event'] for line in lines], ['started', 'status', 'section', 'done'])
+        self.assertEqual(lines[-1]['data']['record_id'], 997)
+
+    def test_full_queue_rejects_stream(self):
+        with mock.patch.object(app_module.job_queue, 'submit', side_effect=app_module.QueueFullError('full')), \
+                mock.patch.object(app_module, 'get_record_by_hash', return_value=None):
+            response = self.client.post(
+                '/api/process/stream',
+                data={'file': (io.BytesIO(b'%PDF-1.4 stream full ' + str(time.time()).encode()), 'full.pdf')},
+                content_type='multipart/form-data'
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '30')
+
+    def test_rejected_upload(self):
+        response = self.client.post('/api/process/stream', data={}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestBatchIngestion(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        # Uploads are kept by content hash; store them in a throwaway directory
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.object(app_module, 'SOURCES_DIR', Path(self.tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pdf(self, label):
+        return b'%PDF-1.4 batch test ' + label.encode() + str(time.time()).encode()
+
+    def test_files_and_zip_are_deduplicated_and_queued(self):
+        from concurrent.futures import Future
+        first, second = self.pdf('first'), self.pdf('second')
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zipped:
+            zipped.writestr('scans/second.pdf', second)
+            zipped.writestr('scans/again.pdf', first)
+            zipped.writestr('scans/notes.txt', 'skip me')
+        archive.seek(0)
+
+        release = threading.Event()
+        priorities = []
+
+        def fake_extract(filename, pdf_path, file_hash, progress=None, priority=None, **kwargs):
+            priorities.append(priority)
+            release.wait(5)
+            return {'record_id': 990 + len(priorities), 'biographical_page': {}}
+
+        with mock.patch.object(app_module, 'extract_and_store_passport', side_effect=fake_extract), \
+                mock.patch.object(app_module, 'ensure_translation', return_value=Future()) as translation, \
+                mock.patch.object(app_module, 'get_record_by_hash', return_value=None):
+            translation.return_value.set_result(None)
+            response = self.client.post('/api/batches', data={'files': [
+                (io.BytesIO(first), 'first.pdf'),
+                (io.BytesIO(b'not a pdf'), 'broken.pdf'),
+                (archive, 'scans.zip')
+            ]}, content_type='multipart/form-data')
+            self.assertEqual(response.status_code, 202)
+            body = response.get_json()
+            release.set()
+
+            for _ in range(100):
+                status = self.client.get(body['status_url']).get_json()
+                if status['finished']:
+                    break
+                time.sleep(0.05)
+
+        self.assertEqual([item['filename'] for item in body['items']],
+                         ['first.pdf', 'broken.pdf', 'scans.zip/scans/second.pdf', 'scans.zip/scans/again.pdf'])
+        self.assertEqual(priorities, [app_module.PRIORITY_BULK] * 2)
+        self.assertTrue(status['finished'])
+        self.assertEqual((status['total'], status['completed'], status['failed']), (4, 3, 1))
+        items = status['items']
+        self.assertEqual(items[1]['status'], 'rejected')
+        self.assertEqual(items[3]['duplicate_of'], 0)
+        self.assertEqual(items[3]['record_id'], items[0]['record_id'])
+        self.assertEqual(self.client.get(f"/api/jobs/{items[0]['job_id']}").status_code, 200)
+
+    def test_corrupt_zip_member_is_rejected_alone(self):
+        good, damaged = self.pdf('good'), self.pdf('damaged')
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zipped:
+            zipped.writestr('damaged.pdf', damaged)
+            zipped.writestr('good.pdf', good)
+        # Flip a byte of the stored member so its CRC no longer matches
+        content = archive.getvalue()
+        offset = content.index(damaged) + len(damaged) - 1
+        content = content[:offset] + bytes([content[offset] ^ 0xFF]) + content[offset + 1:]
+
+        with mock.patch.object(app_module, 'submit_upload_job', return_value=Job(None, (), {})) as submit, \
+                mock.patch.object(app_module, 'get_record_by_hash', return_value=None):
+            response = self.client.post('/api/batches', data={'files': [(io.BytesIO(content), 'scans.zip')]},
+                                        content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 202)
+        items = response.get_json()['items']
+        self.assertEqual([item['filename'] for item in items], ['scans.zip/damaged.pdf', 'scans.zip/good.pdf'])
+        self.assertEqual(items[0]['status'], 'rejected')
+        self.assertIn('CRC', items[0]['error'])
+        submit.assert_called_once()
+        self.assertEqual([path.name for path in Path(self.tmp.name).iterdir()], [f"{items[1]['file_hash']}.pdf"])
+
+    def test_empty_and_unknown_batch(self):
+        self.assertEqual(self.client.post('/api/batches', data={}, content_type='multipart/form-data').status_code, 400)
+        self.assertEqual(self.client.get('/api/batches/missing').status_code, 404)
+
+
+class TestMrzVerification(unittest.TestCase):
+    LINE1 = 'P<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<<<<<<<<<'
+    LINE2 = 'L898902C36UTO7408122F1204159ZE184226B<<<<<10'
+
+    def setUp(self):
+        import PyPDF2
+        self.tmp = tempfile.TemporaryDirectory()
+        writer = PyPDF2.PdfWriter()
+        for _ in range(4):
+            writer.add_blank_page(width=300, height=400)
+        self.pdf_path = Path(self.tmp.name) / 'passport.pdf'
+        with open(self.pdf_path, 'wb') as handle:
+            writer.write(handle)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def passport(self, line2):
+        return {
+            'biographical_page': {'full_name': 'ERIKSSON ANNA MARIA', 'passport_number': ''},
+            'mrz': {'mrz_line1': self.LINE1, 'mrz_line2': line2}
+        }
+
+    def test_valid_mrz_needs_no_model_call(self):
+        data = self.passport(self.LINE2)
+        with mock.patch.object(app_module, 'call_gemini_via_openrouter') as call:
+            app_module.verify_mrz(data, self.pdf_path, [1, 2, 3, 4])
+        call.assert_not_called()
+        self.assertEqual(data['biographical_page']['passport_number'], 'L898902C3')
+        self.assertEqual(data['biographical_page']['date_of_birth'], '12.08.1974')
+
+    def test_invalid_mrz_reextracts_biographical_pages(self):
+        import PyPDF2
+        data = self.passport('L898902C36UTO7408122F1204159ZE184226B<<<<<19')
+        sent = {}
+
+        def fake_call(path, prompt, **kwargs):
+            with open(path, 'rb') as handle:
+                sent['pages'] = len(PyPDF2.PdfReader(handle).pages)
+            sent['prompt'] = prompt
+            body = {'biographical_page': {'gender': 'F'}, 'mrz': {'mrz_line1': self.LINE1, 'mrz_line2': self.LINE2}}
+            return {'choices': [{'message': {'content': json.dumps(body)}}]}
+
+        with mock.patch.object(app_module, 'EXTRACTION_BIO_PAGES', 2), \
+                mock.patch.object(app_module, 'call_gemini_via_openrouter', side_effect=fake_call):
+            app_module.verify_mrz(data, self.pdf_path, [1, 2, 3, 4])
+
+        self.assertEqual(sent['pages'], 2)
+        self.assertIn('failed validation (composite check digit mismatch)', sent['prompt'])
+        self.assertNotIn('{errors}', sent['prompt'])
+        self.assertEqual(data['mrz']['mrz_line2'], self.LINE2)
+        self.assertEqual(data['biographical_page']['gender'], 'F')
+        self.assertEqual(data['biographical_page']['full_name'], 'ERIKSSON ANNA MARIA')
+
+    def test_missing_mrz_is_not_reextracted(self):
+        data = {'biographical_page': {'full_name': 'ERIKSSON ANNA MARIA'}, 'mrz': {}}
+        with mock.patch.object(app_module, 'call_gemini_via_openrouter') as call:
+            app_module.verify_mrz(data, self.pdf_path, [1, 2, 3, 4])
+        call.assert_not_called()
+        self.assertEqual(data['biographical_page'], {'full_name': 'ERIKSSON ANNA MARIA'})
+
+    def test_validation_warnings_report_mrz_problems(self):
+        data = self.passport(self.LINE2)
+        data['biographical_page']['date_of_birth'] = '13.08.1974'
+        warnings = app_module.validate_passport_data(data)
+        self.assertTrue(any('date of birth' in warning for warning in warnings))
+
+        data = self.passport(self.LINE2[:-1] + '9')
+        self.assertIn('MRZ: composite check digit mismatch', app_module.validate_passport_data(data))
+
+
+class TestDuplicateUploads(unittest.TestCase):
+    def setUp(self):
+        self.file_hash = 'd' * 64
+        self.model_response = {'choices': [{'message': {'content': '{"biographical_page": {"full_name": "DUP TEST"}}'}}]}
+
+    def tearDown(self):
+        record = app_module.get_record_by_hash(self.file_hash)
+        if record:
+            app_module.delete_passport_record(record.id)
+
+    def test_file_hash_is_unique(self):
+        from sqlalchemy.exc import IntegrityError
+        app_module.save_passport_record('first.pdf', {}, self.file_hash)
+        with self.assertRaises(IntegrityError):
+            app_module.save_passport_record('second.pdf', {}, self.file_hash)
+
+    def test_concurrent_uploads_share_one_extraction(self):
+        release = threading.Event()
+
+        def slow_call(*args, **kwargs):
+            release.wait(5)
+            return self.model_response
+
+        results = []
+
+        def upload():
+            results.append(app_module.extract_and_store_passport('dup.pdf', Path('missing.pdf'), self.file_hash))
+
+        with mock.patch.object(app_module, 'call_gemini_via_openrouter', side_effect=slow_call) as call:
+            threads = [threading.Thread(target=upload) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            while call.call_count == 0:
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        call.assert_called_once()
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len({result['record_id'] for result in results}), 1)
+
+    def test_record_stored_concurrently_is_reused(self):
+        existing = app_module.save_passport_record('first.pdf', {'biographical_page': {}}, self.file_hash)
+        with mock.patch.object(app_module, 'get_record_by_hash', side_effect=[None, existing]), \
+                mock.patch.object(app_module, 'call_gemini_via_openrouter', return_value=self.model_response):
+            passport_data = app_module.extract_passport_once('second.pdf', Path('missing.pdf'), self.file_hash)
+
+        self.assertEqual(passport_data['record_id'], existing.id)
+
+    def test_async_resubmission_reuses_running_job(self):
+        release = threading.Event()
+        with mock.patch.object(app_module, 'process_passport_job', side_effect=lambda job, *args: release.wait(5)):
+            first = app_module.submit_upload_job('a.pdf', self.file_hash)
+            second = app_module.submit_upload_job('b.pdf', self.file_hash)
+            release.set()
+
+        self.assertIs(first, second)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import sys
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+from concurrent.futures import Future
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import bulk_ingest
+from bulk_ingest import Checkpoint, percentile
+
+
+def finished_future():
+    future = Future()
+    future.set_result(None)
+    return future
+
+
+class TestBulkIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        (self.root / 'nested').mkdir()
+        (self.root / 'a.pdf').write_bytes(b'%PDF-1.4 bulk a')
+        (self.root / 'nested' / 'B.PDF').write_bytes(b'%PDF-1.4 bulk b')
+        (self.root / 'nested' / 'c.pdf').write_bytes(b'%PDF-1.4 bulk c')
+        (self.root / 'notes.txt').write_text('ignored')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_percentile(self):
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 0.5), 3)
+        self.assertEqual(percentile(list(range(1, 101)), 0.95), 95)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_run_skips_known_files_and_resumes_from_checkpoint(self):
+        known_hash = bulk_ingest.hash_file(self.root / 'a.pdf')
+        existing = mock.Mock(id=11, data={'biographical_page': {}})
+        calls = []
+
+        def fake_extract(filename, pdf_path, file_hash, priority=None):
+            calls.append(filename)
+            if filename == 'c.pdf':
+                raise RuntimeError('model failed')
+            return {'record_id': 12}
+
+        checkpoint_path = self.root / 'progress.jsonl'
+        with mock.patch.object(bulk_ingest.passx, 'get_record_by_hash',
+                               side_effect=lambda file_hash: existing if file_hash == known_hash else None), \
+                mock.patch.object(bulk_ingest.passx, 'spool_upload',
+                                  side_effect=lambda handle: (bulk_ingest.hashlib.sha256(handle.read()).hexdigest(), Path('x.pdf'))), \
+                mock.patch.object(bulk_ingest.passx, 'extract_and_store_passport', side_effect=fake_extract), \
+                mock.patch.object(bulk_ingest.passx, 'ensure_translation', return_value=finished_future()) as translate:
+            checkpoint = Checkpoint(checkpoint_path)
+            summary = bulk_ingest.run(self.root, 2, checkpoint)
+            checkpoint.close()
+
+            self.assertEqual((summary['files'], summary['processed'], summary['skipped'], summary['failed']), (3, 1, 1, 1))
+            self.assertEqual(summary['failures'][0]['path'], str(self.root / 'nested' / 'c.pdf'))
+            self.assertIsNotNone(summary['latency_p95_seconds'])
+            # Stored files are translated, and so are known files an earlier run left untranslated
+            self.assertEqual(sorted(call.args[0] for call in translate.call_args_list), [11, 12])
+            translate.assert_any_call(12, {'record_id': 12}, priority=bulk_ingest.PRIORITY_BULK)
+
+            # A second run only retries the failed file
+            calls.clear()
+            checkpoint = Checkpoint(checkpoint_path)
+            summary = bulk_ingest.run(self.root, 2, checkpoint)
+            checkpoint.close()
+
+        self.assertEqual(calls, ['c.pdf'])
+        self.assertEqual(summary['files'], 1)
+        lines = [json.loads(line) for line in checkpoint_path.read_text().splitlines()]
+        self.assertEqual(len(lines), 4)
+
+    def test_translations_do_not_block_extraction(self):
+        translation = Future()
+        extracted = []
+
+        def fake_extract(filename, pdf_path, file_hash, priority=None):
+            extracted.append(filename)
+            if len(extracted) == 3:
+                # Every file was extracted while the first translation is still running
+                translation.set_result(None)
+            return {'record_id': len(extracted)}
+
+        checkpoint = Checkpoint(self.root / 'progress.jsonl')
+        with mock.patch.object(bulk_ingest.passx, 'get_record_by_hash', return_value=None), \
+                mock.patch.object(bulk_ingest.passx, 'spool_upload', return_value=('hash', Path('x.pdf'))), \
+                mock.patch.object(bulk_ingest.passx, 'extract_and_store_passport', side_effect=fake_extract), \
+                mock.patch.object(bulk_ingest.passx, 'ensure_translation', return_value=translation):
+            summary = bulk_ingest.run(self.root, 1, checkpoint)
+        checkpoint.close()
+
+        self.assertEqual(summary['processed'], 3)
+        self.assertEqual(len(checkpoint.finished), 3)
+
+    def test_interrupted_run_keeps_translated_files(self):
+        translations = {'a.pdf': Future(), 'B.PDF': Future()}
+
+        def fake_extract(filename, pdf_path, file_hash, priority=None):
+            if filename == 'c.pdf':
+                # The first file's translation settles, then the run is stopped
+                translations['a.pdf'].set_result(None)
+                raise KeyboardInterrupt
+            return {'record_id': filename}
+
+        checkpoint_path = self.root / 'progress.jsonl'
+        checkpoint = Checkpoint(checkpoint_path)
+        with mock.patch.object(bulk_ingest.passx, 'get_record_by_hash', return_value=None), \
+                mock.patch.object(bulk_ingest.passx, 'spool_upload', return_value=('hash', Path('x.pdf'))), \
+                mock.patch.object(bulk_ingest.passx, 'extract_and_store_passport', side_effect=fake_extract), \
+                mock.patch.object(bulk_ingest.passx, 'ensure_translation',
+                                  side_effect=lambda record_id, data, priority=None: translations[record_id]):
+            with self.assertRaises(KeyboardInterrupt):
+                bulk_ingest.run(self.root, 1, checkpoint)
+        checkpoint.close()
+        translations['B.PDF'].set_result(None)
+
+        lines = [json.loads(line) for line in checkpoint_path.read_text().splitlines()]
+        self.assertEqual([(line['path'], line['status']) for line in lines], [(str(self.root / 'a.pdf'), 'done')])
+        resumed = Checkpoint(checkpoint_path)
+        self.assertTrue(resumed.is_finished(self.root / 'a.pdf'))
+        self.assertFalse(resumed.is_finished(self.root / 'nested' / 'B.PDF'))
+        resumed.close()
+
+    def test_main_writes_summary(self):
+        summary_path = self.root / 'summary.json'
+        with mock.patch.object(bulk_ingest.passx, 'get_record_by_hash', return_value=mock.Mock(id=1, data={})), \
+                mock.patch.object(bulk_ingest.passx, 'ensure_translation', return_value=finished_future()), \
+                mock.patch.object(bulk_ingest.passx.extraction_stage, 'concurrency', 3), \
+                mock.patch.object(bulk_ingest.passx.extraction_stage, 'reserved', 1), \
+                mock.patch.object(bulk_ingest, 'run', wraps=bulk_ingest.run) as run:
+            code = bulk_ingest.main([str(self.root), '--summary', str(summary_path), '--concurrency', '8'])
+        self.assertEqual(code, 0)
+        # Clamped to the extraction slots open to bulk work
+        self.assertEqual(run.call_args.args[1], 2)
+        self.assertEqual(json.loads(summary_path.read_text())['skipped'], 3)
+        self.assertTrue((self.root / bulk_ingest.DEFAULT_CHECKPOINT_NAME).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import unittest
+import sys
+import multiprocessing
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from database import create_sqlite_engine, sqlite_url, writer_engine, WriteBatcher
+
+
+def insert_entry(writer: str, number: int):
+    def work(session):
+        # Read before writing, as the record helpers do
+        session.execute(text("SELECT COUNT(*) FROM entries")).scalar()
+        return session.execute(
+            text("INSERT INTO entries (writer, number) VALUES (:writer, :number)"),
+            {'writer': writer, 'number': number}
+        ).lastrowid
+    return work
+
+
+def write_from_process(batcher: WriteBatcher, writer: str, count: int):
+    # Runs in a forked child on the engine and batcher inherited from the parent
+    for number in range(count):
+        batcher.run(insert_entry(writer, number))
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_sqlite_engine(Path(self.tmp.name) / 'stress.db', busy_timeout=10)
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE entries (id INTEGER PRIMARY KEY, writer TEXT NOT NULL, number INTEGER NOT NULL, "
+                "UNIQUE (writer, number))"
+            ))
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False, future=True)
+        self.batcher = WriteBatcher(
+            sessionmaker(bind=writer_engine(self.engine), expire_on_commit=False, future=True), max_batch=16
+        )
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def count(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM entries")).scalar()
+
+    def test_url_is_absolute(self):
+        self.assertEqual(sqlite_url('relative.db'), f"sqlite:///{Path('relative.db').resolve()}")
+
+    def test_connections_are_tuned(self):
+        with self.engine.connect() as conn:
+            pragmas = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                       for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size')}
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 10000,
+                                   'mmap_size': 256 * 1024 * 1024})
+
+    def test_queued_writes_share_a_commit(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking(session):
+            started.set()
+            release.wait(5)
+            return insert_entry('blocking', 0)(session)
+
+        first = self.batcher.submit(blocking)
+        started.wait(5)
+        queued = [self.batcher.submit(insert_entry('queued', number)) for number in range(5)]
+        release.set()
+
+        first.result(5)
+        self.assertEqual(len({future.result(5) for future in queued}), 5)
+        self.assertEqual(self.batcher.stats()['batches'], 2)
+        self.assertEqual(self.batcher.stats()['largest_batch'], 5)
+        self.assertEqual(self.count(), 6)
+
+    def test_failed_write_is_rolled_back_alone(self):
+        self.batcher.run(insert_entry('unique', 1))
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking(session):
+            started.set()
+            release.wait(5)
+
+        self.batcher.submit(blocking)
+        started.wait(5)
+        duplicate = self.batcher.submit(insert_entry('unique', 1))
+        other = self.batcher.submit(insert_entry('unique', 2))
+        release.set()
+
+        with self.assertRaises(IntegrityError):
+            duplicate.result(5)
+        other.result(5)
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(self.batcher.stats()['failed'], 1)
+
+    def test_readers_and_writers_in_threads_and_processes(self):
+        threads_writing, writes_per_thread = 8, 40
+        processes_writing, writes_per_process = 2, 40
+        errors = []
+        read_counts = []
+        stop = threading.Event()
+
+        # Put a connection in the pool so the forked children inherit one
+        self.assertEqual(self.count(), 0)
+        self.batcher.run(insert_entry('parent', 0))
+
+        def read():
+            last = 0
+            try:
+                while not stop.is_set():
+                    session = self.Session()
+                    try:
+                        current = session.execute(text("SELECT COUNT(*) FROM entries")).scalar()
+                        session.execute(text("SELECT writer, number FROM entries ORDER BY id DESC LIMIT 20")).all()
+                    finally:
+                        session.close()
+                    if current < last:
+                        errors.append(f'count went back from {last} to {current}')
+                    last = current
+                    read_counts.append(current)
+            except Exception as exc:
+                errors.append(exc)
+
+        def write(writer):
+            try:
+                for number in range(writes_per_thread):
+                    self.batcher.run(insert_entry(writer, number))
+            except Exception as exc:
+                errors.append(exc)
+
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=write_from_process, args=(self.batcher, f'process-{index}', writes_per_process))
+            for index in range(processes_writing)
+        ]
+        readers = [threading.Thread(target=read) for _ in range(8)]
+        writers = [threading.Thread(target=write, args=(f'thread-{index}',)) for index in range(threads_writing)]
+
+        started = time.monotonic()
+        for process in processes:
+            process.start()
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join(60)
+        for process in processes:
+            process.join(60)
+        stop.set()
+        for thread in readers:
+            thread.join(10)
+
+        self.assertEqual(errors, [])
+        self.assertEqual([process.exitcode for process in processes], [0] * processes_writing)
+        self.assertEqual(
+            self.count(), 1 + threads_writing * writes_per_thread + processes_writing * writes_per_process
+        )
+        self.assertTrue(read_counts)
+        self.assertLess(time.monotonic() - started, 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from job_queue import (
+    JobQueue, JobDeferred, QueueFullError, Batch, Stage, JOB_DONE, JOB_FAILED, JOB_EXTRACTING, ITEM_REJECTED
+)
+
+
+def wait_until_finished(queue, job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        queue.wait_for_change(job, job.version, timeout=0.1)
+    return job
+
+
+class TestJobQueue(unittest.TestCase):
+    def test_job_result_and_status(self):
+        jobs = JobQueue(workers=2, max_depth=4)
+
+        def work(job, value):
+            jobs.set_status(job, JOB_EXTRACTING)
+            return value * 2
+
+        job = jobs.submit(work, 21, meta={'filename': 'a.pdf'})
+        wait_until_finished(jobs, job)
+        self.assertEqual(job.status, JOB_DONE)
+        self.assertEqual(job.result, 42)
+        self.assertEqual(jobs.get(job.id).to_dict()['filename'], 'a.pdf')
+
+    def test_failed_job_records_error(self):
+        jobs = JobQueue(workers=1, max_depth=4)
+
+        def work(job):
+            raise ValueError('boom')
+
+        job = wait_until_finished(jobs, jobs.submit(work))
+        self.assertEqual(job.status, JOB_FAILED)
+        self.assertEqual(job.error, 'boom')
+
+    def test_deferred_job_is_requeued(self):
+        jobs = JobQueue(workers=1, max_depth=4)
+        attempts = []
+
+        def flaky(job):
+            attempts.append(job.status)
+            if len(attempts) == 1:
+                raise JobDeferred('upstream down', delay=0.05)
+            return 'ok'
+
+        job = wait_until_finished(jobs, jobs.submit(flaky))
+        self.assertEqual(job.status, JOB_DONE)
+        self.assertEqual(job.result, 'ok')
+        self.assertEqual(job.deferrals, 1)
+
+    def test_queue_depth_is_bounded(self):
+        jobs = JobQueue(workers=1, max_depth=1)
+        release = threading.Event()
+        started = threading.Event()
+
+        def block(job):
+            started.set()
+            release.wait(5)
+
+        jobs.submit(block)
+        started.wait(5)
+        jobs.submit(block)
+        with self.assertRaises(QueueFullError):
+            jobs.submit(block)
+        release.set()
+
+    def test_finished_jobs_are_pruned(self):
+        jobs = JobQueue(workers=1, max_depth=10, max_finished=2)
+        submitted = [jobs.submit(lambda job: None) for _ in range(4)]
+        for job in submitted:
+            wait_until_finished(jobs, job)
+        self.assertIsNone(jobs.get(submitted[0].id))
+        self.assertIsNotNone(jobs.get(submitted[-1].id))
+
+
+class TestBatch(unittest.TestCase):
+    def test_items_follow_their_jobs(self):
+        jobs = JobQueue(workers=1, max_depth=4)
+        release = threading.Event()
+
+        def work(job):
+            release.wait(5)
+            return {'record_id': 7}
+
+        batch = Batch()
+        job = jobs.submit(work)
+        batch.add({'filename': 'a.pdf'}, job)
+        batch.add({'filename': 'a copy.pdf', 'duplicate_of': 0})
+        batch.add({'filename': 'b.txt', 'status': ITEM_REJECTED, 'error': 'Only PDF files allowed'})
+
+        summary = batch.to_dict()
+        self.assertEqual((summary['total'], summary['pending'], summary['failed']), (3, 2, 1))
+        self.assertFalse(summary['finished'])
+
+        release.set()
+        wait_until_finished(jobs, job)
+        summary = batch.to_dict()
+        self.assertTrue(summary['finished'])
+        self.assertEqual(summary['completed'], 2)
+        self.assertEqual([item.get('record_id') for item in summary['items']], [7, 7, None])
+        self.assertNotIn('items', batch.to_dict(include_items=False))
+
+
+class TestStage(unittest.TestCase):
+    def test_background_work_leaves_reserved_slots_free(self):
+        stage = Stage('test', 3, reserved=1)
+        release = threading.Event()
+        started = []
+
+        def work(name):
+            started.append(name)
+            release.wait(5)
+            return name
+
+        background = [stage.submit(work, f'batch-{index}', slot_priority=5) for index in range(4)]
+        deadline = time.time() + 5
+        while len(started) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(stage.stats()['active_background'], 2)
+
+        # The reserved slot is still free for interactive work
+        with stage.slot(0):
+            self.assertEqual(stage.stats()['active'], 3)
+        interactive = stage.submit(work, 'interactive')
+        while 'interactive' not in started and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIn('interactive', started)
+        self.assertEqual(len(started), 3)
+
+        release.set()
+        self.assertEqual(interactive.result(5), 'interactive')
+        self.assertEqual([future.result(5) for future in background], [f'batch-{index}' for index in range(4)])
+        self.assertEqual(stage.stats()['active'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
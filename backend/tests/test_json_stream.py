@@ -0,0 +1,46 @@
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from json_stream import SectionStreamParser
+
+
+def parse(chunks):
+    events = []
+    parser = SectionStreamParser(events.append)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return events
+
+
+class TestSectionStreamParser(unittest.TestCase):
+    TEXT = (
+        '```json\n{"biographical_page": {"full_name": "A, \\"B\\" }"}, '
+        '"visas": [{"country": "TH", "pages": [1, 2]}, {"country": "VN"}], '
+        '"stamps": [], "count": 2}\n```'
+    )
+
+    def test_events_in_order(self):
+        events = parse([self.TEXT])
+        self.assertEqual(events, [
+            {'event': 'section', 'section': 'biographical_page', 'data': {'full_name': 'A, "B" }'}},
+            {'event': 'item', 'section': 'visas', 'index': 0, 'data': {'country': 'TH', 'pages': [1, 2]}},
+            {'event': 'item', 'section': 'visas', 'index': 1, 'data': {'country': 'VN'}},
+            {'event': 'section', 'section': 'visas', 'data': [{'country': 'TH', 'pages': [1, 2]}, {'country': 'VN'}]},
+            {'event': 'section', 'section': 'stamps', 'data': []},
+            {'event': 'section', 'section': 'count', 'data': 2},
+        ])
+
+    def test_chunk_boundaries_do_not_matter(self):
+        self.assertEqual(parse(list(self.TEXT)), parse([self.TEXT]))
+
+    def test_truncated_text_reports_only_complete_parts(self):
+        cut = self.TEXT.index('{"country": "VN"') + 10
+        events = parse([self.TEXT[:cut]])
+        self.assertEqual([event['event'] for event in events], ['section', 'item'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+import json
+import unittest
+import sys
+from pathlib import Path
+from unittest import mock
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from llm_client import (
+    OpenRouterClient, RetryPolicy, CircuitBreaker, CircuitOpenError, LLMError, FileDataURL, StreamingJSONBody,
+    salvage_json, parse_retry_after, iter_sse_data
+)
+
+
+def fake_response(status_code=200, body=None, text='', headers=None):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.text = text
+    response.headers = headers or {}
+    response.json.return_value = body
+    return response
+
+
+def json_bytes(payload):
+    import json
+    return json.dumps(payload).encode('utf-8')
+
+
+class TestResponseParsing(unittest.TestCase):
+    def test_outermost_object_found_in_prose(self):
+        self.assertEqual(salvage_json('Here it is: {"a": {"b": [1, 2]}} Done.'), ({'a': {'b': [1, 2]}}, True, None))
+        self.assertEqual(salvage_json('text ```\n{"a": 1}\n``` tail'), ({'a': 1}, True, None))
+
+    def test_truncated_arrays_keep_complete_elements(self):
+        content = '```json\n{"bio": {"name": "A \\"B\\" C"}, "visas": [{"n": 1}, {"n": 2}, {"n": 3, "text": "cut'
+        value, complete, open_key = salvage_json(content)
+        self.assertFalse(complete)
+        self.assertEqual(open_key, 'visas')
+        self.assertEqual(value, {'bio': {'name': 'A "B" C'}, 'visas': [{'n': 1}, {'n': 2}]})
+
+    def test_element_cut_inside_nested_array_is_dropped(self):
+        content = '{"visas": [{"country": "CHINA"}, {"country": "INDIA", "entries_allowed": ["MULT", "0'
+        self.assertEqual(salvage_json(content), ({'visas': [{'country': 'CHINA'}]}, False, 'visas'))
+
+    def test_truncated_between_fields(self):
+        value, complete, open_key = salvage_json('{"a": 1, "b": {"c": 2}, "d')
+        self.assertEqual((value, complete, open_key), ({'a': 1, 'b': {'c': 2}}, False, None))
+
+    def test_unrecoverable(self):
+        with self.assertRaises(ValueError):
+            salvage_json('{"a": "never closed')
+        with self.assertRaises(ValueError):
+            salvage_json('no json')
+
+    def test_unterminated_fence(self):
+        self.assertEqual(salvage_json('```json\n{"a": 1}'), ({"a": 1}, True, None))
+
+
+class TestServerSentEvents(unittest.TestCase):
+    def test_data_fields_and_comments(self):
+        lines = [': OPENROUTER PROCESSING', '', 'data: {"a": 1}', '', 'event: x', 'data: one', 'data:two', '', 'data: [DONE]']
+        self.assertEqual(list(iter_sse_data(lines)), ['{"a": 1}', 'one\ntwo', '[DONE]'])
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_backoff_is_capped_and_jittered(self):
+        policy = RetryPolicy(max_attempts=10, base_delay=1, max_delay=5)
+        for attempt in range(1, 10):
+            delay = policy.delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(5, 2 ** (attempt - 1)))
+        self.assertEqual(policy.delay(1, retry_after=100), 5)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('3'), 3.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_half_open_trial(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError) as ctx:
+            breaker.before_call()
+        self.assertEqual(ctx.exception.retry_after, 10)
+
+        now[0] = 11
+        breaker.before_call()
+        self.assertEqual(breaker.state, 'half_open')
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+
+class TestOpenRouterClient(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.client = OpenRouterClient(
+            api_key='key', pool_size=4, connect_timeout=3,
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=1, max_delay=8),
+            breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60),
+            sleep=self.sleeps.append
+        )
+
+    def test_chat_reuses_session_with_split_timeouts(self):
+        body = {'choices': [{'message': {'content': 'hello'}}]}
+        with mock.patch.object(self.client._session, 'post', return_value=fake_response(body=body)) as post:
+            self.assertEqual(self.client.chat([], title='T', read_timeout=30, model='m', max_tokens=10), 'hello')
+            self.client.chat([], title='T', read_timeout=30, model='m', max_tokens=10)
+
+        self.assertEqual(post.call_count, 2)
+        kwargs = post.call_args.kwargs
+        self.assertEqual(kwargs['timeout'], (3, 30))
+        self.assertEqual(kwargs['headers']['Authorization'], 'Bearer key')
+        self.assertEqual(kwargs['json']['max_tokens'], 10)
+
+    def test_retries_throttling_with_retry_after(self):
+        body = {'choices': [{'message': {'content': 'ok'}}]}
+        responses = [fake_response(429, headers={'Retry-After': '2'}), fake_response(body=body)]
+        with mock.patch.object(self.client._session, 'post', side_effect=responses):
+            self.assertEqual(self.client.complete({}, title='T', read_timeout=5), body)
+
+        self.assertEqual(self.sleeps, [2.0])
+        metrics = self.client.metrics()
+        self.assertEqual(metrics['retries'], 1)
+        self.assertEqual(metrics['backoff_seconds'], 2.0)
+        self.assertEqual(metrics['breaker_state'], 'closed')
+
+    def test_file_attachment_is_streamed_and_rewound_for_retries(self):
+        import base64
+        import json
+        import os
+        import tempfile
+        content = os.urandom(200001)
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as handle:
+            handle.write(content)
+        self.addCleanup(os.unlink, handle.name)
+
+        sent = []
+
+        def post(url, data=None, **kwargs):
+            sent.append(b''.join(iter(lambda: data.read(8192), b'')))
+            self.assertEqual(len(data), len(sent[-1]))
+            return responses.pop(0)
+
+        body = {'choices': [{'message': {'content': 'ok'}}]}
+        responses = [fake_response(503), fake_response(body=body)]
+        payload = {'messages': [{'role': 'user', 'content': [{'type': 'file', 'file': {'file_data': FileDataURL(handle.name)}}]}]}
+        with mock.patch.object(self.client._session, 'post', side_effect=post):
+            self.assertEqual(self.client.complete(payload, title='T', read_timeout=5), body)
+
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sent[0], sent[1])
+        data_url = json.loads(sent[0])['messages'][0]['content'][0]['file']['file_data']
+        self.assertEqual(base64.b64decode(data_url.split(',', 1)[1]), content)
+
+    def test_streaming_body_matches_plain_json(self):
+        payload = {'text': 'Привет "quoted"', 'values': [1, None]}
+        self.assertEqual(StreamingJSONBody(payload).read(), json_bytes(payload))
+
+    def test_stream_yields_deltas(self):
+        lines = [
+            ': OPENROUTER PROCESSING', '',
+            'data: {"choices": [{"delta": {"role": "assistant"}}]}', '',
+            'data: {"choices": [{"delta": {"content": "{\\"a\\": "}}]}', '',
+            'data: {"choices": [{"delta": {"content": "\\"Иван\\"}"}}], "usage": {"total_tokens": 12}}', '',
+            'data: [DONE]', ''
+        ]
+        response = fake_response()
+        response.iter_lines.return_value = iter(lines)
+        with mock.patch.object(self.client._session, 'post', return_value=response) as post:
+            deltas = list(self.client.stream({'model': 'm'}, title='T', read_timeout=5))
+
+        self.assertEqual(''.join(deltas), '{"a": "Иван"}')
+        kwargs = post.call_args.kwargs
+        self.assertTrue(kwargs['stream'])
+        self.assertEqual(json.loads(kwargs['data'].read()), {'model': 'm', 'stream': True})
+        self.assertEqual(response.encoding, 'utf-8')
+        response.close.assert_called_once()
+
+    def test_stream_retries_before_first_chunk_and_raises_mid_stream_errors(self):
+        response = fake_response()
+        response.iter_lines.return_value = iter([
+            'data: {"choices": [{"delta": {"content": "{"}}]}', '',
+            'data: {"error": {"message": "overloaded"}}', ''
+        ])
+        with mock.patch.object(self.client._session, 'post', side_effect=[fake_response(503), response]):
+            stream = self.client.stream({}, title='T', read_timeout=5)
+            self.assertEqual(next(stream), '{')
+            with self.assertRaises(LLMError):
+                next(stream)
+        self.assertEqual(self.sleeps, [mock.ANY])
+
+    def test_breaker_opens_and_fails_fast(self):
+        with mock.patch.object(self.client._session, 'post', return_value=fake_response(503)) as post:
+            with self.assertRaises(LLMError):
+                self.client.complete({}, title='T', read_timeout=5)
+            with self.assertRaises(CircuitOpenError):
+                self.client.complete({}, title='T', read_timeout=5)
+
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(self.client.metrics()['breaker_state'], 'open')
+        self.assertEqual(self.client.metrics()['rejected_by_breaker'], 1)
+
+    def test_error_status_raises(self):
+        with mock.patch.object(self.client._session, 'post', return_value=fake_response(400, text='bad')):
+            with self.assertRaises(LLMError) as ctx:
+                self.client.complete({}, title='T', read_timeout=5)
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    def test_missing_choices_raises(self):
+        with mock.patch.object(self.client._session, 'post', return_value=fake_response(body={'choices': []})):
+            with self.assertRaises(LLMError):
+                self.client.chat([], title='T', read_timeout=5, model='m', max_tokens=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
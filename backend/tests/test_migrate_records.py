@@ -0,0 +1,68 @@
+import unittest
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import event
+
+import app as app_module
+import migrate_records
+
+
+class TestMigrateRecords(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.record = app_module.save_passport_record('legacy.pdf', {
+            'biographical_page': {'full_name': 'LEGACY OLD', 'passport_number': 'LG001'},
+            'pages': [{'page_number': 1}]
+        })
+
+    def tearDown(self):
+        app_module.delete_passport_record(self.record.id)
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        path = self.root / name
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        return path
+
+    def test_files_are_folded_into_the_database(self):
+        record_id = self.record.id
+        edited = self.write(f'passport_{record_id}.json', {
+            'record_id': record_id, 'biographical_page': {'full_name': 'LEGACY EDITED', 'passport_number': 'LG001'}
+        })
+        translated = self.write(f'passport_{record_id}_translated.json', {'biographical_page': {'full_name': 'ЛЕГАСИ'}})
+        orphan = self.write('passport_999999999.json', {})
+        self.write('notes.json', {})
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement.strip().upper())
+        event.listen(app_module.engine, 'before_cursor_execute', listener)
+        try:
+            summary = migrate_records.reconcile(self.root, dry_run=True)
+        finally:
+            event.remove(app_module.engine, 'before_cursor_execute', listener)
+        self.assertEqual((summary['files'], summary['updated'], summary['translations'], summary['orphans']), (3, 1, 1, 1))
+        # A dry run only reads, so it never holds the write lock
+        self.assertEqual([statement for statement in statements
+                          if statement != 'BEGIN' and not statement.startswith('SELECT')], [])
+        self.assertEqual(app_module.get_passport_record(record_id).full_name, 'LEGACY OLD')
+
+        summary = migrate_records.reconcile(self.root, remove_files=True)
+        self.assertEqual(summary['removed'], 2)
+        record = app_module.get_passport_record(record_id)
+        self.assertEqual(record.full_name, 'LEGACY EDITED')
+        self.assertEqual(record.data['pages'], [{'page_number': 1}])
+        self.assertNotIn('record_id', record.data)
+        self.assertEqual(app_module.load_translated_data(record_id), {'biographical_page': {'full_name': 'ЛЕГАСИ'}})
+        self.assertEqual(app_module.list_passport_records(q='legacy edited')['total'], 1)
+        self.assertFalse(edited.exists() or translated.exists())
+        self.assertTrue(orphan.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from mrz import check_digit, parse_td3, cross_check, check_passport_mrz
+
+# Specimen from ICAO Doc 9303 part 4
+LINE1 = 'P<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<<<<<<<<<'
+LINE2 = 'L898902C36UTO7408122F1204159ZE184226B<<<<<10'
+
+
+class TestTD3(unittest.TestCase):
+    def test_check_digit(self):
+        self.assertEqual(check_digit('L898902C3'), 6)
+        self.assertEqual(check_digit('740812'), 2)
+        self.assertEqual(check_digit('<<<<'), 0)
+
+    def test_parse_specimen(self):
+        fields = parse_td3(LINE1, LINE2)
+        self.assertTrue(fields['valid'], fields['errors'])
+        self.assertEqual(fields['surname'], 'ERIKSSON')
+        self.assertEqual(fields['given_names'], 'ANNA MARIA')
+        self.assertEqual(fields['passport_number'], 'L898902C3')
+        self.assertEqual(fields['nationality'], 'UTO')
+        self.assertEqual(fields['date_of_birth'], '12.08.1974')
+        self.assertEqual(fields['expiry_date'], '15.04.2012')
+        self.assertEqual(fields['sex'], 'F')
+
+    def test_tolerates_spaces_and_missing_fillers(self):
+        fields = parse_td3('P<UTOERIKSSON<<ANNA<MARIA', 'L898902C3 6UTO7408122F1204159ZE184226B<<<<<10')
+        self.assertTrue(fields['valid'], fields['errors'])
+
+    def test_misread_character_fails_check(self):
+        fields = parse_td3(LINE1, 'L898902C36UTO7408122F12O4159ZE184226B<<<<<10')
+        self.assertFalse(fields['valid'])
+        self.assertIn('expiry date check digit mismatch', fields['errors'])
+
+    def test_rejects_wrong_document(self):
+        self.assertFalse(parse_td3('I<UTO', LINE2)['valid'])
+        self.assertFalse(parse_td3(LINE1, LINE2 + 'XX')['valid'])
+
+    def test_cross_check(self):
+        fields = parse_td3(LINE1, LINE2)
+        bio = {
+            'full_name': 'ERIKSSON ANNA MARIA / ЭРИКССОН АННА',
+            'passport_number': 'L898902C3',
+            'date_of_birth': '12.08.1974',
+            'expiry_date': '2012-04-15',
+            'gender': 'F'
+        }
+        self.assertEqual(cross_check(fields, bio), [])
+        bio.update(passport_number='L898902C8', gender='M')
+        self.assertEqual(len(cross_check(fields, bio)), 2)
+
+    def test_missing_mrz(self):
+        result = check_passport_mrz({'biographical_page': {}})
+        self.assertFalse(result['present'])
+        self.assertFalse(result['valid'])
+        self.assertEqual(result['errors'], ['MRZ is missing'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from rate_limiter import RateLimiter, RateLimitTimeout, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from llm_client import estimate_tokens
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_disabled_limiter_never_waits(self):
+        limiter = RateLimiter()
+        self.assertFalse(limiter.enabled)
+        for _ in range(100):
+            self.assertEqual(limiter.acquire(10 ** 6), 0.0)
+
+    def test_token_budget_is_enforced(self):
+        limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=600)
+        limiter.acquire(600)
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(100, timeout=0.05)
+        # 600 tokens/minute refills 10 tokens per second
+        started = time.monotonic()
+        limiter.acquire(2)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_usage_correction_refunds_tokens(self):
+        now = [0.0]
+        limiter = RateLimiter(tokens_per_minute=1000, clock=lambda: now[0])
+        limiter.acquire(1000)
+        limiter.record_usage(estimated_tokens=1000, actual_tokens=200)
+        self.assertEqual(limiter.stats()['available_tokens'], 800)
+
+    def test_interactive_requests_overtake_bulk(self):
+        limiter = RateLimiter(requests_per_minute=600)
+        for _ in range(600):
+            limiter.acquire()
+
+        order = []
+
+        def worker(label, priority):
+            limiter.acquire(priority=priority)
+            order.append(label)
+
+        bulk = [threading.Thread(target=worker, args=(f'bulk{i}', PRIORITY_BULK)) for i in range(3)]
+        for thread in bulk:
+            thread.start()
+        while limiter.stats()['waiting'] < 3:
+            time.sleep(0.005)
+        interactive = threading.Thread(target=worker, args=('interactive', PRIORITY_INTERACTIVE))
+        interactive.start()
+
+        for thread in bulk + [interactive]:
+            thread.join(5)
+        self.assertEqual(len(order), 4)
+        self.assertLessEqual(order.index('interactive'), 1)
+
+    def test_estimate_tokens(self):
+        payload = {
+            'max_tokens': 100,
+            'messages': [
+                {'role': 'system', 'content': 'x' * 400},
+                {'role': 'user', 'content': [{'type': 'text', 'text': 'y' * 40}, {'type': 'file', 'file': {}}]}
+            ]
+        }
+        self.assertEqual(estimate_tokens(payload), 100 + 110 + 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import sys
+import json
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import record_export
+from record_export import RecordExporter, export_path, KIND_TRANSLATED
+
+
+class TestRecordExporter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_files_are_sharded(self):
+        self.assertEqual(export_path(self.root, 1234567), self.root / '01234' / 'passport_1234567.json')
+        self.assertEqual(export_path(self.root, 5, KIND_TRANSLATED).name, 'passport_5_translated.json')
+
+    def test_writes_latest_version_and_deletes(self):
+        exporter = RecordExporter(self.root)
+        release = threading.Event()
+        original = record_export.write_text_atomic
+        writes = []
+
+        def slow_write(path, content):
+            release.wait(5)
+            writes.append(json.loads(content))
+            original(path, content)
+
+        with mock.patch.object(record_export, 'write_text_atomic', side_effect=slow_write):
+            exporter.write(1, {'version': 0})
+            data = {'version': 1}
+            exporter.write(7, data)
+            data['version'] = 2  # serialized at submit time
+            exporter.write(7, {'version': 3})
+            release.set()
+            exporter.flush(timeout=5)
+
+        self.assertEqual(writes, [{'version': 0}, {'version': 3}])
+        self.assertEqual(json.loads(exporter.path(7).read_text(encoding='utf-8')), {'version': 3})
+
+        exporter.delete(7)
+        exporter.flush(timeout=5)
+        self.assertFalse(exporter.path(7).exists())
+        self.assertEqual(exporter.stats()['failed'], 0)
+
+    def test_disabled_exporter_writes_nothing(self):
+        exporter = RecordExporter(self.root, enabled=False)
+        exporter.write(1, {'a': 1})
+        exporter.flush()
+        self.assertEqual(list(self.root.iterdir()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from response_cache import ResponseCache, cache_key
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.now = [1000.0]
+        self.cache = ResponseCache(
+            Path(self.tmp.name) / 'cache.db', ttl_seconds=60, max_entries=10, clock=lambda: self.now[0]
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_ignores_dict_order(self):
+        self.assertEqual(cache_key('m', 'p', {'a': 1, 'b': 2}), cache_key('m', 'p', {'b': 2, 'a': 1}))
+        self.assertNotEqual(cache_key('m', 'p', {'a': 1}), cache_key('other', 'p', {'a': 1}))
+
+    def test_hit_and_miss_counters(self):
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.put('k', {'value': 'Россия'})
+        self.assertEqual(self.cache.get('k'), {'value': 'Россия'})
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_entries_expire(self):
+        self.cache.put('k', 1)
+        self.now[0] += 61
+        self.assertIsNone(self.cache.get('k'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for index in range(10):
+            self.now[0] += 1
+            self.cache.put(f'k{index}', index)
+        self.now[0] += 1
+        self.cache.get('k0')
+        self.now[0] += 1
+        self.cache.put('k10', 10)
+
+        self.assertEqual(self.cache.get('k0'), 0)
+        self.assertIsNone(self.cache.get('k1'))
+        self.assertLessEqual(self.cache.stats()['entries'], 10)
+
+    def test_persists_across_instances(self):
+        self.cache.put('k', [1, 2])
+        reopened = ResponseCache(Path(self.tmp.name) / 'cache.db', ttl_seconds=60, max_entries=10,
+                                 clock=lambda: self.now[0])
+        self.assertEqual(reopened.get('k'), [1, 2])
+
+    def test_disabled_cache(self):
+        cache = ResponseCache(Path(self.tmp.name) / 'off.db', max_entries=0)
+        cache.put('k', 1)
+        self.assertIsNone(cache.get('k'))
+        self.assertFalse((Path(self.tmp.name) / 'off.db').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
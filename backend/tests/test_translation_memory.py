@@ -0,0 +1,94 @@
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from translation_memory import TranslationMemory, collect_translatable, diff_translatable, normalize_date, translate_locally
+
+
+class TestLocalRules(unittest.TestCase):
+    def test_normalize_date(self):
+        self.assertEqual(normalize_date('2024/11/14'), '14.11.2024')
+        self.assertEqual(normalize_date('1-2-2030'), '01.02.2030')
+        self.assertIsNone(normalize_date('2024/13/14'))
+        self.assertIsNone(normalize_date('14 NOV 2024'))
+
+    def test_translate_locally(self):
+        self.assertEqual(translate_locally('2024-11-14'), '14.11.2024')
+        self.assertEqual(translate_locally('90 / 180'), '90 / 180')
+        self.assertEqual(translate_locally('УФМС РОССИИ'), 'УФМС РОССИИ')
+        self.assertIsNone(translate_locally('MOSCOW'))
+
+    def test_collect_skips_identifiers(self):
+        data = {
+            'mrz': {'mrz_line1': 'P<UTO'},
+            'pages': [{'page_number': 1}],
+            'biographical_page': {'passport_number': 'X1', 'place_of_birth': 'PARIS', 'empty': ' '},
+            'visas': [{'country': 'INDIA', 'mrz_line1': 'V<IND'}]
+        }
+        self.assertEqual(
+            list(collect_translatable(data)),
+            [(('biographical_page', 'place_of_birth'), 'PARIS'), (('visas', 0, 'country'), 'INDIA')]
+        )
+
+    def test_diff_reuses_unchanged_leaves(self):
+        old = {
+            'biographical_page': {'place_of_birth': 'PARIS', 'nationality': 'FRANCE'},
+            'visas': [{'country': 'INDIA', 'type': 'TOURIST'}, {'country': 'CHINA', 'type': 'BUSINESS'}]
+        }
+        translated = {
+            'biographical_page': {'place_of_birth': 'ПАРИЖ', 'nationality': 'ФРАНЦИЯ'},
+            'visas': [{'country': 'ИНДИЯ', 'type': 'ТУРИСТИЧЕСКАЯ'}, {'country': 'КИТАЙ', 'type': 'ДЕЛОВАЯ'}]
+        }
+        new = {
+            'biographical_page': {'place_of_birth': 'LYON', 'nationality': 'FRANCE'},
+            # First visa removed, the remaining one edited, a new one appended
+            'visas': [{'country': 'CHINA', 'type': 'STUDENT'}, {'country': 'NEPAL', 'type': 'TOURIST'}]
+        }
+        reused, changed = diff_translatable(new, old, translated)
+        self.assertEqual(changed, [
+            (('biographical_page', 'place_of_birth'), 'LYON'),
+            (('visas', 0, 'type'), 'STUDENT'),
+            (('visas', 1, 'country'), 'NEPAL')
+        ])
+        self.assertIn((('visas', 0, 'country'), 'КИТАЙ'), reused)
+        self.assertIn((('visas', 1, 'type'), 'ТУРИСТИЧЕСКАЯ'), reused)
+        self.assertIn((('biographical_page', 'nationality'), 'ФРАНЦИЯ'), reused)
+
+    def test_diff_matches_moved_list_elements(self):
+        old = {'stamps': [{'country': 'PERU'}, {'country': 'CHILE'}]}
+        translated = {'stamps': [{'country': 'ПЕРУ'}, {'country': 'ЧИЛИ'}]}
+        new = {'stamps': [{'country': 'BOLIVIA'}, {'country': 'PERU'}, {'country': 'CHILE'}]}
+        reused, changed = diff_translatable(new, old, translated)
+        self.assertEqual(changed, [(('stamps', 0, 'country'), 'BOLIVIA')])
+        self.assertEqual(reused, [(('stamps', 1, 'country'), 'ПЕРУ'), (('stamps', 2, 'country'), 'ЧИЛИ')])
+
+
+class TestTranslationMemory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.memory = TranslationMemory(Path(self.tmp.name) / 'tm.db', max_length=20)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lookup_is_case_and_space_insensitive(self):
+        self.memory.store_many({'Republic  of India': 'Республика Индия'})
+        found = self.memory.lookup_many(['REPUBLIC OF INDIA', 'Unknown'])
+        self.assertEqual(found, {'REPUBLIC OF INDIA': 'Республика Индия'})
+        self.assertEqual(self.memory.stats()['hits'], 1)
+        self.assertEqual(self.memory.stats()['misses'], 1)
+
+    def test_seeded_values(self):
+        self.assertEqual(self.memory.lookup_many(['Entry']), {'Entry': 'въезд'})
+
+    def test_long_values_are_not_remembered(self):
+        long_value = 'x' * 21
+        self.memory.store_many({long_value: 'y'})
+        self.assertEqual(self.memory.lookup_many([long_value]), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
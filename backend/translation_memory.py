@@ -0,0 +1,238 @@
+"""
+Field-level translation memory for passport values
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Identifiers and machine-readable values are never translated
+UNTRANSLATED_KEYS = {
+    'mrz_line1', 'mrz_line2', 'mrzLine1', 'mrzLine2',
+    'passport_number', 'documentNumber', 'visa_number',
+    'page_number', 'record_id'
+}
+UNTRANSLATED_SECTIONS = {'mrz', 'pages'}
+
+# Values that are safe to translate without asking the model
+SEED_TRANSLATIONS = {
+    'entry': 'въезд',
+    'exit': 'выезд',
+    'transit': 'транзит',
+    'm': 'М',
+    'f': 'Ж',
+    'male': 'мужской',
+    'female': 'женский'
+}
+
+LETTER_PATTERN = re.compile(r'[^\W\d_]')
+NON_CYRILLIC_LETTER_PATTERN = re.compile(r'[^\W\d_\u0400-\u04FF]')
+ISO_DATE_PATTERN = re.compile(r'^(\d{4})[./-](\d{1,2})[./-](\d{1,2})$')
+DMY_DATE_PATTERN = re.compile(r'^(\d{1,2})[./-](\d{1,2})[./-](\d{4})$')
+
+
+def normalize_source(value: str) -> str:
+    """Memory key for a source value: case- and whitespace-insensitive."""
+    return ' '.join(value.split()).casefold()
+
+
+def normalize_date(value: str) -> str | None:
+    """Rewrite purely numeric dates as DD.MM.YYYY, or return None."""
+    text = value.strip()
+    match = ISO_DATE_PATTERN.match(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = DMY_DATE_PATTERN.match(text)
+        if not match:
+            return None
+        day, month, year = match.groups()
+    if not (1 <= int(month) <= 12 and 1 <= int(day) <= 31):
+        return None
+    return f"{int(day):02d}.{int(month):02d}.{year}"
+
+
+def translate_locally(value: str) -> str | None:
+    """Translation that needs no model: numeric dates, codes, Cyrillic text."""
+    date = normalize_date(value)
+    if date:
+        return date
+    if not LETTER_PATTERN.search(value):
+        return value
+    if not NON_CYRILLIC_LETTER_PATTERN.search(value):
+        return value
+    return None
+
+
+def collect_translatable(data, path=()):
+    """Yield ``(path, value)`` for every string leaf that needs translation."""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in UNTRANSLATED_KEYS or (not path and key in UNTRANSLATED_SECTIONS):
+                continue
+            yield from collect_translatable(value, path + (key,))
+    elif isinstance(data, list):
+        for index, value in enumerate(data):
+            yield from collect_translatable(value, path + (index,))
+    elif isinstance(data, str) and data.strip():
+        yield path, data
+
+
+def diff_translatable(new, old, translated, path=()):
+    """Split the translatable leaves of ``new`` against a previous version.
+
+    ``translated`` is the translation of ``old``. Returns ``(reused,
+    changed)``: ``reused`` holds ``(path, translation)`` for leaves whose
+    source value is unchanged, ``changed`` holds ``(path, value)`` for leaves
+    that still need translating. List elements are matched by equality
+    first, so inserting or removing a visa keeps the other translations;
+    an element edited in place is diffed field by field.
+    """
+    reused, changed = [], []
+    _diff(new, old, translated, path, reused, changed)
+    return reused, changed
+
+
+def _diff(new, old, translated, path, reused, changed):
+    if isinstance(new, dict):
+        old = old if isinstance(old, dict) else {}
+        translated = translated if isinstance(translated, dict) else {}
+        for key, value in new.items():
+            if key in UNTRANSLATED_KEYS or (not path and key in UNTRANSLATED_SECTIONS):
+                continue
+            _diff(value, old.get(key), translated.get(key), path + (key,), reused, changed)
+    elif isinstance(new, list):
+        old = old if isinstance(old, list) else []
+        translated = translated if isinstance(translated, list) else []
+        usable = min(len(old), len(translated))
+        matches = {}
+        for index, item in enumerate(new):
+            match = next((j for j in range(usable) if j not in matches.values() and old[j] == item), None)
+            if match is not None:
+                matches[index] = match
+        # Elements edited in place pair with the unused element sharing most fields
+        for index, item in enumerate(new):
+            if index in matches:
+                continue
+            candidates = [j for j in range(usable) if j not in matches.values()]
+            best = max(candidates, key=lambda j: (_shared_fields(item, old[j]), -abs(j - index)), default=None)
+            if best is not None and _shared_fields(item, old[best]):
+                matches[index] = best
+        for index, item in enumerate(new):
+            match = matches.get(index)
+            if match is None:
+                _diff(item, None, None, path + (index,), reused, changed)
+            else:
+                _diff(item, old[match], translated[match], path + (index,), reused, changed)
+    elif isinstance(new, str) and new.strip():
+        if new == old and isinstance(translated, str):
+            reused.append((path, translated))
+        else:
+            changed.append((path, new))
+
+
+def _shared_fields(new, old) -> int:
+    if isinstance(new, dict) and isinstance(old, dict):
+        return sum(1 for key, value in new.items() if old.get(key) == value)
+    return 0
+
+
+def set_path(data, path, value):
+    target = data
+    for step in path[:-1]:
+        target = target[step]
+    target[path[-1]] = value
+
+
+class TranslationMemory:
+    """Persistent map of normalized source values to Russian renderings.
+
+    Only values up to ``max_length`` characters are remembered; long free
+    text (full OCR dumps, remarks) rarely repeats and is translated afresh.
+    """
+
+    def __init__(self, path: Path, max_length: int = 120, seed: dict = None):
+        self.path = Path(path)
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translation_memory ("
+            " source TEXT PRIMARY KEY,"
+            " target TEXT NOT NULL,"
+            " uses INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL)"
+        )
+        self.hits = 0
+        self.misses = 0
+        seed = SEED_TRANSLATIONS if seed is None else seed
+        if seed:
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO translation_memory (source, target, updated_at) VALUES (?, ?, ?)",
+                [(normalize_source(source), target, now) for source, target in seed.items()]
+            )
+
+    def remembers(self, value: str) -> bool:
+        return len(value) <= self.max_length
+
+    def lookup_many(self, values) -> dict:
+        """Return ``{value: translation}`` for the values already in memory."""
+        keys = {}
+        for value in values:
+            if self.remembers(value):
+                keys.setdefault(normalize_source(value), []).append(value)
+        found = {}
+        if not keys:
+            return found
+
+        with self._lock:
+            normalized = list(keys)
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(normalized), 500):
+                chunk = normalized[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT source, target FROM translation_memory WHERE source IN ({placeholders})", chunk
+                ).fetchall()
+                for source, target in rows:
+                    for value in keys[source]:
+                        found[value] = target
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE translation_memory SET uses = uses + 1 WHERE source = ?",
+                        [(source,) for source, _ in rows]
+                    )
+            remembered = sum(len(set(group)) for group in keys.values())
+            self.hits += len(found)
+            self.misses += remembered - len(found)
+        return found
+
+    def store_many(self, translations: dict):
+        """Remember ``{source value: translation}`` pairs."""
+        now = time.time()
+        rows = [
+            (normalize_source(source), target, now)
+            for source, target in translations.items()
+            if isinstance(target, str) and target.strip() and self.remembers(source)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO translation_memory (source, target, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET target = excluded.target, updated_at = excluded.updated_at",
+                rows
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translation_memory").fetchone()[0]
+            return {
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -245,6 +245,8 @@ function App() {
   const [loadingPassports, setLoadingPassports] = useState(false);
   const [isHistoryModalOpen, setIsHistoryModalOpen] = useState(false);
   const [pagination, setPagination] = useState({ page: 1, limit: 10, total: 0, pages: 0 });
+  // page number -> cursor that starts it; filled in as pages are visited
+  const [pageCursors, setPageCursors] = useState({});
 
   const [selectedPassportId, setSelectedPassportId] = useState(null);
   const [editJson, setEditJson] = useState('');
@@ -327,41 +329,56 @@ function App() {
     
     setProcessing(true);
     setQueueProgress({ current: 0, total: fileQueue.length });
-    
-    for (let i = 0; i < fileQueue.length; i++) {
-      const currentFile = fileQueue[i];
-      setQueueProgress({ current: i + 1, total: fileQueue.length });
-      setStatusMessage(`Обработка ${i + 1}/${fileQueue.length}: ${currentFile.name}`);
-      
-      const formData = new FormData();
-      formData.append('file', currentFile);
-      
-      try {
-        await axios.post(`${API_BASE_URL}/api/process`, formData, {
-          headers: { 'Content-Type': 'multipart/form-data' }
+    setStatusMessage(`Загрузка ${fileQueue.length} файлов...`);
+
+    // The server processes the batch in parallel; poll its aggregate progress
+    const formData = new FormData();
+    fileQueue.forEach((queuedFile) => formData.append('files', queuedFile));
+
+    try {
+      const response = await axios.post(`${API_BASE_URL}/api/batches`, formData, {
+        headers: { 'Content-Type': 'multipart/form-data' }
+      });
+      let batch = response.data;
+      while (!batch.finished) {
+        setQueueProgress({ current: batch.completed + batch.failed, total: batch.total });
+        setStatusMessage(`Обработано ${batch.completed + batch.failed}/${batch.total}`);
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const status = await axios.get(`${API_BASE_URL}${batch.status_url || `/api/batches/${batch.batch_id}`}`, {
+          params: { items: 0 }
         });
-      } catch (err) {
-        console.error(`Failed to process ${currentFile.name}:`, err);
+        batch = { ...status.data, status_url: batch.status_url };
       }
+      setStatusMessage(batch.failed > 0
+        ? `Готово: ${batch.completed}, ошибок: ${batch.failed}`
+        : 'Все файлы обработаны!');
+    } catch (err) {
+      console.error('Failed to process batch:', err);
+      setError(err.response?.data?.error || 'Failed to process batch');
+      setStatusMessage('');
     }
     
     setProcessing(false);
     setFileQueue([]);
     setQueueProgress({ current: 0, total: 0 });
-    setStatusMessage('Все файлы обработаны!');
     fetchPassports(1);
   };
 
   const fetchPassports = async (page = 1) => {
     try {
       setLoadingPassports(true);
-      const response = await axios.get(`${API_BASE_URL}/api/passports`, {
-        params: { page, limit: 10 }
-      });
+      const params = { page, limit: 10 };
+      if (searchQuery.trim()) params.q = searchQuery.trim();
+      if (page > 1 && pageCursors[page]) params.cursor = pageCursors[page];
+      const response = await axios.get(`${API_BASE_URL}/api/passports`, { params });
       
       // Handle new paginated response
       if (response.data.items) {
         setPassports(response.data.items);
+        setPageCursors((prev) => ({
+          ...(page === 1 ? {} : prev),
+          [page + 1]: response.data.next_cursor
+        }));
         setPagination({
           page: response.data.page,
           limit: response.data.limit,
@@ -397,7 +414,6 @@ function App() {
   };
 
   useEffect(() => {
-    fetchPassports(1);
     fetchTemplates();
   }, []);
 
@@ -461,18 +477,28 @@ function App() {
     }, 300);
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/process`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
+      // Sections are shown as soon as the model returns them
+      const partial = {};
+      const result = await streamUpload(formData, (event) => {
+        if (event.event === 'section') {
+          partial[event.section] = event.data;
+        } else if (event.event === 'item') {
+          const items = Array.isArray(partial[event.section]) ? partial[event.section] : [];
+          items[event.index] = event.data;
+          partial[event.section] = items;
+        } else {
+          return;
         }
+        setData(preparePreviewData({ ...partial }));
+        setStatusMessage('Извлечение данных...');
       });
 
       clearInterval(progressInterval);
       setUploadProgress(100);
       setStatusMessage('Готово!');
       
-      syncStateFromPayload(response.data);
-      setSelectedPassportId(response.data.record_id || null);
+      syncStateFromPayload(result);
+      setSelectedPassportId(result.record_id || null);
       setSaveStatus(null);
       fetchPassports(1);
       setDeleteStatus(null);
@@ -481,12 +507,43 @@ function App() {
       clearInterval(progressInterval);
       setUploadProgress(0);
       setStatusMessage('');
-      setError(err.response?.data?.error || 'Failed to process passport');
+      setError(err.response?.data?.error || err.message || 'Failed to process passport');
     } finally {
       setProcessing(false);
     }
   };
 
+  // POST to /api/process/stream and pass each NDJSON event to onEvent;
+  // resolves with the data of the final 'done' event
+  const streamUpload = async (formData, onEvent) => {
+    const response = await fetch(`${API_BASE_URL}/api/process/stream`, {
+      method: 'POST',
+      body: formData,
+    });
+    if (!response.ok || !response.body) {
+      const body = await response.json().catch(() => ({}));
+      throw new Error(body.error || 'Failed to process passport');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = done ? '' : lines.pop();
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const event = JSON.parse(line);
+        if (event.event === 'done') return event.data;
+        if (event.event === 'error') throw new Error(event.error);
+        onEvent(event);
+      }
+      if (done) throw new Error('Processing stream ended unexpectedly');
+    }
+  };
+
   const handleSelectPassport = async (recordId) => {
     setSelectedPassportId(recordId);
     setEditError(null);
@@ -703,16 +760,14 @@ function App() {
     setBatchDownloading(false);
   };
 
-  // Filter passports by search query
-  const filteredPassports = passports.filter((item) => {
-    if (!searchQuery.trim()) return true;
-    const q = searchQuery.toLowerCase();
-    return (
-      (item.full_name && item.full_name.toLowerCase().includes(q)) ||
-      (item.passport_number && item.passport_number.toLowerCase().includes(q)) ||
-      (item.filename && item.filename.toLowerCase().includes(q))
-    );
-  });
+  // Search runs on the server across all records; wait for typing to pause.
+  // Also loads the first page on mount.
+  useEffect(() => {
+    const timer = setTimeout(() => fetchPassports(1), searchQuery.trim() ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchQuery]);
+
+  const filteredPassports = passports;
 
   const handleDownloadJson = async (id, filename, e) => {
     e.stopPropagation();